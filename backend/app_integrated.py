@@ -3,6 +3,9 @@
 from flask import Flask, request, jsonify
 import sys, os
 import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 if CURRENT_DIR not in sys.path:
     sys.path.insert(0, CURRENT_DIR)
@@ -37,7 +40,23 @@ except Exception as _ie:
     multilingual_import_error = str(_ie)
     print(f"[Multilingual Import] Failed to import multilingual_chatbot module: {_ie}")
 from colab_style_predictor import colab_style_model
-from disease_detector import disease_detector
+from recommendation_cache import recommendation_cache
+from metrics import metrics
+from llm_gateway import llm_gateway
+from llm_backends import llm_available, configure as configure_llm, create_model, backend_name as llm_backend_name
+from translation_memory import translation_memory
+from crop_advice_catalogue import crop_advice_catalogue
+from similarity_cache import similarity_cache
+from language_detector import detect_language, detect_languages
+from sse import format_sse, sse_response, timed_chunks, gemini_text_chunks
+from disease_detector import disease_detector, extract_zip_images
+from image_hash_cache import image_hash_cache
+from leader_lease import lease_stats
+from rate_limiter import rate_limiter
+from single_flight import single_flight_stats
+
+# Check the disease model file's hash now; load and warm it off the request path
+disease_detector.start_background_warmup()
 
 # Initialize financial services and market data
 try:
@@ -162,21 +181,23 @@ def ping():
 multilingual_chatbot = None
 multilingual_chatbot_init_error = None
 if MultilingualAgriChatbot:
-    if GEMINI_API_KEY:
+    if llm_available(GEMINI_API_KEY):
         try:
             # Allow override of model via env MULTILINGUAL_GEMINI_MODEL else fallback inside component
             override_model = os.environ.get('MULTILINGUAL_GEMINI_MODEL')
             multilingual_chatbot = MultilingualAgriChatbot(GEMINI_API_KEY)
             if override_model and hasattr(multilingual_chatbot, 'model'):
                 try:
-                    import google.generativeai as _genai
-                    multilingual_chatbot.model = _genai.GenerativeModel(override_model)
+                    multilingual_chatbot.model = create_model(override_model)
                 except Exception as _me:
                     multilingual_chatbot_init_error = f"Model override failed: {_me}"
                     print(multilingual_chatbot_init_error)
         except Exception as _e:
             multilingual_chatbot_init_error = str(_e)
             print(f"Failed to init MultilingualAgriChatbot: {_e}")
+if multilingual_chatbot:
+    # Keep precomputed crop advice from going stale (see crop_advice_catalogue.py)
+    crop_advice_catalogue.start_background_refresh(multilingual_chatbot)
 
 
 # =============================================================================
@@ -204,7 +225,7 @@ YIELD_LANGUAGE_INSTRUCTIONS = {
 yield_recommendation_model = None
 yield_recommendation_error = None
 
-if GEMINI_API_KEY and genai:
+if llm_available(GEMINI_API_KEY):
     try:
         # Allow dedicated override to keep chatbot model independent if desired
         recommendation_model_name = (
@@ -212,8 +233,8 @@ if GEMINI_API_KEY and genai:
             or os.environ.get('MULTILINGUAL_GEMINI_MODEL')
             or 'gemini-2.0-flash-exp'
         )
-        genai.configure(api_key=GEMINI_API_KEY)
-        yield_recommendation_model = genai.GenerativeModel(recommendation_model_name)
+        configure_llm(GEMINI_API_KEY)
+        yield_recommendation_model = create_model(recommendation_model_name)
     except Exception as _rec_err:
         yield_recommendation_error = f"Failed to initialize Gemini recommendation model: {_rec_err}"
         print(yield_recommendation_error)
@@ -226,47 +247,41 @@ elif not genai:
 # =============================================================================
 # GEMINI YIELD VALIDATION SERVICE
 # =============================================================================
-def get_gemini_yield_prediction(crop_data: dict) -> dict:
+def _validation_inputs_text(crop_data: dict) -> str:
+    """Crop, environment and input block shared by the validation and combined prompts."""
+    return f"""Crop Information:
+- Crop: {crop_data.get('Crop', 'unknown')}
+- State: {crop_data.get('State Name', 'India')}
+- Season: {crop_data.get('Season', 'kharif')}
+- Area: {crop_data.get('Area', 1.0)} hectares
+
+Environmental Conditions:
+- Annual Rainfall: {crop_data.get('Annual_Rainfall', 800)} mm
+- Average Temperature: {crop_data.get('Temperature_C', 25)}°C
+- Humidity: {crop_data.get('Humidity_%', 65)}%
+- Soil pH: {crop_data.get('pH', 6.5)}
+
+Agricultural Inputs:
+- Fertilizer: {crop_data.get('Fertilizer', 50)} kg/hectare
+- Pesticide: {crop_data.get('Pesticide', 10)} kg/hectare"""
+
+
+def get_gemini_yield_prediction(crop_data: dict, timeout: float | None = None) -> dict:
     """
-    Get yield prediction from Gemini AI for cross-validation
+    Get yield prediction from Gemini AI for cross-validation.
+    ``timeout`` overrides the LLM gateway's default per-call deadline.
     """
     if not yield_recommendation_model:
         return None
     
     try:
-        # Extract relevant data
-        crop = crop_data.get('Crop', 'unknown')
-        state = crop_data.get('State Name', 'India')
-        season = crop_data.get('Season', 'kharif')
-        area = crop_data.get('Area', 1.0)
-        rainfall = crop_data.get('Annual_Rainfall', 800)
-        fertilizer = crop_data.get('Fertilizer', 50)
-        pesticide = crop_data.get('Pesticide', 10)
-        temperature = crop_data.get('Temperature_C', 25)
-        humidity = crop_data.get('Humidity_%', 65)
-        ph = crop_data.get('pH', 6.5)
-        
         # Create a detailed prompt for yield prediction
         prompt = f"""
 You are an expert agricultural scientist specializing in crop yield prediction for Indian agriculture.
 
 Based on the following crop and environmental data, predict the total yield in metric tons:
 
-Crop Information:
-- Crop: {crop}
-- State: {state}
-- Season: {season}
-- Area: {area} hectares
-
-Environmental Conditions:
-- Annual Rainfall: {rainfall} mm
-- Average Temperature: {temperature}°C
-- Humidity: {humidity}%
-- Soil pH: {ph}
-
-Agricultural Inputs:
-- Fertilizer: {fertilizer} kg/hectare
-- Pesticide: {pesticide} kg/hectare
+{_validation_inputs_text(crop_data)}
 
 Instructions:
 1. Consider the specific crop's typical yield for the given state and season
@@ -278,7 +293,7 @@ Instructions:
 Response format: Just return the number (e.g., "3.45")
 """
 
-        response = yield_recommendation_model.generate_content(prompt)
+        response = llm_gateway.generate(yield_recommendation_model, prompt, caller='yield_validation', timeout=timeout)
         
         if response and response.text:
             # Extract numerical value from response
@@ -580,6 +595,29 @@ def chat_with_bot():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/chatbot/chat/stream', methods=['POST'])
+@jwt_required()
+def chat_with_bot_stream():
+    """SSE variant of /api/chatbot/chat: `chunk` events, then `done` with the full response."""
+    user_id = get_jwt_identity()
+    data = request.get_json() or {}
+    message = data.get('message')
+    if not message:
+        return jsonify({'error': 'Message is required'}), 400
+
+    def events():
+        parts = []
+        try:
+            for text in timed_chunks('chatbot', crop_chatbot.chat_stream(message, user_id)):
+                parts.append(text)
+                yield format_sse({'text': text}, event='chunk')
+            yield format_sse({'success': True, 'response': ''.join(parts), 'timestamp': datetime.utcnow().isoformat()}, event='done')
+        except Exception as e:
+            yield format_sse({'error': str(e)}, event='error')
+
+    user_manager.update_user_activity(user_id, 'chatbot_interaction')
+    return sse_response(events())
+
 @app.route('/api/chatbot/recommendations', methods=['POST'])
 @jwt_required()
 def get_crop_recommendations():
@@ -645,6 +683,38 @@ if multilingual_chatbot and _create_ml_routes:
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 500
 
+    @app.route('/api/mchatbot/stream', methods=['POST','OPTIONS'])
+    def mchatbot_general_stream():
+        """SSE variant of /api/mchatbot: `chunk` events, then `done` with the cleaned response."""
+        if request.method == 'OPTIONS':
+            return ('',204)
+        data = request.get_json() or {}
+        query = data.get('query','')
+        user_lang = data.get('language','en')
+        if not query:
+            return jsonify({'error':'Query is required'}), 400
+        if user_lang == 'auto':
+            user_lang = multilingual_chatbot.detect_language(query)
+
+        def events():
+            parts = []
+            try:
+                for text in timed_chunks('mchatbot', multilingual_chatbot.generate_response_stream(query, user_lang)):
+                    parts.append(text)
+                    yield format_sse({'text': text}, event='chunk')
+                yield format_sse({
+                    'success': True,
+                    'response': multilingual_chatbot.clean_answer(''.join(parts)),
+                    'detected_language': user_lang,
+                    'original_query': query,
+                    'timestamp': datetime.now().isoformat(),
+                    'language_name': multilingual_chatbot.supported_languages.get(user_lang, 'English')
+                }, event='done')
+            except Exception as e:
+                yield format_sse({'success': False, 'error': str(e)}, event='error')
+
+        return sse_response(events())
+
     @app.route('/api/mchatbot/crop-advice', methods=['POST','OPTIONS'])
     def mchatbot_crop_advice():
         try:
@@ -687,6 +757,35 @@ if multilingual_chatbot and _create_ml_routes:
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
+    TRANSLATE_BATCH_MAX_TEXTS = int(os.environ.get('TRANSLATE_BATCH_MAX_TEXTS', 200))
+
+    @app.route('/api/mchatbot/translate/batch', methods=['POST','OPTIONS'])
+    def mchatbot_translate_batch():
+        """Translate a list of strings; memory hits skip Gemini, misses share batched calls."""
+        try:
+            if request.method == 'OPTIONS':
+                return ('',204)
+            data = request.get_json() or {}
+            texts = data.get('texts')
+            target_lang = data.get('target_language','en')
+            source_lang = data.get('source_language','auto')
+            if not isinstance(texts, list) or not texts:
+                return jsonify({'error':'texts must be a non-empty list'}), 400
+            if len(texts) > TRANSLATE_BATCH_MAX_TEXTS:
+                return jsonify({'error': f'At most {TRANSLATE_BATCH_MAX_TEXTS} texts per request'}), 400
+            texts = ['' if t is None else str(t) for t in texts]
+            result = multilingual_chatbot.translate_batch(texts, target_lang, source_lang)
+            return jsonify({
+                'success': True,
+                'translations': result['translations'],
+                'target_language': target_lang,
+                'source_language': source_lang,
+                'cache_hits': result['cache_hits'],
+                'llm_calls': result['llm_calls']
+            })
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+
     @app.route('/api/mchatbot/integrated-advice', methods=['POST','OPTIONS'])
     def mchatbot_integrated_advice():
         try:
@@ -715,7 +814,8 @@ if multilingual_chatbot and _create_ml_routes:
                 prediction = {'success': False, 'error': f'Prediction error: {_pe}'}
             advice_query = f"I am growing {crop} in {state}. Provide practical advice to improve yield." if crop else data.get('query','Agricultural advice please')
             advice_lang = user_lang if user_lang != 'auto' else multilingual_chatbot.detect_language(advice_query)
-            advice = multilingual_chatbot.generate_response(advice_query, advice_lang)
+            # Templated per crop/state; near-duplicate matching would mix up crops
+            advice = multilingual_chatbot.generate_response(advice_query, advice_lang, use_cache=False)
             return jsonify({'success': True, 'advice': advice, 'prediction': prediction, 'language': advice_lang})
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 500
@@ -726,6 +826,27 @@ else:
             return ('',204)
         return jsonify({'success': False, 'error': 'Multilingual chatbot disabled (missing GEMINI_API_KEY or dependency).', 'init_error': multilingual_chatbot_init_error}), 503
 
+DETECT_LANGUAGE_MAX_TEXTS = int(os.environ.get('DETECT_LANGUAGE_MAX_TEXTS', 1000))
+
+# Script-based detection is local, so it works even when the chatbot is disabled
+@app.route('/api/mchatbot/detect-language', methods=['POST','OPTIONS'])
+def mchatbot_detect_language():
+    """Classify ``text`` or a ``texts`` list (e.g. forum posts) by dominant script."""
+    if request.method == 'OPTIONS':
+        return ('',204)
+    data = request.get_json() or {}
+    texts = data.get('texts')
+    if texts is None:
+        text = data.get('text')
+        if not text:
+            return jsonify({'success': False, 'error': 'text or texts is required'}), 400
+        return jsonify({'success': True, 'language': detect_language(str(text))})
+    if not isinstance(texts, list):
+        return jsonify({'success': False, 'error': 'texts must be a list'}), 400
+    if len(texts) > DETECT_LANGUAGE_MAX_TEXTS:
+        return jsonify({'success': False, 'error': f'At most {DETECT_LANGUAGE_MAX_TEXTS} texts per request'}), 400
+    return jsonify({'success': True, 'languages': detect_languages(['' if t is None else str(t) for t in texts])})
+
 # Unified status route (available regardless of initialization success)
 @app.route('/api/mchatbot/status', methods=['GET'])
 def mchatbot_status():
@@ -789,19 +910,40 @@ def predict_crop_yield():
     return jsonify(result)
 
 # Backward compatibility alias and public endpoint
-@app.route('/api/predict-yield', methods=['POST','OPTIONS'])
-def predict_crop_yield_public():
-    if request.method == 'OPTIONS':
-        return ('',204)
-    data = request.get_json() or {}
-    payload = _map_frontend_to_colab(data)
-    
-    # Get ML model prediction
-    ml_result = colab_style_model.predict(payload)
-    
-    # Get Gemini prediction for validation
-    gemini_result = get_gemini_yield_prediction(payload)
-    
+# ML prediction, Gemini validation and Gemini recommendations run as concurrent
+# branches under a per-request deadline; the ML result is returned as soon as it
+# is ready even if the LLM branches overrun.
+PREDICT_DEADLINE_SECONDS = float(os.environ.get('PREDICT_DEADLINE_SECONDS', 12))
+# 'split': separate validation + recommendation calls; 'combined': one structured call
+# (falls back to 'split' when the reply fails strict parsing). Overridable per request via "llm_mode".
+YIELD_LLM_MODE = os.environ.get('YIELD_LLM_MODE', 'split').lower()
+_prediction_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('PREDICT_EXECUTOR_WORKERS', 8)),
+    thread_name_prefix='predict-branch'
+)
+
+
+def _timed_branch(fn, *args):
+    """Run one prediction branch, capturing its outcome and wall time."""
+    started = time.perf_counter()
+    try:
+        value = fn(*args)
+        return {'status': 'ok', 'value': value, 'ms': round((time.perf_counter() - started) * 1000, 1)}
+    except Exception as e:
+        return {'status': 'error', 'error': str(e), 'ms': round((time.perf_counter() - started) * 1000, 1)}
+
+
+def _branch_outcome(future, deadline: float) -> dict:
+    """Wait for a branch until the request deadline; report timeout if it overruns."""
+    if future is None:
+        return {'status': 'skipped'}
+    try:
+        return future.result(timeout=max(0.0, deadline - time.perf_counter()))
+    except FuturesTimeoutError:
+        return {'status': 'timeout'}
+
+
+def _apply_gemini_validation(ml_result: dict, gemini_result: dict | None) -> dict:
     # Validation logic: compare predictions and decide which to use
     final_result = ml_result.copy()  # Start with ML result
     
@@ -849,24 +991,116 @@ def predict_crop_yield_public():
         final_result['validation_applied'] = False
         if ml_result.get('method') == 'statistical_fallback':
             print(f"[Prediction Validation] Using statistical fallback")
-        
-    # Use the final result for language processing
-    result = final_result
+    return final_result
+
+
+@app.route('/api/predict-yield', methods=['POST','OPTIONS'])
+def predict_crop_yield_public():
+    if request.method == 'OPTIONS':
+        return ('',204)
+    started = time.perf_counter()
+    deadline = started + PREDICT_DEADLINE_SECONDS
+    data = request.get_json() or {}
+    payload = _map_frontend_to_colab(data)
 
     language = _normalize_language_code(data.get('language') or request.args.get('language'))
     print(f"[Predict Endpoint] Raw language from request: {data.get('language')}")
     print(f"[Predict Endpoint] Normalized language: {language}")
     merged_payload = {**payload, **data}
 
+    llm_mode = str(data.get('llm_mode') or YIELD_LLM_MODE).lower()
+    if llm_mode not in ('split', 'combined'):
+        llm_mode = 'split'
+    llm_mode_fallback = None
+    combined_branch = None
+
+    # Gemini validation starts alongside the ML model; it does not depend on it.
+    # In combined mode it is part of the single call made after the ML result.
+    gemini_future = None
+    if yield_recommendation_model and llm_mode != 'combined':
+        gemini_future = _prediction_executor.submit(_timed_branch, get_gemini_yield_prediction, payload, PREDICT_DEADLINE_SECONDS)
+    ml_branch = _timed_branch(colab_style_model.predict, payload)
+    ml_result = ml_branch.get('value') or {'success': False, 'error': ml_branch.get('error', 'Prediction failed')}
+
+    rec_future = None
+    recommendations_basis = None
+    gemini_branch = None
+    rec_branch = None
+    if yield_recommendation_model and llm_mode == 'combined':
+        if ml_result.get('success'):
+            combined_branch = _timed_branch(
+                _generate_combined_yield_llm, ml_result, payload, merged_payload, language,
+                max(0.5, deadline - time.perf_counter())
+            )
+            if combined_branch['status'] == 'ok':
+                validation, recommendations = combined_branch['value']
+                gemini_branch = {'status': 'ok', 'value': validation, 'ms': combined_branch['ms']}
+                rec_branch = {'status': 'ok', 'value': recommendations, 'ms': combined_branch['ms']}
+                recommendations_basis = 'machine_learning'
+            else:
+                llm_mode_fallback = combined_branch.get('error')
+                print(f"[Predict Endpoint] Combined LLM call failed, using two-call flow: {llm_mode_fallback}")
+        else:
+            llm_mode_fallback = 'ml_prediction_failed'
+        if gemini_branch is None:
+            llm_mode = 'split'
+            gemini_future = _prediction_executor.submit(
+                _timed_branch, get_gemini_yield_prediction, payload, max(0.5, deadline - time.perf_counter())
+            )
+
+    # Recommendations start as soon as there is a prediction to describe. With a
+    # successful ML result they run concurrently with validation (and therefore
+    # describe the ML yield); otherwise they wait for the Gemini fallback.
+    if yield_recommendation_model and rec_branch is None:
+        if ml_result.get('success'):
+            recommendations_basis = 'machine_learning'
+            rec_future = _prediction_executor.submit(
+                _timed_branch, _generate_yield_recommendations, ml_result, merged_payload, language,
+                max(0.5, deadline - time.perf_counter())
+            )
+        else:
+            gemini_branch = _branch_outcome(gemini_future, deadline)
+            gemini_value = gemini_branch.get('value')
+            if gemini_value and gemini_value.get('success'):
+                recommendations_basis = 'gemini_ai'
+                rec_future = _prediction_executor.submit(
+                    _timed_branch, _generate_yield_recommendations, gemini_value, merged_payload, language,
+                    max(0.5, deadline - time.perf_counter())
+                )
+
+    if gemini_branch is None:
+        gemini_branch = _branch_outcome(gemini_future, deadline)
+    if rec_branch is None:
+        rec_branch = _branch_outcome(rec_future, deadline)
+
+    # Use the final result for language processing
+    result = _apply_gemini_validation(ml_result, gemini_branch.get('value'))
+
+    # Validation replaced the ML yield, so recommendations written for it would
+    # contradict the yield shown; redo them for the final one (or drop them).
+    if (yield_recommendation_model and result.get('prediction_source') == 'gemini_ai'
+            and recommendations_basis != 'gemini_ai' and rec_branch['status'] != 'skipped'):
+        print("[Predict Endpoint] Yield replaced by validation, regenerating recommendations")
+        recommendations_basis = 'gemini_ai'
+        remaining = deadline - time.perf_counter()
+        if remaining > 0:
+            rec_branch = _branch_outcome(_prediction_executor.submit(
+                _timed_branch, _generate_yield_recommendations, result, merged_payload, language, remaining
+            ), deadline)
+        else:
+            rec_branch = {'status': 'timeout'}
+
     if result.get('success'):
         if yield_recommendation_model:
-            try:
-                recommendations, _ = _generate_yield_recommendations(result, merged_payload, language)
+            if rec_branch['status'] == 'ok':
+                recommendations, _ = rec_branch['value']
                 result['ai_recommendations'] = recommendations
-                result['ai_recommendations_language'] = language
-            except Exception as rec_err:
-                result['ai_recommendations_error'] = str(rec_err)
-                result['ai_recommendations_language'] = language
+                result['ai_recommendations_basis'] = recommendations_basis
+            elif rec_branch['status'] == 'timeout':
+                result['ai_recommendations_error'] = f'Recommendations exceeded the {PREDICT_DEADLINE_SECONDS:g}s deadline.'
+            else:
+                result['ai_recommendations_error'] = rec_branch.get('error') or 'Recommendations unavailable.'
+            result['ai_recommendations_language'] = language
         elif yield_recommendation_error:
             result['ai_recommendations_error'] = yield_recommendation_error
             result['ai_recommendations_language'] = language
@@ -874,10 +1108,60 @@ def predict_crop_yield_public():
         result['ai_recommendations_error'] = result.get('error') or 'Prediction failed; recommendations skipped.'
 
     result['selected_language'] = language
+    if yield_recommendation_model:
+        result['llm_mode'] = llm_mode
+        if llm_mode_fallback:
+            result['llm_mode_fallback'] = llm_mode_fallback
+    result['timings'] = {
+        'deadline_ms': round(PREDICT_DEADLINE_SECONDS * 1000, 1),
+        'total_ms': round((time.perf_counter() - started) * 1000, 1),
+        'branches': {
+            name: {k: v for k, v in branch.items() if k in ('status', 'ms', 'error')}
+            for name, branch in (
+                ('ml_prediction', ml_branch),
+                ('gemini_validation', gemini_branch),
+                ('ai_recommendations', rec_branch),
+                ('combined_llm', combined_branch or {'status': 'skipped'})
+            )
+        }
+    }
     print(f"[Prediction Response] Final prediction_source: {result.get('prediction_source')}")
     print(f"[Prediction Response] Final predicted_yield: {result.get('predicted_yield')}")
     return jsonify(result)
 
+@app.route('/api/predict-yield/stream', methods=['POST','OPTIONS'])
+def predict_crop_yield_stream():
+    """SSE variant of /api/predict-yield.
+
+    Emits `prediction` with the ML result right away, then the recommendation
+    step as `chunk` events and a final `done` event carrying the parsed JSON.
+    """
+    if request.method == 'OPTIONS':
+        return ('',204)
+    data = request.get_json() or {}
+    payload = _map_frontend_to_colab(data)
+    language = _normalize_language_code(data.get('language') or request.args.get('language'))
+    merged_payload = {**payload, **data}
+
+    def events():
+        result = colab_style_model.predict(payload)
+        if result.get('success'):
+            result['prediction_source'] = result.get('prediction_source', 'machine_learning')
+        result['selected_language'] = language
+        yield format_sse(result, event='prediction')
+        if not result.get('success'):
+            yield format_sse({'error': result.get('error') or 'Prediction failed; recommendations skipped.'}, event='error')
+            return
+        if not yield_recommendation_model:
+            yield format_sse({'error': yield_recommendation_error or 'Gemini recommendation model unavailable.'}, event='error')
+            return
+        try:
+            yield from _stream_yield_recommendations(result, merged_payload, language)
+        except Exception as rec_err:
+            yield format_sse({'error': str(rec_err)}, event='error')
+
+    return sse_response(events())
+
 # Training endpoint for the new model
 @app.route('/api/train-model', methods=['POST'])
 def train_colab_model():
@@ -890,6 +1174,37 @@ def train_colab_model():
     meta = colab_style_model.get_meta()
     return jsonify({'success': ok, 'meta': meta, 'cap_target': colab_style_model.CAP_TARGET})
 
+# Incremental (warm-start) refresh when new seasons of yield rows arrive
+@app.route('/api/train-model/incremental', methods=['POST'])
+def train_colab_model_incremental():
+    """Add trees fitted on new rows (multipart `file` CSV or COLAB_INCREMENTAL_YIELD_PATH)."""
+    import tempfile
+    tmp_path = None
+    try:
+        if 'file' in request.files:
+            fd, tmp_path = tempfile.mkstemp(suffix='.csv')
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write(request.files['file'].read())
+            new_yield_path = tmp_path
+        else:
+            new_yield_path = os.environ.get('COLAB_INCREMENTAL_YIELD_PATH')
+        if not new_yield_path:
+            return jsonify({'success': False, 'error': 'Upload a CSV as `file` or set COLAB_INCREMENTAL_YIELD_PATH.'}), 400
+        n_trees = request.args.get('n_trees', type=int)
+        recent_years = request.args.get('recent_years', type=int)
+        result = colab_style_model.train_incremental(new_yield_path, n_trees=n_trees, recent_years=recent_years)
+        result['meta'] = colab_style_model.get_meta()
+        return jsonify(result), (200 if result.get('success') else 400)
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+@app.route('/api/train-model/retire', methods=['POST'])
+def retire_colab_tree_batches():
+    """Apply the tree retirement schedule without adding new trees."""
+    retired = colab_style_model.retire_tree_batches()
+    return jsonify({'success': True, 'retired': retired, 'meta': colab_style_model.get_meta()})
+
 # Public deployment setup endpoint (no auth required for initial setup)
 @app.route('/api/setup-model', methods=['GET', 'POST'])
 def setup_deployment_model():
@@ -1003,6 +1318,45 @@ def _conditions_text(conditions: dict) -> str:
     ])
 
 
+YIELD_RECOMMENDATION_SCHEMA = """{
+    "yield_assessment": "...",
+    "fertilizer_recommendations": {
+        "optimal_npk": "...",
+        "application_schedule": "...",
+        "organic_options": "...",
+        "micronutrients": "..."
+    },
+    "irrigation_recommendations": {
+        "frequency": "...",
+        "critical_stages": "...",
+        "methods": "...",
+        "water_management": "..."
+    },
+    "planting_recommendations": {
+        "optimal_dates": "...",
+        "variety_selection": "...",
+        "spacing": "...",
+        "soil_prep": "..."
+    },
+    "improvement_potential": {
+        "expected_increase": "...",
+        "timeline": "...",
+        "priority_actions": "...",
+        "investment_needed": "..."
+    },
+    "cost_benefit": {
+        "roi_estimate": "...",
+        "payback_period": "...",
+        "risk_factors": "..."
+    }
+}"""
+# Top-level keys a recommendation object must have (combined-mode validation)
+YIELD_RECOMMENDATION_KEYS = (
+    'yield_assessment', 'fertilizer_recommendations', 'irrigation_recommendations',
+    'planting_recommendations', 'improvement_potential', 'cost_benefit'
+)
+
+
 def _extract_json_from_text(text: str) -> dict:
     if not text:
         raise ValueError('Empty response from Gemini.')
@@ -1014,10 +1368,13 @@ def _extract_json_from_text(text: str) -> dict:
     return json.loads(snippet)
 
 
-def _generate_yield_recommendations(prediction: dict, original_payload: dict, language_code: str) -> dict:
-    if not yield_recommendation_model:
-        raise RuntimeError(yield_recommendation_error or 'Gemini recommendation model unavailable.')
+def _build_yield_recommendation_prompt(prediction: dict, original_payload: dict, language_code: str,
+                                      combined: bool = False) -> tuple[str, str]:
+    """Return (prompt, cache_key) for the recommendation request.
 
+    With ``combined`` the prompt also asks for the cross-check yield (see
+    ``_generate_combined_yield_llm``); the cache key is the same in both modes.
+    """
     language_code = _normalize_language_code(language_code)
     language_name = YIELD_LANGUAGE_NAMES.get(language_code, 'English')
     language_instruction = YIELD_LANGUAGE_INSTRUCTIONS.get(language_code, 'English')
@@ -1038,6 +1395,33 @@ def _generate_yield_recommendations(prediction: dict, original_payload: dict, la
     conditions = _current_conditions_from_payload(original_payload)
     conditions_text = _conditions_text(conditions)
 
+    cache_key = recommendation_cache.build_key(
+        crop, predicted_yield, yield_category, confidence_lower, confidence_upper,
+        conditions, language_code, getattr(yield_recommendation_model, 'model_name', None)
+    )
+
+    if combined:
+        # Single call: independent cross-check yield plus the recommendation JSON
+        output_format = f"""CROSS-CHECK INPUTS (for an independent yield estimate):
+{_validation_inputs_text(original_payload)}
+
+Before writing recommendations, independently estimate the total yield in metric tons from the
+cross-check inputs above, considering the crop's typical yield for the state and season, the
+environmental conditions and the fertilizer/pesticide usage. Do not simply copy the predicted yield.
+
+Format your response strictly as JSON with exactly two top-level keys:
+{{
+    "validation": {{"predicted_yield": <number>}},
+    "recommendations": {YIELD_RECOMMENDATION_SCHEMA}
+}}
+
+Return ONLY valid JSON with no extra text. "predicted_yield" must be a plain number. Ensure every recommendation value is in the specified language: {language_instruction}. Avoid exceeding length guidance."""
+    else:
+        output_format = f"""Format your response strictly as JSON with these exact keys:
+{YIELD_RECOMMENDATION_SCHEMA}
+
+Return ONLY valid JSON with no extra text. Ensure every value is in the specified language: {language_instruction}. Avoid exceeding length guidance."""
+
     prompt = f"""
 You are an expert agricultural scientist specializing in crop yield optimization. Analyze the following crop prediction and provide specific, actionable recommendations.
 
@@ -1089,47 +1473,111 @@ Please provide comprehensive recommendations in the following priority areas:
 
 Also provide a cost-benefit summary, including ROI estimate, payback period, and potential risks. Keep estimates very short.
 
-Format your response strictly as JSON with these exact keys:
-{{
-    "yield_assessment": "...",
-    "fertilizer_recommendations": {{
-        "optimal_npk": "...",
-        "application_schedule": "...",
-        "organic_options": "...",
-        "micronutrients": "..."
-    }},
-    "irrigation_recommendations": {{
-        "frequency": "...",
-        "critical_stages": "...",
-        "methods": "...",
-        "water_management": "..."
-    }},
-    "planting_recommendations": {{
-        "optimal_dates": "...",
-        "variety_selection": "...",
-        "spacing": "...",
-        "soil_prep": "..."
-    }},
-    "improvement_potential": {{
-        "expected_increase": "...",
-        "timeline": "...",
-        "priority_actions": "...",
-        "investment_needed": "..."
-    }},
-    "cost_benefit": {{
-        "roi_estimate": "...",
-        "payback_period": "...",
-        "risk_factors": "..."
-    }}
-}}
-
-Return ONLY valid JSON with no extra text. Ensure every value is in the specified language: {language_instruction}. Avoid exceeding length guidance.
+{output_format}
 """
 
-    response = yield_recommendation_model.generate_content(prompt)
+    return prompt, cache_key
+
+
+def _generate_yield_recommendations(prediction: dict, original_payload: dict, language_code: str,
+                                    timeout: float | None = None) -> tuple[dict, str]:
+    """Return (parsed recommendations, raw model text) for ``prediction``.
+
+    Results are served from ``recommendation_cache`` when the same prompt was
+    answered before; ``timeout`` bounds the Gemini call.
+    """
+    if not yield_recommendation_model:
+        raise RuntimeError(yield_recommendation_error or 'Gemini recommendation model unavailable.')
+
+    prompt, cache_key = _build_yield_recommendation_prompt(prediction, original_payload, language_code)
+    cached = recommendation_cache.get(cache_key)
+    if cached:
+        return cached['recommendations'], cached['raw_text']
+
+    response = llm_gateway.generate(yield_recommendation_model, prompt, caller='yield_recommendations', timeout=timeout)
     raw_text = response.text.strip() if hasattr(response, 'text') else ''
     parsed = _extract_json_from_text(raw_text)
+    recommendation_cache.set(cache_key, parsed, raw_text, _normalize_language_code(language_code))
     return parsed, raw_text
+
+
+def _parse_combined_response(raw_text: str) -> tuple[float, dict]:
+    """Strictly validate the combined-mode reply; any deviation raises ValueError."""
+    try:
+        data = json.loads(raw_text)
+    except json.JSONDecodeError:
+        # Tolerate a code fence or stray prose around an otherwise valid object
+        data = _extract_json_from_text(raw_text)
+    if not isinstance(data, dict) or set(data) != {'validation', 'recommendations'}:
+        raise ValueError('Combined reply must have exactly "validation" and "recommendations".')
+    validation = data['validation']
+    predicted = validation.get('predicted_yield') if isinstance(validation, dict) else None
+    if isinstance(predicted, bool) or not isinstance(predicted, (int, float)) or not math.isfinite(predicted) or predicted <= 0:
+        raise ValueError(f'Invalid validation.predicted_yield: {predicted!r}')
+    recommendations = data['recommendations']
+    if not isinstance(recommendations, dict):
+        raise ValueError('"recommendations" must be an object.')
+    missing = [key for key in YIELD_RECOMMENDATION_KEYS if key not in recommendations]
+    if missing:
+        raise ValueError(f'Recommendations missing keys: {", ".join(missing)}')
+    return float(predicted), recommendations
+
+
+def _generate_combined_yield_llm(prediction: dict, colab_payload: dict, original_payload: dict,
+                                 language_code: str, timeout: float | None = None):
+    """One Gemini call for both the cross-check yield and the recommendation JSON.
+
+    Returns ``(validation_result, (recommendations, raw_text))`` shaped like
+    ``get_gemini_yield_prediction`` / ``_generate_yield_recommendations``.
+    Raises ValueError when the reply does not match the schema so callers can
+    fall back to the two-call flow.
+    """
+    if not yield_recommendation_model:
+        raise RuntimeError(yield_recommendation_error or 'Gemini recommendation model unavailable.')
+
+    prompt, cache_key = _build_yield_recommendation_prompt(prediction, original_payload, language_code, combined=True)
+    cached = recommendation_cache.get(cache_key)
+    if cached:
+        # Recommendations already known; only the cross-check call is needed
+        return get_gemini_yield_prediction(colab_payload, timeout), (cached['recommendations'], cached['raw_text'])
+
+    response = llm_gateway.generate(
+        yield_recommendation_model, prompt, caller='yield_combined', timeout=timeout,
+        generation_config={'response_mime_type': 'application/json'}
+    )
+    raw_text = response.text.strip() if hasattr(response, 'text') else ''
+    validation_yield, recommendations = _parse_combined_response(raw_text)
+    rec_text = json.dumps(recommendations, ensure_ascii=False)
+    recommendation_cache.set(cache_key, recommendations, rec_text, _normalize_language_code(language_code))
+    validation = {
+        'success': True,
+        'predicted_yield': validation_yield,
+        'method': 'gemini_ai',
+        'raw_response': str(validation_yield)
+    }
+    return validation, (recommendations, rec_text)
+
+
+def _stream_yield_recommendations(prediction: dict, original_payload: dict, language_code: str):
+    """SSE events for the recommendation step: text chunks, then the parsed JSON."""
+    language_code = _normalize_language_code(language_code)
+    prompt, cache_key = _build_yield_recommendation_prompt(prediction, original_payload, language_code)
+    cached = recommendation_cache.get(cache_key)
+    if cached:
+        yield format_sse({'ai_recommendations': cached['recommendations'], 'ai_recommendations_language': language_code, 'cached': True}, event='done')
+        return
+    parts = []
+    for text in timed_chunks('recommendations', gemini_text_chunks(llm_gateway.generate_stream(yield_recommendation_model, prompt, caller='yield_recommendations'))):
+        parts.append(text)
+        yield format_sse({'text': text}, event='chunk')
+    raw_text = ''.join(parts).strip()
+    try:
+        parsed = _extract_json_from_text(raw_text)
+    except ValueError as parse_err:
+        yield format_sse({'error': f'Invalid recommendation JSON: {parse_err}'}, event='error')
+        return
+    recommendation_cache.set(cache_key, parsed, raw_text, language_code)
+    yield format_sse({'ai_recommendations': parsed, 'ai_recommendations_language': language_code, 'cached': False}, event='done')
 def _map_frontend_to_colab(d: dict) -> dict:
     mapping = {
         'crop_type': 'Crop',
@@ -1204,11 +1652,50 @@ def detect_plant_disease():
         if detection.get('success'):
             user_manager.update_user_activity(user_id, 'disease_detection')
         
-        status_code = 200 if detection.get('success') else 400
+        if detection.get('success'):
+            status_code = 200
+        else:
+            # Missing / unverified model is a service problem, not a bad image
+            status_code = 503 if 'model_status' in detection else 400
         return jsonify(detection), status_code
     except Exception as e:
         return jsonify({'error': f'Disease detection failed: {str(e)}'}), 500
 
+DISEASE_BATCH_MAX_IMAGES = int(os.environ.get('DISEASE_BATCH_MAX_IMAGES', 64))
+DISEASE_BATCH_MAX_ZIP_MB = int(os.environ.get('DISEASE_BATCH_MAX_ZIP_MB', 200))
+
+@app.route('/api/detect-disease/batch', methods=['POST'])
+@jwt_required()
+def detect_plant_disease_batch():
+    """Diagnose many leaf images of one plot (multipart ``images``, a zip, or base64 list in JSON)."""
+    try:
+        user_id = get_jwt_identity()
+        images = []
+        for upload in request.files.getlist('images') + request.files.getlist('image'):
+            images.append((upload.filename or f'image_{len(images) + 1}', upload.read()))
+        for upload in request.files.getlist('archive') + request.files.getlist('zip'):
+            images.extend(extract_zip_images(upload.read(), DISEASE_BATCH_MAX_IMAGES, DISEASE_BATCH_MAX_ZIP_MB * 1024 * 1024))
+        if not request.files:
+            data = request.get_json(silent=True) or {}
+            images = [(f'image_{i + 1}', img) for i, img in enumerate(data.get('images') or []) if img]
+
+        if not images:
+            return jsonify({'error': 'Images are required (multipart "images", a zip as "archive", or base64 list in JSON).'}), 400
+        if len(images) > DISEASE_BATCH_MAX_IMAGES:
+            return jsonify({'error': f'At most {DISEASE_BATCH_MAX_IMAGES} images per request'}), 400
+
+        detection = disease_detector.predict_disease_batch(images)
+        if detection.get('success'):
+            user_manager.update_user_activity(user_id, 'disease_detection')
+            status_code = 200
+        else:
+            status_code = 503 if 'model_status' in detection else 400
+        return jsonify(detection), status_code
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Batch disease detection failed: {str(e)}'}), 500
+
 @app.route('/api/financial/roi', methods=['POST'])
 @jwt_required()
 def calculate_return_on_investment():
@@ -1573,15 +2060,38 @@ def search_forum_posts():
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
+    disease_model = disease_detector.health()
     return jsonify({
-        'status': 'healthy',
+        'status': 'healthy' if disease_model['state'] != 'unavailable' else 'degraded',
         'timestamp': datetime.now().isoformat(),
         'services': {
             'database': 'connected',
             'auth': 'active',
             'weather': 'active',
-            'chatbot': 'active' if crop_chatbot.model else 'fallback_mode'
-        }
+            'chatbot': 'active' if crop_chatbot.model else 'fallback_mode',
+            'disease_detection': disease_model['state']
+        },
+        'disease_model': disease_model
+    })
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_snapshot():
+    """Per-process counters and latency summaries (cache hit rates, LLM timings)."""
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'recommendation_cache': recommendation_cache.stats(),
+        'llm_backend': llm_backend_name(),
+        'llm_gateway': llm_gateway.stats(),
+        'translation_memory': translation_memory.stats(),
+        'crop_advice_catalogue': crop_advice_catalogue.stats(),
+        'similarity_cache': similarity_cache.stats(),
+        'disease_model': disease_detector.stats(),
+        'image_hash_cache': image_hash_cache.stats(),
+        'leader_leases': lease_stats(),
+        'rate_limiter': rate_limiter.stats(),
+        'single_flight': single_flight_stats(),
+        'metrics': metrics.snapshot()
     })
 
 @app.route('/', methods=['GET'])
@@ -0,0 +1,166 @@
+"""Compare the Keras and TFLite (fp16 / int8) disease model backends.
+
+Each backend runs in its own subprocess, so peak RSS and import cost are not
+shared. Against a held-out folder laid out as ``<dir>/<class_name>/*.jpg``
+(the ``CLASS_NAMES`` labels, PlantVillage style), it reports:
+
+- top-1 accuracy, and top-1 agreement with the Keras backend;
+- load time (import + model load) and peak RSS;
+- single-image latency p50/p95 and batch-of-8 throughput.
+
+Usage (from backend/, after download_plant_model.py and convert_disease_model.py):
+
+    python benchmarks/disease_backends.py --holdout ../data/holdout [--backends keras,tflite-fp16,tflite-int8] [--json report.json]
+
+Without ``--holdout``, synthetic leaf images are used (latency and RSS only).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import statistics
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def _load_holdout(folder, class_names, limit):
+    samples = []
+    for label, class_name in enumerate(class_names):
+        class_dir = os.path.join(folder, class_name)
+        if not os.path.isdir(class_dir):
+            continue
+        files = sorted(f for f in os.listdir(class_dir) if f.lower().endswith(IMAGE_EXTENSIONS))[:limit]
+        for name in files:
+            with open(os.path.join(class_dir, name), 'rb') as fh:
+                samples.append((fh.read(), label))
+    return samples
+
+
+def _synthetic(count):
+    import io
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    samples = []
+    for _ in range(count):
+        pixels = np.stack([rng.integers(20, 90, (480, 640)), rng.integers(110, 200, (480, 640)),
+                           rng.integers(20, 80, (480, 640))], axis=-1).astype(np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format='JPEG', quality=90)
+        samples.append((buffer.getvalue(), None))
+    return samples
+
+
+def _peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def worker(spec, holdout, limit, repeats):
+    """Run one backend in this process and return its measurements."""
+    backend, _, variant = spec.partition('-')
+    os.environ['DISEASE_MODEL_BACKEND'] = backend
+    os.environ['DISEASE_TFLITE_VARIANT'] = variant or 'fp16'
+    os.environ['DISEASE_BATCH_MAX_SIZE'] = '1'
+    import numpy as np
+
+    started = time.perf_counter()
+    from disease_detector import DiseaseDetector, CLASS_NAMES
+    detector = DiseaseDetector(policy='resident')
+    if not detector.load_model():
+        return {'backend': spec, 'error': detector.load_error}
+    load_ms = (time.perf_counter() - started) * 1000
+
+    samples = _load_holdout(holdout, CLASS_NAMES, limit) if holdout else _synthetic(16)
+    arrays = np.stack([detector.preprocess_image(data)[0][0] for data, _ in samples]).astype(np.float32)
+    detector.predict_scores(arrays[:1])  # warmup
+
+    latencies = []
+    for _ in range(repeats):
+        for row in arrays:
+            t0 = time.perf_counter()
+            detector.predict_scores(row[None])
+            latencies.append((time.perf_counter() - t0) * 1000)
+    batched_started = time.perf_counter()
+    predictions = [int(np.argmax(scores)) for start in range(0, len(arrays), 8)
+                   for scores in detector.predict_scores(arrays[start:start + 8])]
+    batch8_ms = (time.perf_counter() - batched_started) * 1000
+
+    labels = [label for _, label in samples]
+    labelled = [(p, l) for p, l in zip(predictions, labels) if l is not None]
+    latencies.sort()
+    return {
+        'backend': spec,
+        'runtime': detector.stats()['runtime'],
+        'model_path': detector.model_path,
+        'model_mb': round(os.path.getsize(detector.model_path) / 1e6, 2),
+        'load_ms': round(load_ms, 1),
+        'peak_rss_mb': _peak_rss_mb(),
+        'images': len(samples),
+        'top1_accuracy': round(sum(p == l for p, l in labelled) / len(labelled), 4) if labelled else None,
+        'latency_ms_p50': round(statistics.median(latencies), 2),
+        'latency_ms_p95': round(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 2),
+        'batch8_images_per_s': round(len(arrays) / (batch8_ms / 1000), 1),
+        'predictions': predictions
+    }
+
+
+def run(backends, holdout, limit, repeats):
+    rows = []
+    for spec in backends:
+        command = [sys.executable, os.path.abspath(__file__), '--worker', spec, '--limit', str(limit), '--repeats', str(repeats)]
+        if holdout:
+            command += ['--holdout', holdout]
+        completed = subprocess.run(command, capture_output=True, text=True, cwd=BACKEND_DIR)
+        lines = [line for line in completed.stdout.splitlines() if line.startswith('{')]
+        rows.append(json.loads(lines[-1]) if lines else {'backend': spec, 'error': completed.stderr[-500:]})
+
+    reference = next((r for r in rows if r['backend'] == 'keras' and 'predictions' in r), None)
+    for row in rows:
+        if reference and 'predictions' in row:
+            agree = sum(a == b for a, b in zip(row['predictions'], reference['predictions']))
+            row['agreement_with_keras'] = round(agree / len(reference['predictions']), 4)
+        row.pop('predictions', None)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--holdout', help='Folder with one sub-folder of images per class name')
+    parser.add_argument('--backends', default='keras,tflite-fp16,tflite-int8')
+    parser.add_argument('--limit', type=int, default=50, help='Images per class')
+    parser.add_argument('--repeats', type=int, default=1, help='Single-image latency passes')
+    parser.add_argument('--json', help='Write the report to this file')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(worker(args.worker, args.holdout, args.limit, args.repeats)))
+        return 0
+
+    rows = run([b.strip() for b in args.backends.split(',') if b.strip()], args.holdout, args.limit, args.repeats)
+    columns = ['model_mb', 'load_ms', 'peak_rss_mb', 'top1_accuracy', 'agreement_with_keras',
+               'latency_ms_p50', 'latency_ms_p95', 'batch8_images_per_s']
+    print(f"{'backend':<14}" + ''.join(f'{c:>22}' for c in columns))
+    for row in rows:
+        if 'error' in row:
+            print(f"{row['backend']:<14}  error: {row['error']}")
+            continue
+        print(f"{row['backend']:<14}" + ''.join(f"{row.get(c)!s:>22}" for c in columns))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as fh:
+            json.dump(rows, fh, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,312 @@
+"""Accuracy and per-stage latency of ``DiseaseDetector`` over a labelled image folder.
+
+The folder is laid out as ``<dir>/<class_name>/*.jpg`` with the ``CLASS_NAMES``
+labels (PlantVillage style). Each backend runs in its own subprocess and
+reports:
+
+- top-1 / top-3 accuracy, per-class top-1 and a confusion matrix by plant type
+  (plus how many images the plant-likelihood check would have rejected);
+- per-image latency of each stage (decode, resize, likelihood, inference,
+  postprocess) at batch sizes 1, 8 and 32, and images/s;
+- load time and peak RSS (VmHWM).
+
+Backends: ``keras``, ``tflite-fp16``, ``tflite-int8``, ``remote`` (a running
+``disease_inference_server.py``). A ``+batched`` suffix sends each batch as
+concurrent single-image requests through the micro-batcher, like parallel API
+calls, instead of one ``predict_scores`` call.
+
+Usage (from backend/):
+
+    python benchmarks/disease_benchmark.py --data ../data/holdout [--backends keras,tflite-int8,keras+batched] [--json report.json]
+
+Accuracy regression check (exit code 1 if top-1/top-3 drop by more than
+``--max-drop`` against a previous ``--json`` report, or if a backend with
+accuracy in that report fails, is not run or reports no accuracy):
+
+    python benchmarks/disease_benchmark.py --data ../data/holdout --baseline main.json
+
+Without ``--data``, synthetic leaf images are used (latency and RSS only).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import statistics
+import subprocess
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+BATCH_SIZES = (1, 8, 32)
+STAGES = ('decode', 'resize', 'likelihood', 'inference', 'postprocess')
+
+
+def _load_dataset(folder, class_names, limit):
+    from disease_detector import IMAGE_EXTENSIONS
+
+    samples = []
+    for label, class_name in enumerate(class_names):
+        class_dir = os.path.join(folder, class_name)
+        if not os.path.isdir(class_dir):
+            continue
+        files = sorted(f for f in os.listdir(class_dir) if f.lower().endswith(IMAGE_EXTENSIONS))[:limit]
+        for name in files:
+            with open(os.path.join(class_dir, name), 'rb') as fh:
+                samples.append((fh.read(), label))
+    return samples
+
+
+def _synthetic(count):
+    import io
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    samples = []
+    for _ in range(count):
+        pixels = np.stack([rng.integers(20, 90, (768, 1024)), rng.integers(110, 200, (768, 1024)),
+                           rng.integers(20, 80, (768, 1024))], axis=-1).astype(np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format='JPEG', quality=90)
+        samples.append((buffer.getvalue(), None))
+    return samples
+
+
+def _peak_rss_mb():
+    # VmHWM is per process; Linux ru_maxrss carries over the parent's peak into the child
+    try:
+        with open('/proc/self/status', encoding='ascii') as fh:
+            for line in fh:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _plant(class_name):
+    return class_name.split('___')[0].replace('_', ' ')
+
+
+def _accuracy(all_scores, labels, class_names):
+    import numpy as np
+
+    labelled = [(scores, label) for scores, label in zip(all_scores, labels) if label is not None]
+    if not labelled:
+        return {}
+    top1, top3 = Counter(), Counter()
+    per_class = defaultdict(lambda: [0, 0])
+    confusion = defaultdict(Counter)
+    for scores, label in labelled:
+        ranked = np.argsort(scores)[::-1]
+        top1[int(ranked[0]) == label] += 1
+        top3[label in ranked[:3]] += 1
+        per_class[class_names[label]][0] += int(ranked[0]) == label
+        per_class[class_names[label]][1] += 1
+        confusion[_plant(class_names[label])][_plant(class_names[int(ranked[0])])] += 1
+    total = len(labelled)
+    return {
+        'top1_accuracy': round(top1[True] / total, 4),
+        'top3_accuracy': round(top3[True] / total, 4),
+        'per_class_top1': {name: round(hit / count, 4) for name, (hit, count) in sorted(per_class.items())},
+        'confusion_by_plant': {true: dict(row) for true, row in sorted(confusion.items())}
+    }
+
+
+def worker(spec, data, limit, repeats):
+    """Run one backend in this process and return its measurements."""
+    backend, batched, _ = spec.partition('+')
+    backend, _, variant = backend.partition('-')
+    os.environ['DISEASE_MODEL_BACKEND'] = backend
+    os.environ['DISEASE_TFLITE_VARIANT'] = variant or 'fp16'
+    os.environ['DISEASE_BATCH_MAX_SIZE'] = str(max(BATCH_SIZES)) if batched else '1'
+    os.environ['DISEASE_BATCH_MAX_QUEUE'] = str(max(BATCH_SIZES) * 4)
+    os.environ['IMAGE_HASH_CACHE_ENABLED'] = 'false'  # every image must reach the model
+    import numpy as np
+
+    started = time.perf_counter()
+    from disease_detector import DiseaseDetector, CLASS_NAMES, MIN_PLANT_LIKELIHOOD
+    detector = DiseaseDetector(policy='resident')
+    if not detector.warmup():
+        return {'backend': spec, 'error': detector.load_error}
+    load_ms = (time.perf_counter() - started) * 1000
+
+    samples = _load_dataset(data, CLASS_NAMES, limit) if data else _synthetic(32)
+    if not samples:
+        return {'backend': spec, 'error': f'no images under {data}/<class_name>/'}
+    pool = ThreadPoolExecutor(max_workers=max(BATCH_SIZES)) if batched else None
+
+    def infer(arrays):
+        if pool is None:
+            return detector.predict_scores(arrays)
+        # Concurrent single-image requests, coalesced by the micro-batcher
+        return np.concatenate(list(pool.map(lambda row: detector.predict_scores(row[None]), arrays)))
+
+    latency, scores_bs1 = {}, None
+    for batch_size in BATCH_SIZES:
+        per_image = {stage: [] for stage in STAGES}
+        batch_ms, all_scores = [], []
+        for _ in range(repeats):
+            all_scores = []
+            for start in range(0, len(samples), batch_size):
+                chunk = samples[start:start + batch_size]
+                arrays, likelihoods = [], []
+                for data_bytes, _ in chunk:
+                    t0 = time.perf_counter()
+                    image = detector.decode_image(data_bytes)
+                    t1 = time.perf_counter()
+                    pixels = detector.resize_image(image)
+                    t2 = time.perf_counter()
+                    likelihoods.append(detector._estimate_plant_likelihood(pixels))
+                    t3 = time.perf_counter()
+                    per_image['decode'].append((t1 - t0) * 1000)
+                    per_image['resize'].append((t2 - t1) * 1000)
+                    per_image['likelihood'].append((t3 - t2) * 1000)
+                    arrays.append(pixels)
+                batch = np.stack(arrays).astype(np.float32)
+                batch *= 1.0 / 255
+                t0 = time.perf_counter()
+                scores = infer(batch)
+                elapsed = (time.perf_counter() - t0) * 1000
+                batch_ms.append(elapsed)
+                per_image['inference'].extend([elapsed / len(chunk)] * len(chunk))
+                for row, plant_likelihood in zip(scores, likelihoods):
+                    t0 = time.perf_counter()
+                    detector._build_result(row, plant_likelihood)
+                    per_image['postprocess'].append((time.perf_counter() - t0) * 1000)
+                all_scores.extend(scores)
+        if scores_bs1 is None:
+            scores_bs1 = all_scores
+        row = {stage: round(statistics.median(values), 3) for stage, values in per_image.items()}
+        row['total'] = round(sum(row[stage] for stage in STAGES), 3)
+        row['batch_inference_ms_p50'] = round(statistics.median(batch_ms), 2)
+        row['images_per_s'] = round(1000 / row['total'], 1) if row['total'] else None
+        latency[str(batch_size)] = row
+
+    rejected = 0
+    for data_bytes, _ in samples:
+        rejected += detector._estimate_plant_likelihood(detector.resize_image(detector.decode_image(data_bytes))) < MIN_PLANT_LIKELIHOOD
+    stats = detector.stats()
+    return {
+        'backend': spec,
+        'runtime': stats['runtime'],
+        'model_version': detector.model_version(),
+        'images': len(samples),
+        'load_ms': round(load_ms, 1),
+        'peak_rss_mb': _peak_rss_mb(),
+        'rejected_as_non_plant': int(rejected),
+        **_accuracy(scores_bs1, [label for _, label in samples], CLASS_NAMES),
+        'latency_ms_per_image': latency,
+        'avg_batch_size': (stats['batching'] or {}).get('avg_batch_size')
+    }
+
+
+def run(backends, data, limit, repeats):
+    rows = []
+    for spec in backends:
+        command = [sys.executable, os.path.abspath(__file__), '--worker', spec,
+                   '--limit', str(limit), '--repeats', str(repeats)]
+        if data:
+            command += ['--data', data]
+        completed = subprocess.run(command, capture_output=True, text=True, cwd=BACKEND_DIR)
+        lines = [line for line in completed.stdout.splitlines() if line.startswith('{')]
+        rows.append(json.loads(lines[-1]) if lines else {'backend': spec, 'error': completed.stderr[-500:]})
+    return rows
+
+
+def regressions(rows, baseline_rows, max_drop):
+    """Messages for every baseline backend whose top-1/top-3 fell more than ``max_drop``.
+
+    A baseline backend that is missing from ``rows``, failed, or reports no
+    accuracy for a metric the baseline has counts as a regression too.
+    """
+    current = {row['backend']: row for row in rows}
+    found = []
+    for previous in baseline_rows:
+        backend = previous['backend']
+        checked = [m for m in ('top1_accuracy', 'top3_accuracy') if previous.get(m) is not None]
+        if not checked:
+            continue
+        row = current.get(backend)
+        if row is None:
+            found.append(f"{backend}: in the baseline but not run")
+            continue
+        if 'error' in row:
+            error = str(row['error'] or '').strip()
+            found.append(f"{backend}: failed ({error.splitlines()[-1] if error else 'no output'})")
+            continue
+        for metric in checked:
+            if row.get(metric) is None:
+                found.append(f"{backend}: no {metric} (was {previous[metric]})")
+            elif row[metric] < previous[metric] - max_drop:
+                found.append(f"{backend}: {metric} {previous[metric]} -> {row[metric]}")
+    return found
+
+
+def _print_report(rows):
+    print(f"{'backend':<18}{'images':>8}{'top1':>8}{'top3':>8}{'non-plant':>11}{'load_ms':>10}{'peak_rss_mb':>13}  runtime")
+    for row in rows:
+        if 'error' in row:
+            print(f"{row['backend']:<18}  error: {row['error']}")
+            continue
+        print(f"{row['backend']:<18}{row['images']:>8}{row.get('top1_accuracy')!s:>8}{row.get('top3_accuracy')!s:>8}"
+              f"{row['rejected_as_non_plant']:>11}{row['load_ms']:>10}{row['peak_rss_mb']:>13}  {row['runtime']}")
+
+    columns = (*STAGES, 'total', 'batch_inference_ms_p50', 'images_per_s')
+    print(f"\n{'ms per image (p50)':<18}{'batch':>6}" + ''.join(f'{c:>{len(c) + 2}}' for c in columns))
+    for row in rows:
+        for batch_size, latency in row.get('latency_ms_per_image', {}).items():
+            print(f"{row['backend']:<18}{batch_size:>6}" + ''.join(f'{latency[c]!s:>{len(c) + 2}}' for c in columns))
+
+    for row in rows:
+        confusion = row.get('confusion_by_plant')
+        if not confusion:
+            continue
+        predicted = sorted({p for counts in confusion.values() for p in counts})
+        width = max(len(p) for p in [*predicted, *confusion]) + 2
+        print(f"\nConfusion by plant type, {row['backend']} (rows: true, columns: predicted)")
+        print(' ' * width + ''.join(f'{p[:width - 2]:>{width}}' for p in predicted))
+        for true, counts in confusion.items():
+            print(f'{true:<{width}}' + ''.join(f'{counts.get(p, 0):>{width}}' for p in predicted))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--data', help='Folder with one sub-folder of images per class name')
+    parser.add_argument('--backends', default='keras,tflite-fp16,tflite-int8,keras+batched')
+    parser.add_argument('--limit', type=int, default=50, help='Images per class')
+    parser.add_argument('--repeats', type=int, default=1, help='Timing passes per batch size')
+    parser.add_argument('--json', help='Write the report to this file')
+    parser.add_argument('--baseline', help='Previous --json report to check accuracy against')
+    parser.add_argument('--max-drop', type=float, default=0.01, help='Allowed top-1/top-3 drop vs --baseline')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(worker(args.worker, args.data, args.limit, args.repeats)))
+        return 0
+
+    rows = run([b.strip() for b in args.backends.split(',') if b.strip()], args.data, args.limit, args.repeats)
+    _print_report(rows)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as fh:
+            json.dump(rows, fh, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as fh:
+            found = regressions(rows, json.load(fh), args.max_drop)
+        for message in found:
+            print(f"❌ accuracy regression: {message}")
+        if found:
+            return 1
+        print("✅ no accuracy regression against the baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""Cold vs warm latency of DiseaseDetector.predict_disease under both model policies.
+
+- ``unload``: every request loads the .h5 file, traces the graph and releases it.
+- ``resident``: one warmup (load + dummy batch), then requests only run the
+  forward pass. The first request without warmup is reported separately.
+
+Usage (from backend/, needs TensorFlow and model/plant_disease_model.h5):
+
+    python benchmarks/disease_cold_warm.py --requests 20 [--json report.json]
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def _leaf_image(seed: int = 0) -> bytes:
+    """A green, noisy 640x480 JPEG that passes the plant-likelihood check."""
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    pixels = np.empty((480, 640, 3), dtype=np.uint8)
+    pixels[..., 0] = rng.integers(20, 90, (480, 640))
+    pixels[..., 1] = rng.integers(110, 200, (480, 640))
+    pixels[..., 2] = rng.integers(20, 80, (480, 640))
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def _summary(values):
+    ordered = sorted(values)
+    return {
+        'n': len(ordered),
+        'p50_ms': round(statistics.median(ordered), 1),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 1),
+        'mean_ms': round(statistics.fmean(ordered), 1)
+    }
+
+
+def _timed(detector, image) -> float:
+    started = time.perf_counter()
+    result = detector.predict_disease(image)
+    elapsed = (time.perf_counter() - started) * 1000
+    if not result.get('success'):
+        raise SystemExit(f"prediction failed: {result.get('error')}")
+    return elapsed
+
+
+def run(requests: int) -> dict:
+    from disease_detector import DiseaseDetector
+
+    image = _leaf_image()
+    report = {}
+
+    unload = DiseaseDetector(policy='unload')
+    report['unload'] = _summary([_timed(unload, image) for _ in range(requests)])
+
+    first = DiseaseDetector(policy='resident')
+    report['resident_first_request_ms'] = round(_timed(first, image), 1)
+    first.unload_model()
+
+    resident = DiseaseDetector(policy='resident')
+    started = time.perf_counter()
+    if not resident.warmup():
+        raise SystemExit(f'warmup failed: {resident.load_error}')
+    report['resident_warmup_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    report['resident_warm'] = _summary([_timed(resident, image) for _ in range(requests)])
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--requests', type=int, default=20, help='Requests per policy')
+    parser.add_argument('--json', help='Write the report to this file')
+    args = parser.parse_args(argv)
+
+    report = run(args.requests)
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as fh:
+            json.dump(report, fh, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
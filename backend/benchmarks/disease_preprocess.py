@@ -0,0 +1,165 @@
+"""Per-image decode/preprocess time and peak memory: legacy vs current pipeline.
+
+The legacy pipeline decodes at full resolution, runs the plant-likelihood check
+on int32 copies of the full image and normalises to float64. The current one
+(``DiseaseDetector.preprocess_image``) uses JPEG draft decoding, checks the
+downscaled uint8 pixels and emits float32.
+
+Each (pipeline, image) pair runs in its own subprocess. Peak memory is reported
+two ways:
+- ``tracemalloc`` peak (Python and numpy allocations);
+- growth of the process's peak RSS over the post-import baseline (this also
+  covers Pillow's decode buffers).
+
+Usage (from backend/; only Pillow and numpy are needed):
+
+    python benchmarks/disease_preprocess.py [--repeats 10] [--json report.json]
+"""
+import io
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import resource
+import statistics
+import tempfile
+import subprocess
+import tracemalloc
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+# name -> (width, height, format)
+IMAGES = {
+    'phone_12mp_jpeg': (4000, 3000, 'JPEG'),
+    'photo_3mp_jpeg': (2000, 1500, 'JPEG'),
+    'screenshot_2mp_png': (1600, 1200, 'PNG'),
+}
+
+
+def _make_image(width, height, fmt) -> bytes:
+    import numpy as np
+    from PIL import Image
+
+    # Smooth gradients plus noise compress like a real leaf photo, unlike pure noise
+    rng = np.random.default_rng(1)
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([40 + 40 * np.sin(x / 97), 130 + 50 * np.cos(y / 83), 40 + 30 * np.sin((x + y) / 151)], axis=-1)
+    pixels = np.clip(base + rng.normal(0, 8, base.shape), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format=fmt, **({'quality': 90} if fmt == 'JPEG' else {}))
+    return buffer.getvalue()
+
+
+def legacy_preprocess(image_data):
+    """The pre-optimisation pipeline, kept here for comparison."""
+    import numpy as np
+    from PIL import Image
+
+    image_bytes = image_data if isinstance(image_data, bytes) else base64.b64decode(image_data)
+    image = Image.open(io.BytesIO(image_bytes))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    np_img = np.array(image)
+    r = np_img[:, :, 0].astype(np.int32)
+    g = np_img[:, :, 1].astype(np.int32)
+    b = np_img[:, :, 2].astype(np.int32)
+    plant_likelihood = float(((g > r + 5) & (g > b + 5) & (g > 60)).mean())
+    image_array = np.array(image.resize((224, 224))) / 255.0
+    return np.expand_dims(image_array, axis=0), plant_likelihood
+
+
+def _rss_mb():
+    """Peak RSS of this process in MB."""
+    # VmHWM resets on exec; Linux ru_maxrss carries over the parent's peak into the child
+    try:
+        with open('/proc/self/status', encoding='ascii') as fh:
+            for line in fh:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def worker(pipeline, image_path, repeats):
+    os.environ.setdefault('DISEASE_MODEL_BACKEND', 'tflite')  # keep TensorFlow out of the measurement
+    import numpy as np  # noqa: F401  (imported before the RSS baseline)
+    from PIL import Image  # noqa: F401
+    from disease_detector import DiseaseDetector
+
+    with open(image_path, 'rb') as fh:
+        data = fh.read()
+    preprocess = legacy_preprocess if pipeline == 'legacy' else DiseaseDetector(policy='unload').preprocess_image
+    baseline_rss = _rss_mb()
+
+    tracemalloc.start()
+    array, likelihood = preprocess(data)
+    traced_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    rss_growth = _rss_mb() - baseline_rss
+
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        preprocess(data)
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        'pipeline': pipeline,
+        'image': os.path.splitext(os.path.basename(image_path))[0],
+        'input_kb': round(len(data) / 1024),
+        'ms_p50': round(statistics.median(timings), 1),
+        'ms_min': round(min(timings), 1),
+        'tracemalloc_peak_mb': round(traced_peak / 1e6, 1),
+        'rss_growth_mb': round(rss_growth, 1),
+        'output_dtype': str(array.dtype),
+        'plant_likelihood': round(likelihood, 3)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--json', help='Write the report to this file')
+    parser.add_argument('--worker', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(worker(args.worker[0], args.worker[1], args.repeats)))
+        return 0
+
+    rows = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for image_name, spec in IMAGES.items():
+            # Generated here so the workers' peak RSS only reflects preprocessing
+            image_path = os.path.join(workdir, image_name)
+            with open(image_path, 'wb') as fh:
+                fh.write(_make_image(*spec))
+            for pipeline in ('legacy', 'current'):
+                completed = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--worker', pipeline, image_path, '--repeats', str(args.repeats)],
+                    capture_output=True, text=True, cwd=BACKEND_DIR
+                )
+                lines = [line for line in completed.stdout.splitlines() if line.startswith('{')]
+                rows.append(json.loads(lines[-1]) if lines else {'pipeline': pipeline, 'image': image_name,
+                                                                 'error': completed.stderr[-500:]})
+
+    columns = ['input_kb', 'ms_p50', 'tracemalloc_peak_mb', 'rss_growth_mb', 'output_dtype', 'plant_likelihood']
+    print(f"{'image':<20}{'pipeline':<10}" + ''.join(f'{c:>21}' for c in columns))
+    for row in rows:
+        if 'error' in row:
+            print(f"{row['image']:<20}{row['pipeline']:<10}  error: {row['error']}")
+            continue
+        print(f"{row['image']:<20}{row['pipeline']:<10}" + ''.join(f'{row[c]!s:>21}' for c in columns))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as fh:
+            json.dump(rows, fh, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""Closed-loop load test for the prediction and multilingual chat endpoints.
+
+Start the backend against the local LLM stub so no API key or quota is needed:
+
+    cd backend
+    LLM_BACKEND=stub LLM_STUB_LATENCY_MS=800 LLM_STUB_ERROR_RATE=0.02 \\
+        gunicorn -w 2 --threads 8 app_integrated:app
+
+then drive it:
+
+    python benchmarks/load_test.py --base-url http://localhost:8000 --concurrency 16 --duration 60
+
+Each worker thread repeatedly posts to ``/api/predict-yield`` or ``/api/mchatbot``
+(weighted by ``--mix``). The report gives throughput and p50/p95/p99 latency per
+endpoint, plus the server's LLM gateway stats from ``GET /api/metrics``.
+Only the standard library is used.
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+CROPS = ['rice', 'wheat', 'maize', 'cotton(lint)', 'sugarcane', 'groundnut', 'soyabean', 'bajra']
+STATES = ['punjab', 'uttar pradesh', 'maharashtra', 'karnataka', 'bihar', 'gujarat']
+QUESTIONS = [
+    'best fertilizer for {crop}',
+    'how often should I irrigate {crop} in {state}',
+    'what diseases affect {crop} and how to prevent them',
+    'when should I harvest {crop}',
+    'how to improve {crop} yield in {state}',
+]
+LANGUAGES = ['en', 'hi', 'mr', 'ta']
+
+
+def _predict_payload(rng: random.Random) -> dict:
+    return {
+        'crop_type': rng.choice(CROPS),
+        'state': rng.choice(STATES),
+        'season': rng.choice(['kharif', 'rabi']),
+        'area': rng.choice([200, 500, 1000, 2500]),
+        'annual_rainfall': rng.randrange(400, 1600, 50),
+        'fertilizer': rng.randrange(20000, 150000, 5000),
+        'pesticide': rng.randrange(100, 2000, 100),
+        'language': rng.choice(LANGUAGES)
+    }
+
+
+def _chat_payload(rng: random.Random) -> dict:
+    question = rng.choice(QUESTIONS).format(crop=rng.choice(CROPS), state=rng.choice(STATES))
+    return {'query': question, 'language': rng.choice(LANGUAGES)}
+
+
+ENDPOINTS = {
+    'predict': ('/api/predict-yield', _predict_payload),
+    'mchatbot': ('/api/mchatbot', _chat_payload),
+}
+
+
+def _post(url: str, payload: dict, timeout: float) -> tuple[bool, int]:
+    request = urllib.request.Request(
+        url, data=json.dumps(payload).encode('utf-8'), headers={'Content-Type': 'application/json'}, method='POST'
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            body = json.loads(response.read() or b'{}')
+            return body.get('success', True) is not False, response.status
+    except urllib.error.HTTPError as e:
+        return False, e.code
+    except Exception:
+        return False, 0
+
+
+def _percentile(ordered: list[float], pct: float):
+    return round(ordered[min(len(ordered) - 1, int(pct * len(ordered)))], 1) if ordered else None
+
+
+def run(base_url: str, concurrency: int, duration: float, mix: dict[str, float], timeout: float, seed: int) -> dict:
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    results = {name: [] for name in names}
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def worker(index: int):
+        rng = random.Random(seed + index)
+        while time.monotonic() < stop_at:
+            name = rng.choices(names, weights)[0]
+            path, make_payload = ENDPOINTS[name]
+            started = time.perf_counter()
+            ok, status = _post(base_url + path, make_payload(rng), timeout)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with lock:
+                results[name].append((elapsed_ms, ok, status))
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for index in range(concurrency):
+            pool.submit(worker, index)
+    wall = time.monotonic() - started
+
+    report = {'wall_seconds': round(wall, 1), 'concurrency': concurrency, 'endpoints': {}}
+    for name, rows in results.items():
+        latencies = sorted(r[0] for r in rows)
+        errors = sum(1 for r in rows if not r[1])
+        statuses = {}
+        for _, _, status in rows:
+            statuses[status] = statuses.get(status, 0) + 1
+        report['endpoints'][name] = {
+            'requests': len(rows),
+            'errors': errors,
+            'error_rate': round(errors / len(rows), 4) if rows else None,
+            'throughput_rps': round(len(rows) / wall, 2),
+            'p50_ms': _percentile(latencies, 0.50),
+            'p95_ms': _percentile(latencies, 0.95),
+            'p99_ms': _percentile(latencies, 0.99),
+            'max_ms': round(latencies[-1], 1) if latencies else None,
+            'status_codes': statuses
+        }
+    try:
+        with urllib.request.urlopen(base_url + '/api/metrics', timeout=timeout) as response:
+            server = json.loads(response.read())
+            report['server'] = {'pid': server.get('pid'), 'llm_backend': server.get('llm_backend'),
+                                'llm_gateway': server.get('llm_gateway')}
+    except Exception as e:
+        report['server'] = {'error': str(e)}
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test /api/predict-yield and /api/mchatbot.')
+    parser.add_argument('--base-url', default='http://localhost:5000')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run')
+    parser.add_argument('--mix', default='predict=1,mchatbot=1', help='Endpoint weights, e.g. predict=3,mchatbot=1')
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help='Write the full report to this file')
+    args = parser.parse_args(argv)
+
+    mix = {}
+    for part in args.mix.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in ENDPOINTS:
+            parser.error(f'unknown endpoint in --mix: {name}')
+        mix[name.strip()] = float(weight or 1)
+
+    report = run(args.base_url.rstrip('/'), args.concurrency, args.duration, mix, args.timeout, args.seed)
+    print(f"{report['concurrency']} workers, {report['wall_seconds']}s")
+    print(f"{'endpoint':<10}{'requests':>10}{'errors':>8}{'rps':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, row in report['endpoints'].items():
+        print(f"{name:<10}{row['requests']:>10}{row['errors']:>8}{row['throughput_rps']:>8}"
+              f"{row['p50_ms']!s:>10}{row['p95_ms']!s:>10}{row['p99_ms']!s:>10}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as fh:
+            json.dump(report, fh, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""Compare the two-call and combined LLM flows of /api/predict-yield.
+
+Each sample payload is posted through the Flask test client once per mode
+(``llm_mode`` = ``split`` / ``combined``) with the recommendation cache
+disabled, so every request reaches Gemini. Per mode it reports request latency,
+LLM calls and the prompt/output tokens recorded by the LLM gateway.
+
+Usage (from backend/, needs GEMINI_API_KEY and the usual .env):
+
+    python benchmarks/yield_llm_modes.py --runs 3 --languages en,hi [--json report.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+# Every request must reach Gemini: no L1 entries, no Mongo L2
+os.environ['RECOMMENDATION_CACHE_L1_SIZE'] = '0'
+os.environ['RECOMMENDATION_CACHE_MONGO'] = 'false'
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+SAMPLE_PAYLOADS = [
+    {'crop_type': 'rice', 'state': 'punjab', 'season': 'kharif', 'area': 1200, 'annual_rainfall': 950,
+     'fertilizer': 120000, 'pesticide': 900, 'temperature': 29, 'humidity': 72, 'ph': 6.8},
+    {'crop_type': 'wheat', 'state': 'uttar pradesh', 'season': 'rabi', 'area': 800, 'annual_rainfall': 620,
+     'fertilizer': 90000, 'pesticide': 400, 'temperature': 21, 'humidity': 55, 'ph': 7.1},
+    {'crop_type': 'cotton(lint)', 'state': 'maharashtra', 'season': 'kharif', 'area': 500, 'annual_rainfall': 780,
+     'fertilizer': 60000, 'pesticide': 700, 'temperature': 31, 'humidity': 60, 'ph': 7.6},
+]
+
+LLM_CALLERS = ('yield_validation', 'yield_recommendations', 'yield_combined')
+
+
+def _llm_counters(metrics):
+    totals = {'calls': 0, 'prompt_tokens': 0, 'output_tokens': 0}
+    for caller in LLM_CALLERS:
+        for field in totals:
+            totals[field] += metrics.counter(f'llm.{caller}.{field}')
+    return totals
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct * len(ordered)))] if ordered else None
+
+
+def run(runs: int, languages: list[str]) -> dict:
+    from app_integrated import app, yield_recommendation_model
+    from metrics import metrics
+
+    if not yield_recommendation_model:
+        raise SystemExit('Gemini recommendation model unavailable (GEMINI_API_KEY?); nothing to compare.')
+
+    client = app.test_client()
+    samples = {mode: [] for mode in ('split', 'combined')}
+    for _ in range(runs):
+        for language in languages:
+            for payload in SAMPLE_PAYLOADS:
+                # Alternate the order so warm-up effects do not favour one mode
+                for mode in ('split', 'combined') if len(samples['split']) % 2 == 0 else ('combined', 'split'):
+                    before = _llm_counters(metrics)
+                    started = time.perf_counter()
+                    response = client.post('/api/predict-yield', json={**payload, 'language': language, 'llm_mode': mode})
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+                    after = _llm_counters(metrics)
+                    body = response.get_json() or {}
+                    samples[mode].append({
+                        'latency_ms': elapsed_ms,
+                        'llm_calls': after['calls'] - before['calls'],
+                        'prompt_tokens': after['prompt_tokens'] - before['prompt_tokens'],
+                        'output_tokens': after['output_tokens'] - before['output_tokens'],
+                        'fallback': bool(body.get('llm_mode_fallback')),
+                        'recommendations': 'ai_recommendations' in body
+                    })
+
+    report = {}
+    for mode, rows in samples.items():
+        latencies = [r['latency_ms'] for r in rows]
+        report[mode] = {
+            'requests': len(rows),
+            'latency_ms_p50': round(statistics.median(latencies), 1),
+            'latency_ms_p95': round(_percentile(latencies, 0.95), 1),
+            'latency_ms_mean': round(statistics.fmean(latencies), 1),
+            'llm_calls_mean': round(statistics.fmean(r['llm_calls'] for r in rows), 2),
+            'prompt_tokens_mean': round(statistics.fmean(r['prompt_tokens'] for r in rows), 1),
+            'output_tokens_mean': round(statistics.fmean(r['output_tokens'] for r in rows), 1),
+            'fallbacks': sum(r['fallback'] for r in rows),
+            'recommendation_rate': round(sum(r['recommendations'] for r in rows) / len(rows), 3)
+        }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=2, help='Passes over the sample payloads')
+    parser.add_argument('--languages', default='en', help='Comma-separated response languages')
+    parser.add_argument('--json', help='Write the report to this file')
+    args = parser.parse_args(argv)
+
+    report = run(args.runs, [lang.strip() for lang in args.languages.split(',') if lang.strip()])
+    columns = list(next(iter(report.values())).keys())
+    print(f"{'mode':<10}" + ''.join(f'{c:>20}' for c in columns))
+    for mode, row in report.items():
+        print(f'{mode:<10}' + ''.join(f'{row[c]:>20}' for c in columns))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as fh:
+            json.dump(report, fh, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,29 +1,78 @@
-﻿import google.generativeai as genai
-import os
+﻿import os
+import re
+import time
+import queue
+import atexit
+import threading
+import uuid
+from collections import OrderedDict, deque
 from datetime import datetime
 from database import get_collection
+from sse import gemini_text_chunks
+from llm_gateway import llm_gateway
+from similarity_cache import similarity_cache
+from metrics import metrics
+from llm_backends import llm_available, configure as configure_llm, create_model
+
+
+class _ChatSession:
+    """In-memory state for one user's conversation: recent turns plus a rolling summary."""
+
+    __slots__ = ('user_id', 'session_id', 'turns', 'summary', 'turn_count', 'last_active', 'history_reset')
+
+    def __init__(self, user_id, session_id, max_turns):
+        self.user_id = user_id
+        self.session_id = session_id
+        self.turns = deque(maxlen=max_turns)
+        self.summary = []
+        self.turn_count = 0
+        self.last_active = time.time()
+        self.history_reset = None  # token of the last clear seen in chat_sessions
+
+    @property
+    def has_history(self):
+        return bool(self.turns or self.summary)
+
 
 class CropChatbot:
+    # Prompt budget: the last HISTORY_TURNS exchanges verbatim (each message cut to
+    # TURN_MAX_CHARS) plus a summary of older turns capped at SUMMARY_MAX_CHARS, so the
+    # prompt size does not grow with the conversation.
+    HISTORY_TURNS = int(os.environ.get('CHAT_HISTORY_TURNS', 6))
+    TURN_MAX_CHARS = int(os.environ.get('CHAT_TURN_MAX_CHARS', 600))
+    SUMMARY_MAX_CHARS = int(os.environ.get('CHAT_SUMMARY_MAX_CHARS', 1200))
+    MAX_SESSIONS = int(os.environ.get('CHAT_MAX_SESSIONS', 1000))
+    # chat_sessions writes are queued and flushed by a background thread
+    PERSIST_INTERVAL_SECONDS = float(os.environ.get('CHAT_PERSIST_INTERVAL_SECONDS', 2))
+    PERSIST_BATCH_SIZE = int(os.environ.get('CHAT_PERSIST_BATCH_SIZE', 100))
+    # Messages kept per chat_sessions document (the prompt only uses HISTORY_TURNS)
+    PERSIST_MAX_MESSAGES = max(HISTORY_TURNS, int(os.environ.get('CHAT_PERSIST_MAX_MESSAGES', 50)))
+    CLEAR_TIMEOUT_SECONDS = 5
+
     def __init__(self):
         self.api_key = os.environ.get('GEMINI_API_KEY')
         self.model = None
         self.chat_sessions_collection = get_collection('chat_sessions')
-        
-        if self.api_key:
+        self._sessions = OrderedDict()
+        self._sessions_lock = threading.Lock()
+        self._write_queue = queue.Queue()
+        self._start_writer()
+
+        if llm_available(self.api_key):
             try:
-                genai.configure(api_key=self.api_key)
+                configure_llm(self.api_key)
                 # Try the current model name first
                 try:
-                    self.model = genai.GenerativeModel('gemini-2.5-flash')
+                    self.model = create_model('gemini-2.5-flash')
                     print('Gemini AI initialized successfully with gemini-2.5-flash')
                 except:
                     # Fallback to other possible model names
                     try:
-                        self.model = genai.GenerativeModel('gemini-1.5-pro')
+                        self.model = create_model('gemini-1.5-pro')
                         print('Gemini AI initialized successfully with gemini-2.5-flash')
                     except:
                         try:
-                            self.model = genai.GenerativeModel('models/gemini-1.5-flash')
+                            self.model = create_model('models/gemini-1.5-flash')
                             print('Gemini AI initialized successfully with models/gemini-1.5-flash')
                         except:
                             print('Unable to find available Gemini model')
@@ -37,21 +86,39 @@ class CropChatbot:
 
     def chat(self, user_message, user_id=None):
         try:
-            session_id = f'session_{user_id or "anon"}_{datetime.now().strftime("%Y%m%d")}'
-            
+            session = self._get_session(user_id)
+            # A near-duplicate answer is only valid when there is no conversation context
+            use_cache = session is None or not session.has_history
+
+            cached = similarity_cache.lookup('crop_chatbot', None, user_message) if self.model and use_cache else None
+            if cached:
+                self._record_turn(session, user_message, cached['answer'])
+                return {
+                    'success': True,
+                    'response': cached['answer'],
+                    'cached': True,
+                    'similarity': cached['similarity'],
+                    'timestamp': datetime.utcnow().isoformat()
+                }
+
             if self.model:
-                prompt = f'You are an agricultural AI assistant. Provide specific farming advice for: {user_message}'
-                response = self.model.generate_content(prompt)
+                prompt = self._build_prompt(user_message, session)
+                response = llm_gateway.generate(self.model, prompt, caller='crop_chatbot')
                 ai_response = response.text if response and response.text else 'No response generated'
+                if response and response.text:
+                    if use_cache:
+                        similarity_cache.store('crop_chatbot', None, user_message, ai_response)
+                    self._record_turn(session, user_message, ai_response)
             else:
                 ai_response = 'AI system unavailable. Please try again later.'
-            
+
             return {
                 'success': True,
                 'response': ai_response,
+                'cached': False,
                 'timestamp': datetime.utcnow().isoformat()
             }
-            
+
         except Exception as e:
             return {
                 'success': False,
@@ -59,4 +126,271 @@ class CropChatbot:
                 'timestamp': datetime.utcnow().isoformat()
             }
 
+    def chat_stream(self, user_message, user_id=None):
+        """Yield the answer as text chunks using Gemini streaming generation."""
+        if not self.model:
+            yield 'AI system unavailable. Please try again later.'
+            return
+        session = self._get_session(user_id)
+        use_cache = session is None or not session.has_history
+        cached = similarity_cache.lookup('crop_chatbot', None, user_message) if use_cache else None
+        if cached:
+            self._record_turn(session, user_message, cached['answer'])
+            yield cached['answer']
+            return
+        prompt = self._build_prompt(user_message, session)
+        parts = []
+        for text in gemini_text_chunks(llm_gateway.generate_stream(self.model, prompt, caller='crop_chatbot')):
+            parts.append(text)
+            yield text
+        if parts:
+            answer = ''.join(parts)
+            if use_cache:
+                similarity_cache.store('crop_chatbot', None, user_message, answer)
+            self._record_turn(session, user_message, answer)
+
+    def get_conversation_summary(self, user_id):
+        session = self._get_session(user_id)
+        if session is None:
+            return {'success': False, 'error': 'user_id is required'}
+        with self._sessions_lock:
+            return {
+                'success': True,
+                'session_id': session.session_id,
+                'turn_count': session.turn_count,
+                'summary': '\n'.join(session.summary),
+                'recent_turns': [
+                    {'user': user, 'assistant': assistant, 'timestamp': ts}
+                    for user, assistant, ts in session.turns
+                ]
+            }
+
+    def clear_history(self, user_id):
+        if not user_id:
+            return {'success': False, 'error': 'user_id is required'}
+        key = str(user_id)
+        session_id = f'session_{key}_{datetime.now().strftime("%Y%m%d")}'
+        session = _ChatSession(key, session_id, self.HISTORY_TURNS)
+        session.history_reset = uuid.uuid4().hex
+        with self._sessions_lock:
+            # Replace rather than drop, so a request arriving before the reset is
+            # written does not reload the old history from chat_sessions
+            self._sessions[key] = session
+        # The reset token tells the other workers to drop their copy of this session
+        done = threading.Event()
+        self._write_queue.put(('clear', key, {'session_id': session_id, 'history_reset': session.history_reset, 'done': done}))
+        if not done.wait(self.CLEAR_TIMEOUT_SECONDS):
+            print(f'[CropChatbot] Clearing history of {key} is still queued')
+        return {'success': True, 'message': 'Conversation history cleared'}
+
+    def _build_prompt(self, user_message, session=None):
+        instruction = 'You are an agricultural AI assistant. Provide specific farming advice for: '
+        if session is None or not session.has_history:
+            return f'{instruction}{user_message}'
+        with self._sessions_lock:
+            summary = '\n'.join(session.summary)
+            turns = list(session.turns)
+        sections = ['You are an agricultural AI assistant in an ongoing conversation with a farmer.']
+        if summary:
+            sections.append(f'Summary of earlier conversation:\n{summary}')
+        if turns:
+            history = '\n'.join(
+                f'Farmer: {self._clip(user, self.TURN_MAX_CHARS)}\nAssistant: {self._clip(assistant, self.TURN_MAX_CHARS)}'
+                for user, assistant, _ in turns
+            )
+            sections.append(f'Recent messages:\n{history}')
+        sections.append(f'Provide specific farming advice for the farmer\'s new message, using the context above where relevant.\nFarmer: {user_message}')
+        return '\n\n'.join(sections)
+
+    # ------------------------------------------------------------------
+    # Session memory
+    # ------------------------------------------------------------------
+    def _get_session(self, user_id):
+        if not user_id:
+            return None
+        key = str(user_id)
+        session_id = f'session_{key}_{datetime.now().strftime("%Y%m%d")}'
+        with self._sessions_lock:
+            session = self._sessions.get(key)
+            if session is not None and session.session_id == session_id:
+                self._sessions.move_to_end(key)
+                session.last_active = time.time()
+            else:
+                session = None
+        if session is not None and not self._changed_elsewhere(session):
+            return session
+        # New user in this worker, a new day, or history cleared or advanced by another
+        # worker: start from what was persisted today
+        loaded = self._load_session(key, session_id)
+        with self._sessions_lock:
+            current = self._sessions.get(key)
+            if current is None or current is session:
+                self._sessions[key] = loaded
+            session = self._sessions[key]
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.MAX_SESSIONS:
+                self._sessions.popitem(last=False)
+        return session
+
+    def _changed_elsewhere(self, session):
+        """True if another worker cleared or added to the history since this copy was loaded."""
+        try:
+            doc = self.chat_sessions_collection.find_one(
+                {'session_id': session.session_id}, {'history_reset': 1, 'turn_count': 1}
+            )
+        except Exception:
+            return False
+        if not doc:
+            return False
+        reset = doc.get('history_reset')
+        if reset is not None and reset != session.history_reset:
+            return True
+        return doc.get('turn_count', 0) > session.turn_count
+
+    def _load_session(self, key, session_id):
+        session = _ChatSession(key, session_id, self.HISTORY_TURNS)
+        try:
+            doc = self.chat_sessions_collection.find_one(
+                {'session_id': session_id},
+                {'summary': 1, 'turn_count': 1, 'history_reset': 1, 'messages': {'$slice': -self.HISTORY_TURNS}}
+            )
+        except Exception as e:
+            print(f'[CropChatbot] Could not load session {session_id}: {e}')
+            return session
+        if doc:
+            session.summary = [line for line in (doc.get('summary') or '').split('\n') if line]
+            session.turn_count = doc.get('turn_count', 0)
+            session.history_reset = doc.get('history_reset')
+            for message in doc.get('messages', []):
+                session.turns.append((message.get('user', ''), message.get('assistant', ''), message.get('timestamp')))
+        return session
+
+    def _record_turn(self, session, user_message, answer):
+        if session is None:
+            return
+        timestamp = datetime.utcnow().isoformat()
+        with self._sessions_lock:
+            if len(session.turns) == session.turns.maxlen:
+                self._compact(session, session.turns[0])
+            session.turns.append((user_message, answer, timestamp))
+            session.turn_count += 1
+            summary = '\n'.join(session.summary)
+            turn_count = session.turn_count
+        self._write_queue.put(('turn', session.session_id, {
+            'message': {'user': user_message, 'assistant': answer, 'timestamp': timestamp},
+            'summary': summary,
+            'turn_count': turn_count,
+            'user_id': session.user_id
+        }))
+
+    def _compact(self, session, turn):
+        """Fold a turn leaving the ring buffer into the rolling summary (no extra LLM call)."""
+        user, assistant, _ = turn
+        first_sentence = re.split(r'(?<=[.!?])\s+', assistant.strip(), maxsplit=1)[0]
+        session.summary.append(f'- Farmer asked: {self._clip(user, 120)} | Advice: {self._clip(first_sentence, 160)}')
+        # Oldest summary lines are dropped first to stay within the budget
+        while len(session.summary) > 1 and sum(len(line) + 1 for line in session.summary) > self.SUMMARY_MAX_CHARS:
+            session.summary.pop(0)
+
+    @staticmethod
+    def _clip(text, limit):
+        text = ' '.join((text or '').split())
+        return text if len(text) <= limit else text[:limit - 1].rstrip() + '…'
+
+    # ------------------------------------------------------------------
+    # Asynchronous chat_sessions persistence
+    # ------------------------------------------------------------------
+    def _start_writer(self):
+        thread = threading.Thread(target=self._writer_loop, daemon=True, name='chat-session-writer')
+        thread.start()
+        atexit.register(self._flush_pending)
+
+    def _writer_loop(self):
+        while True:
+            ops = [self._write_queue.get()]
+            deadline = time.monotonic() + self.PERSIST_INTERVAL_SECONDS
+            while len(ops) < self.PERSIST_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                if ops[-1][0] == 'clear':
+                    break  # clear_history waits for it
+                try:
+                    ops.append(self._write_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write_batch(ops)
+
+    def _flush_pending(self):
+        ops = []
+        while True:
+            try:
+                ops.append(self._write_queue.get_nowait())
+            except queue.Empty:
+                break
+        if ops:
+            self._write_batch(ops)
+
+    def _write_batch(self, ops):
+        try:
+            from pymongo import UpdateOne, DeleteMany
+            requests = []
+            pending_turns = OrderedDict()
+            for kind, key, payload in ops:
+                if kind == 'turn':
+                    entry = pending_turns.setdefault(key, {'messages': [], 'user_id': payload['user_id']})
+                    entry['messages'].append(payload['message'])
+                    entry['summary'] = payload['summary']
+                    entry['turn_count'] = payload['turn_count']
+                else:
+                    # Preserve ordering: turns queued before a clear are written, then reset
+                    requests.extend(self._turn_updates(pending_turns, UpdateOne))
+                    pending_turns.clear()
+                    now = datetime.utcnow()
+                    requests.append(DeleteMany({'user_id': key, 'session_id': {'$ne': payload['session_id']}}))
+                    requests.append(UpdateOne(
+                        {'session_id': payload['session_id']},
+                        {
+                            '$set': {'messages': [], 'summary': '', 'turn_count': 0, 'summary_turn': 0,
+                                     'history_reset': payload['history_reset'], 'updated_at': now},
+                            '$setOnInsert': {'user_id': key, 'created_at': now}
+                        },
+                        upsert=True
+                    ))
+            requests.extend(self._turn_updates(pending_turns, UpdateOne))
+            if not requests:
+                return
+            self.chat_sessions_collection.bulk_write(requests, ordered=True)
+            metrics.incr('chat_sessions.batches')
+            metrics.observe('chat_sessions.batch_size', len(ops))
+        except Exception as e:
+            metrics.incr('chat_sessions.write_errors')
+            print(f'[CropChatbot] Failed to persist {len(ops)} chat session updates: {e}')
+        finally:
+            for kind, _, payload in ops:
+                if kind == 'clear':
+                    payload['done'].set()
+
+    def _turn_updates(self, pending_turns, UpdateOne):
+        # turn_count is incremented rather than set so concurrent workers add up, and the
+        # summary is only replaced by one built from at least as many turns as the stored one
+        now = datetime.utcnow()
+        requests = []
+        for session_id, entry in pending_turns.items():
+            requests.append(UpdateOne(
+                {'session_id': session_id},
+                {
+                    '$push': {'messages': {'$each': entry['messages'], '$slice': -self.PERSIST_MAX_MESSAGES}},
+                    '$inc': {'turn_count': len(entry['messages'])},
+                    '$set': {'updated_at': now},
+                    '$setOnInsert': {'user_id': entry['user_id'], 'created_at': now}
+                },
+                upsert=True
+            ))
+            requests.append(UpdateOne(
+                {'session_id': session_id, 'summary_turn': {'$not': {'$gt': entry['turn_count']}}},
+                {'$set': {'summary': entry['summary'], 'summary_turn': entry['turn_count']}}
+            ))
+        return requests
+
 crop_chatbot = CropChatbot()
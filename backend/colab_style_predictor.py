@@ -9,12 +9,15 @@ Differences from the notebook (minimal & necessary for API use):
  - Added persistence (joblib + meta JSON) so we don't retrain every process start.
  - Logging via print statements instead of display().
  - Safety checks for missing files / columns.
+ - Incremental (warm-start) refresh: new seasons add a batch of trees fitted on
+   new + recent rows; the oldest batches are retired on a schedule and the meta
+   JSON records which data every batch saw.
 
 All feature names & transformations preserved.
 """
 from __future__ import annotations
 
-import os, json, warnings
+import os, json, warnings, hashlib, time
 import pandas as pd
 import numpy as np
 from sklearn.ensemble import RandomForestRegressor
@@ -22,7 +25,7 @@ from sklearn.preprocessing import LabelEncoder
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 import joblib
-from datetime import datetime
+from datetime import datetime, timedelta
 
 warnings.filterwarnings("ignore")
 
@@ -37,6 +40,12 @@ class ColabStyleCropModel:
     OUTLIER_CAP_PERCENTILE = 0.99
     GDD_BASE_TEMP = 10
 
+    # Incremental refresh (warm_start) settings - overridable via env
+    INCREMENTAL_TREES = int(os.environ.get('COLAB_INCREMENTAL_TREES', 25))
+    RECENT_YEARS = int(os.environ.get('COLAB_RECENT_YEARS', 3))
+    MAX_TREE_BATCHES = int(os.environ.get('COLAB_MAX_TREE_BATCHES', 8))
+    TREE_MAX_AGE_DAYS = int(os.environ.get('COLAB_TREE_MAX_AGE_DAYS', 730))
+
     MODEL_PATH = 'colab_rf_model.joblib'
     META_PATH = 'colab_rf_model_meta.json'
 
@@ -48,6 +57,14 @@ class ColabStyleCropModel:
         self.is_trained = False
         self.metrics: dict | None = None
         self.target_stats: dict | None = None
+        # Per-column upper caps learned at full training (reused by incremental refresh)
+        self.feature_caps: dict[str, float] = {}
+        # Versioning: every full/incremental fit bumps the version; each batch of
+        # trees (contiguous in estimators_) records the data it was trained on.
+        self.model_version = 0
+        self.tree_batches: list[dict] = []
+        self.retired_batches: list[dict] = []
+        self.last_incremental: dict | None = None
         # Whether to cap target (default False, can enable to mimic original notebook exactly)
         env_cap = os.environ.get('COLAB_CAP_TARGET', 'false').lower()
         self.CAP_TARGET = env_cap in ('1','true','yes')
@@ -74,6 +91,20 @@ class ColabStyleCropModel:
                     self.encoders[col] = le
                 self.feature_columns = meta.get('feature_columns', [])
                 self.training_means = pd.Series(meta.get('training_means', {}))
+                self.feature_caps = meta.get('feature_caps', {})
+                self.metrics = meta.get('metrics', self.metrics)
+                self.target_stats = meta.get('target_stats', self.target_stats)
+                self.model_version = meta.get('model_version', 1)
+                self.tree_batches = meta.get('tree_batches') or [{
+                    # Artifacts saved before versioning: treat the whole forest as one batch
+                    'batch_id': 'legacy',
+                    'kind': 'full',
+                    'n_trees': len(getattr(self.model, 'estimators_', [])),
+                    'trained_at': meta.get('created_at'),
+                    'data': None
+                }]
+                self.retired_batches = meta.get('retired_batches', [])
+                self.last_incremental = meta.get('last_incremental')
                 self.is_trained = True
                 print("[ColabModel] Loaded persisted model.")
                 return True
@@ -98,7 +129,12 @@ class ColabStyleCropModel:
             'metrics': self.metrics,
             'target_stats': self.target_stats,
             'cap_target': self.CAP_TARGET,
-            'compress_level': compress_level_int
+            'compress_level': compress_level_int,
+            'feature_caps': self.feature_caps,
+            'model_version': self.model_version,
+            'tree_batches': self.tree_batches,
+            'retired_batches': self.retired_batches[-20:],
+            'last_incremental': self.last_incremental
         }
         with open(self.META_PATH, 'w') as f:
             json.dump(meta, f, indent=2)
@@ -120,55 +156,18 @@ class ColabStyleCropModel:
             df_yield = pd.read_csv(yp)
             df_custom = pd.read_csv(cp)
             print("[ColabModel] Files loaded.")
+            data_info = self._describe_data(df_yield, [yp, cp])
 
-            # Clean & harmonize df_yield
-            df_yield.dropna(inplace=True)
-            df_yield.rename(columns={'Crop_Year':'Year','State':'State Name','Yield':'Yield_ton_per_hec'}, inplace=True)
-            for col in ['Season','State Name','Crop']:
-                if col in df_yield.columns and df_yield[col].dtype=='object':
-                    df_yield[col] = df_yield[col].str.strip().str.lower()
-
-            # Prepare df_custom aggregated
-            df_custom.rename(columns={'Area_ha':'Area'}, inplace=True)
-            custom_numeric_cols = [
-                'N_req_kg_per_ha','P_req_kg_per_ha','K_req_kg_per_ha','Temperature_C','Humidity_%','pH','Rainfall_mm','Wind_Speed_m_s','Solar_Radiation_MJ_m2_day'
-            ]
-            existing_cols = [c for c in custom_numeric_cols if c in df_custom.columns]
-            df_custom_agg = df_custom.groupby(['State Name','Year','Crop'])[existing_cols].mean().reset_index()
-            df_custom_agg['State Name'] = df_custom_agg['State Name'].str.strip().str.lower()
-            df_custom_agg['Crop'] = df_custom_agg['Crop'].str.strip().str.lower()
-
-            merged_df = pd.merge(df_yield, df_custom_agg, on=['State Name','Year','Crop'], how='left')
+            merged_df = self._merge_and_engineer(self._clean_yield_frame(df_yield), df_custom)
             print(f"[ColabModel] merged_df shape: {merged_df.shape}")
 
-            # Drop leakage
-            if 'Production' in merged_df.columns:
-                merged_df.drop('Production', axis=1, inplace=True)
-
-            # Feature engineering (exact set)
-            if {'Temperature_C','Rainfall_mm'}.issubset(merged_df.columns):
-                merged_df['Temp_Rain_Interaction'] = merged_df['Temperature_C'] * merged_df['Rainfall_mm']
-            if {'Humidity_%','pH'}.issubset(merged_df.columns):
-                merged_df['Humidity_pH_Interaction'] = merged_df['Humidity_%'] * merged_df['pH']
-            if {'Fertilizer','Pesticide'}.issubset(merged_df.columns):
-                merged_df['Fertilizer_Pesticide_Interaction'] = merged_df['Fertilizer'] * merged_df['Pesticide']
-            if 'Temperature_C' in merged_df.columns:
-                merged_df['Temperature_C_sq'] = merged_df['Temperature_C']**2
-                merged_df['GDD'] = (merged_df['Temperature_C'] - self.GDD_BASE_TEMP).apply(lambda x: max(0,x))
-            if 'Rainfall_mm' in merged_df.columns:
-                merged_df['Rainfall_mm_sq'] = merged_df['Rainfall_mm']**2
-            if 'pH' in merged_df.columns:
-                merged_df['pH_sq'] = merged_df['pH']**2
-
             # Impute initial missing with mean (numeric) BEFORE capping - notebook does after merge
             numeric_cols = merged_df.select_dtypes(include=np.number).columns
             merged_df[numeric_cols] = merged_df[numeric_cols].fillna(merged_df[numeric_cols].mean())
 
             # Outlier capping (optionally exclude target)
-            for col in numeric_cols:
-                if col == 'Yield_ton_per_hec' and not self.CAP_TARGET:
-                    continue
-                upper = merged_df[col].quantile(self.OUTLIER_CAP_PERCENTILE)
+            self.feature_caps = self._fit_feature_caps(merged_df, numeric_cols)
+            for col, upper in self.feature_caps.items():
                 merged_df[col] = merged_df[col].clip(upper=upper)
 
             # Store means AFTER capping for later alignment
@@ -219,6 +218,7 @@ class ColabStyleCropModel:
                 self.metrics = None
 
             # Final model on full dataset
+            started = time.perf_counter()
             self.model = RandomForestRegressor(
                 n_estimators=self.N_ESTIMATORS,
                 random_state=self.RANDOM_STATE,
@@ -227,6 +227,10 @@ class ColabStyleCropModel:
             )
             self.model.fit(X_capped, y_capped)
             self.is_trained = True
+            self.model_version += 1
+            self.tree_batches = [self._new_batch('full', self.N_ESTIMATORS, data_info, time.perf_counter() - started)]
+            self.retired_batches = []
+            self.last_incremental = None
             print("[ColabModel] Training complete (full). OOB:", getattr(self.model,'oob_score_', None))
             self._save()
             return True
@@ -234,6 +238,242 @@ class ColabStyleCropModel:
             print(f"[ColabModel] Training error: {e}")
             return False
 
+    # ------------------------------------------------------------------
+    # Incremental refresh (warm_start)
+    # ------------------------------------------------------------------
+    def train_incremental(self, new_yield_path: str, custom_path: str | None = None,
+                          n_trees: int | None = None, recent_years: int | None = None) -> dict:
+        """Add a batch of trees fitted on newly appended rows plus recent history.
+
+        ``new_yield_path`` must follow the ``crop_yield.csv`` schema. Encoders,
+        imputation means and outlier caps from the last full training are reused
+        as-is, so the feature space stays identical to the existing forest.
+        Artifacts saved without caps get them recomputed from the base datasets
+        exactly as full training does; without those datasets the refresh is
+        refused rather than fitting on uncapped rows.
+        Categories never seen by the full training are mapped like ``predict``
+        does and reported back - they are a signal that a full retrain is due.
+        """
+        if not self.is_trained and not self._load():
+            return {'success': False, 'error': 'No trained base model; run full training first.'}
+        if self.model is None and not self._load():
+            return {'success': False, 'error': 'Failed to load persisted model for incremental refresh.'}
+        if not new_yield_path or not os.path.exists(new_yield_path):
+            return {'success': False, 'error': f'New data file not found: {new_yield_path}'}
+
+        n_trees = int(n_trees or self.INCREMENTAL_TREES)
+        recent_years = self.RECENT_YEARS if recent_years is None else int(recent_years)
+        cp = custom_path or os.environ.get('COLAB_CUSTOM_PATH') or self.CUSTOM_DATA_PATH
+        yp = os.environ.get('COLAB_YIELD_PATH') or self.YIELD_DATA_PATH
+        if not self.feature_caps:
+            if not os.path.exists(yp) or not os.path.exists(cp):
+                return {'success': False, 'error': 'Model has no outlier caps and the base datasets to recompute '
+                                                   'them are missing; run full training first.'}
+            try:
+                self.feature_caps = self._base_feature_caps(yp, cp)
+                print(f"[ColabModel] Recomputed outlier caps for {len(self.feature_caps)} columns from the base datasets")
+            except Exception as e:
+                return {'success': False, 'error': f'Could not recompute outlier caps: {e}'}
+        try:
+            started = time.perf_counter()
+            df_new = self._clean_yield_frame(pd.read_csv(new_yield_path))
+            if df_new.empty:
+                return {'success': False, 'error': 'New data file has no usable rows.'}
+            frames = [df_new]
+            sources = [new_yield_path]
+            if recent_years > 0 and os.path.exists(yp):
+                df_base = self._clean_yield_frame(pd.read_csv(yp))
+                if 'Year' in df_base.columns and not df_base.empty:
+                    cutoff = int(df_base['Year'].max()) - recent_years
+                    frames.append(df_base[df_base['Year'] > cutoff])
+                    sources.append(yp)
+            df_rows = pd.concat(frames, ignore_index=True)
+            df_custom = pd.read_csv(cp) if os.path.exists(cp) else pd.DataFrame()
+            if os.path.exists(cp):
+                sources.append(cp)
+            data_info = self._describe_data(df_rows, sources)
+            data_info['new_rows'] = int(len(df_new))
+
+            merged_df = self._merge_and_engineer(df_rows, df_custom)
+            X, y, unseen = self._transform_with_fitted(merged_df)
+
+            # Restore the forest's own settings even if the fit fails, so a later full
+            # retrain or save doesn't inherit warm_start or a tree count with no trees
+            params = self.model.get_params()
+            self.model.set_params(warm_start=True, oob_score=False,
+                                  n_estimators=len(self.model.estimators_) + n_trees)
+            try:
+                self.model.fit(X, y)
+            finally:
+                self.model.set_params(warm_start=False, oob_score=params['oob_score'],
+                                      n_estimators=len(self.model.estimators_))
+            fit_seconds = time.perf_counter() - started
+
+            self.model_version += 1
+            self.tree_batches.append(self._new_batch('incremental', n_trees, data_info, fit_seconds))
+            retired = self.retire_tree_batches(save=False)
+            self.last_incremental = {
+                'version': self.model_version,
+                'rows': int(len(X)),
+                'trees_added': n_trees,
+                'trees_retired': sum(b['n_trees'] for b in retired),
+                'seconds': round(fit_seconds, 3),
+                'unseen_categories': unseen
+            }
+            self._save()
+            print(f"[ColabModel] Incremental refresh v{self.model_version}: +{n_trees} trees on {len(X)} rows in {fit_seconds:.2f}s")
+            return {'success': True, **self.last_incremental, 'n_estimators': len(self.model.estimators_)}
+        except Exception as e:
+            print(f"[ColabModel] Incremental training error: {e}")
+            return {'success': False, 'error': str(e)}
+
+    def retire_tree_batches(self, save: bool = True) -> list[dict]:
+        """Drop the oldest tree batches beyond MAX_TREE_BATCHES or older than TREE_MAX_AGE_DAYS.
+
+        The newest batch is always kept. Runs after every incremental refresh;
+        can also be triggered on its own (e.g. from a scheduled job).
+        """
+        if self.model is None:
+            self._load()
+        if self.model is None or not hasattr(self.model, 'estimators_'):
+            return []
+        max_age = timedelta(days=self.TREE_MAX_AGE_DAYS)
+        now = datetime.utcnow()
+        retired = []
+        while len(self.tree_batches) > 1:
+            oldest = self.tree_batches[0]
+            too_many = len(self.tree_batches) > self.MAX_TREE_BATCHES
+            trained_at = oldest.get('trained_at')
+            too_old = bool(trained_at) and now - datetime.fromisoformat(trained_at) > max_age
+            if not (too_many or too_old):
+                break
+            self.tree_batches.pop(0)
+            del self.model.estimators_[:oldest['n_trees']]
+            retired.append({**oldest, 'retired_at': now.isoformat()})
+        if retired:
+            self.model.n_estimators = len(self.model.estimators_)
+            self.retired_batches.extend(retired)
+            print(f"[ColabModel] Retired {len(retired)} tree batch(es); {self.model.n_estimators} trees remain.")
+            if save:
+                self._save()
+        return retired
+
+    def _new_batch(self, kind: str, n_trees: int, data_info: dict, fit_seconds: float) -> dict:
+        return {
+            'batch_id': f"{kind}-v{self.model_version}",
+            'kind': kind,
+            'version': self.model_version,
+            'n_trees': int(n_trees),
+            'trained_at': datetime.utcnow().isoformat(),
+            'fit_seconds': round(fit_seconds, 3),
+            'data': data_info
+        }
+
+    @staticmethod
+    def _file_sha256(path: str) -> str | None:
+        try:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as fh:
+                for chunk in iter(lambda: fh.read(1 << 20), b''):
+                    digest.update(chunk)
+            return digest.hexdigest()
+        except OSError:
+            return None
+
+    def _describe_data(self, df: pd.DataFrame, paths: list[str]) -> dict:
+        year_col = 'Year' if 'Year' in df.columns else ('Crop_Year' if 'Crop_Year' in df.columns else None)
+        years = df[year_col].dropna() if year_col else pd.Series(dtype=float)
+        return {
+            'sources': [{'path': p, 'sha256': self._file_sha256(p)} for p in paths],
+            'rows': int(len(df)),
+            'year_min': int(years.min()) if not years.empty else None,
+            'year_max': int(years.max()) if not years.empty else None
+        }
+
+    def _clean_yield_frame(self, df_yield: pd.DataFrame) -> pd.DataFrame:
+        # Clean & harmonize df_yield
+        df_yield = df_yield.dropna()
+        df_yield = df_yield.rename(columns={'Crop_Year':'Year','State':'State Name','Yield':'Yield_ton_per_hec'})
+        for col in ['Season','State Name','Crop']:
+            if col in df_yield.columns and df_yield[col].dtype=='object':
+                df_yield[col] = df_yield[col].str.strip().str.lower()
+        return df_yield
+
+    def _merge_and_engineer(self, df_yield: pd.DataFrame, df_custom: pd.DataFrame) -> pd.DataFrame:
+        merged_df = df_yield
+        if not df_custom.empty:
+            # Prepare df_custom aggregated
+            df_custom = df_custom.rename(columns={'Area_ha':'Area'})
+            custom_numeric_cols = [
+                'N_req_kg_per_ha','P_req_kg_per_ha','K_req_kg_per_ha','Temperature_C','Humidity_%','pH','Rainfall_mm','Wind_Speed_m_s','Solar_Radiation_MJ_m2_day'
+            ]
+            existing_cols = [c for c in custom_numeric_cols if c in df_custom.columns]
+            df_custom_agg = df_custom.groupby(['State Name','Year','Crop'])[existing_cols].mean().reset_index()
+            df_custom_agg['State Name'] = df_custom_agg['State Name'].str.strip().str.lower()
+            df_custom_agg['Crop'] = df_custom_agg['Crop'].str.strip().str.lower()
+
+            merged_df = pd.merge(df_yield, df_custom_agg, on=['State Name','Year','Crop'], how='left')
+
+        # Drop leakage
+        if 'Production' in merged_df.columns:
+            merged_df = merged_df.drop('Production', axis=1)
+
+        # Feature engineering (exact set)
+        if {'Temperature_C','Rainfall_mm'}.issubset(merged_df.columns):
+            merged_df['Temp_Rain_Interaction'] = merged_df['Temperature_C'] * merged_df['Rainfall_mm']
+        if {'Humidity_%','pH'}.issubset(merged_df.columns):
+            merged_df['Humidity_pH_Interaction'] = merged_df['Humidity_%'] * merged_df['pH']
+        if {'Fertilizer','Pesticide'}.issubset(merged_df.columns):
+            merged_df['Fertilizer_Pesticide_Interaction'] = merged_df['Fertilizer'] * merged_df['Pesticide']
+        if 'Temperature_C' in merged_df.columns:
+            merged_df['Temperature_C_sq'] = merged_df['Temperature_C']**2
+            merged_df['GDD'] = (merged_df['Temperature_C'] - self.GDD_BASE_TEMP).apply(lambda x: max(0,x))
+        if 'Rainfall_mm' in merged_df.columns:
+            merged_df['Rainfall_mm_sq'] = merged_df['Rainfall_mm']**2
+        if 'pH' in merged_df.columns:
+            merged_df['pH_sq'] = merged_df['pH']**2
+        return merged_df
+
+    def _fit_feature_caps(self, merged_df: pd.DataFrame, numeric_cols) -> dict[str, float]:
+        """Upper outlier caps per numeric column (the target only with ``CAP_TARGET``)."""
+        return {
+            col: float(merged_df[col].quantile(self.OUTLIER_CAP_PERCENTILE))
+            for col in numeric_cols
+            if col != 'Yield_ton_per_hec' or self.CAP_TARGET
+        }
+
+    def _base_feature_caps(self, yield_path: str, custom_path: str) -> dict[str, float]:
+        """The caps full training would fit on the base datasets (for artifacts saved without them)."""
+        merged_df = self._merge_and_engineer(self._clean_yield_frame(pd.read_csv(yield_path)), pd.read_csv(custom_path))
+        numeric_cols = merged_df.select_dtypes(include=np.number).columns
+        merged_df[numeric_cols] = merged_df[numeric_cols].fillna(merged_df[numeric_cols].mean())
+        return self._fit_feature_caps(merged_df, numeric_cols)
+
+    def _transform_with_fitted(self, merged_df: pd.DataFrame):
+        """Apply the imputation / caps / encoders fitted by the last full training."""
+        if 'Yield_ton_per_hec' not in merged_df.columns:
+            raise ValueError("New data missing 'Yield' target column.")
+        if self.training_means is not None:
+            merged_df = merged_df.fillna(self.training_means)
+        for col, upper in self.feature_caps.items():
+            if col in merged_df.columns:
+                merged_df[col] = merged_df[col].clip(upper=upper)
+        unseen_report = {}
+        for col, encoder in self.encoders.items():
+            if col in merged_df.columns:
+                unseen = set(merged_df[col].unique()) - set(encoder.classes_)
+                if unseen:
+                    unseen_report[col] = sorted(str(u) for u in unseen)
+                    repl = encoder.inverse_transform([0])[0]
+                    merged_df[col] = merged_df[col].replace(list(unseen), repl)
+                merged_df[col] = encoder.transform(merged_df[col])
+        y = merged_df['Yield_ton_per_hec']
+        X = merged_df.drop('Yield_ton_per_hec', axis=1)
+        for col in self.feature_columns:
+            if col not in X.columns:
+                X[col] = self.training_means[col] if self.training_means is not None and col in self.training_means else 0
+        return X[self.feature_columns], y, unseen_report
+
     # ------------------------------------------------------------------
     # Prediction (single custom input)
     # ------------------------------------------------------------------
@@ -383,7 +623,12 @@ class ColabStyleCropModel:
             'top_features': fi[:15] if isinstance(fi, list) else fi,
             'metrics': self.metrics,
             'target_stats': self.target_stats,
-            'cap_target': self.CAP_TARGET
+            'cap_target': self.CAP_TARGET,
+            'model_version': self.model_version,
+            'n_estimators': len(getattr(self.model, 'estimators_', [])) if self.model else None,
+            'tree_batches': self.tree_batches,
+            'retired_batch_count': len(self.retired_batches),
+            'last_incremental': self.last_incremental
         }
         return meta
 
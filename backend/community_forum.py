@@ -1,6 +1,7 @@
 from datetime import datetime, timedelta
 from bson import ObjectId
 from database import get_collection
+from language_detector import detect_language
 import re
 
 class CommunityForum:
@@ -25,8 +26,10 @@ class CommunityForum:
         ]
     
     def create_post(self, title, content, author, language='en', category='general'):
-        """Create a new forum post"""
+        """Create a new forum post (``language='auto'`` detects it from the text)"""
         try:
+            if language == 'auto':
+                language = detect_language(f'{title} {content}')
             if language not in self.supported_languages:
                 return {'success': False, 'error': 'Unsupported language'}
             
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Convert ``plant_disease_model.h5`` to TFLite for the ``tflite`` inference backend.
+
+Writes, next to the Keras model (each with a ``.sha256`` sidecar):
+
+- ``plant_disease_model.fp16.tflite``: float16 weights, about half the size.
+- ``plant_disease_model.int8.tflite``: dynamic-range quantization (int8
+  weights, float activations), about a quarter of the size. Needs no
+  calibration data.
+
+    python convert_disease_model.py                 # both variants
+    python convert_disease_model.py --variants int8
+
+Then run the API with ``DISEASE_MODEL_BACKEND=tflite DISEASE_TFLITE_VARIANT=int8``
+and compare the backends with ``python benchmarks/disease_backends.py``.
+Conversion needs full TensorFlow; serving only needs ``tflite-runtime``.
+"""
+import os
+import sys
+import argparse
+
+from disease_detector import DEFAULT_MODEL_PATH, write_hash_sidecar
+from disease_backends import TFLITE_VARIANTS, tflite_path
+
+
+def convert(model_path, variant):
+    """Convert the Keras model and return the TFLite flatbuffer bytes"""
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(model_path)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if variant == 'fp16':
+        converter.target_spec.supported_types = [tf.float16]
+    return converter.convert()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert the disease model to fp16 / int8 TFLite.')
+    parser.add_argument('--model', default=os.environ.get('DISEASE_MODEL_PATH') or DEFAULT_MODEL_PATH)
+    parser.add_argument('--variants', default=','.join(TFLITE_VARIANTS), help='Comma-separated: fp16,int8')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.model):
+        print(f"❌ No Keras model at {args.model}; run download_plant_model.py first")
+        return 1
+    variants = [v.strip() for v in args.variants.split(',') if v.strip()]
+    unknown = set(variants) - set(TFLITE_VARIANTS)
+    if unknown:
+        parser.error(f"unknown variant(s): {', '.join(sorted(unknown))}")
+
+    source_size = os.path.getsize(args.model)
+    for variant in variants:
+        output = tflite_path(args.model, variant)
+        print(f"🔄 Converting to {variant}...")
+        with open(output, 'wb') as fh:
+            fh.write(convert(args.model, variant))
+        digest = write_hash_sidecar(output)
+        size = os.path.getsize(output)
+        print(f"✅ {output}: {size / 1e6:.1f} MB ({size / source_size:.0%} of .h5), sha256 {digest[:12]}…")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,283 @@
+"""Precomputed crop-advice catalogue for ``/api/mchatbot/crop-advice``.
+
+``MultilingualAgriChatbot.get_crop_specific_advice`` only answers five fixed
+query types for a bounded set of crops in 11 languages, so the whole
+crop x type x language matrix is generated ahead of time and stored in the
+``crop_advice_catalogue`` Mongo collection. Requests are then served from an
+in-process LRU / Mongo lookup; Gemini is only called live for cells that are
+not in the catalogue yet, and those answers are stored too. Crops outside the
+catalogue crop list and unsupported languages are answered live and never
+stored, so arbitrary user input cannot grow the catalogue (or the refresh job).
+
+Build the catalogue offline (resumable; existing fresh entries are skipped):
+
+    python crop_advice_catalogue.py build [--crops rice,wheat] [--languages hi,mr] [--force]
+
+A background job (``CROP_ADVICE_REFRESH``, on by default) regenerates a few
+entries older than ``CROP_ADVICE_MAX_AGE_DAYS`` every ``CROP_ADVICE_REFRESH_HOURS``.
+"""
+import os
+import re
+import sys
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from database import get_collection
+from leader_lease import leader_lease
+from metrics import metrics
+
+QUERY_TYPES = ('fertilizer', 'disease', 'irrigation', 'harvest', 'general')
+
+# Crops known to the yield model (colab_rf_model_meta.json encoders), minus
+# aggregate categories such as "oilseeds total" or "other kharif pulses".
+DEFAULT_CROPS = (
+    'arecanut', 'arhar/tur', 'bajra', 'banana', 'barley', 'black pepper', 'cardamom', 'cashewnut',
+    'castor seed', 'coconut', 'coriander', 'cotton', 'cowpea', 'dry chillies', 'garlic', 'ginger',
+    'gram', 'groundnut', 'guar seed', 'horse-gram', 'jowar', 'jute', 'khesari', 'linseed', 'maize',
+    'masoor', 'mesta', 'moong', 'moth', 'niger seed', 'onion', 'peas & beans', 'potato', 'ragi',
+    'rapeseed & mustard', 'rice', 'safflower', 'sannhamp', 'sesamum', 'small millets', 'soyabean',
+    'sugarcane', 'sunflower', 'sweet potato', 'tapioca', 'tobacco', 'turmeric', 'urad', 'wheat'
+)
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_crop(crop: str) -> str:
+    return _WHITESPACE.sub(' ', (crop or '').strip().lower())
+
+
+def normalize_query_type(query_type: str) -> str:
+    query_type = (query_type or '').strip().lower()
+    return query_type if query_type in QUERY_TYPES else 'general'
+
+
+class CropAdviceCatalogue:
+    COLLECTION = 'crop_advice_catalogue'
+
+    def __init__(self):
+        self.max_age = timedelta(days=float(os.environ.get('CROP_ADVICE_MAX_AGE_DAYS', 30)))
+        self.l1_size = int(os.environ.get('CROP_ADVICE_L1_SIZE', 4096))
+        configured = os.environ.get('CROP_ADVICE_CROPS')
+        self.crops = tuple(normalize_crop(c) for c in configured.split(',') if c.strip()) if configured else DEFAULT_CROPS
+        self._l1: OrderedDict[tuple, dict] = OrderedDict()
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+        self._collection = None
+        try:
+            collection = get_collection(self.COLLECTION)
+            collection.create_index([('crop', 1), ('query_type', 1), ('language', 1)], unique=True)
+            collection.create_index('generated_at')
+            self._collection = collection
+        except Exception as e:
+            print(f"[CropAdviceCatalogue] Mongo store unavailable, serving live only: {e}")
+
+    # ------------------------------------------------------------------
+    # Lookup / store
+    # ------------------------------------------------------------------
+    def accepts(self, crop: str, language: str, languages) -> bool:
+        """Whether a cell belongs in the catalogue: a catalogue crop in one of ``languages``."""
+        return normalize_crop(crop) in self.crops and language in languages
+
+    def get(self, crop: str, query_type: str, language: str) -> dict | None:
+        key = (normalize_crop(crop), normalize_query_type(query_type), language)
+        with self._lock:
+            entry = self._l1.get(key)
+            if entry is not None:
+                self._l1.move_to_end(key)
+                metrics.incr('crop_advice.l1_hits')
+                return entry
+        if self._collection is not None:
+            try:
+                doc = self._collection.find_one(
+                    {'crop': key[0], 'query_type': key[1], 'language': key[2]}, {'_id': 0}
+                )
+                if doc:
+                    self._put_l1(key, doc)
+                    metrics.incr('crop_advice.l2_hits')
+                    return doc
+            except Exception as e:
+                metrics.incr('crop_advice.errors')
+                print(f"[CropAdviceCatalogue] lookup failed: {e}")
+        metrics.incr('crop_advice.misses')
+        return None
+
+    @staticmethod
+    def _entry(crop: str, query_type: str, language: str, advice: dict) -> dict:
+        return {
+            'crop': normalize_crop(crop),
+            'query_type': normalize_query_type(query_type),
+            'language': language,
+            'response': advice['response'],
+            'language_name': advice.get('language_name'),
+            'original_query': advice.get('original_query'),
+            'generated_at': datetime.utcnow()
+        }
+
+    def store(self, crop: str, query_type: str, language: str, advice: dict) -> dict:
+        doc = self._entry(crop, query_type, language, advice)
+        key = (doc['crop'], doc['query_type'], doc['language'])
+        self._put_l1(key, doc)
+        if self._collection is not None:
+            try:
+                self._collection.update_one(
+                    {'crop': key[0], 'query_type': key[1], 'language': key[2]},
+                    {'$set': doc}, upsert=True
+                )
+            except Exception as e:
+                metrics.incr('crop_advice.errors')
+                print(f"[CropAdviceCatalogue] store failed: {e}")
+        return doc
+
+    def is_fresh(self, doc: dict | None) -> bool:
+        return bool(doc) and datetime.utcnow() - doc['generated_at'] < self.max_age
+
+    def _put_l1(self, key: tuple, doc: dict):
+        with self._lock:
+            self._l1[key] = doc
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.l1_size:
+                self._l1.popitem(last=False)
+
+    # ------------------------------------------------------------------
+    # Generation
+    # ------------------------------------------------------------------
+    def generate(self, chatbot, crop: str, query_type: str, language: str, store: bool = True) -> tuple[dict | None, dict]:
+        """Ask Gemini for one cell; returns ``(entry, advice)``.
+
+        ``entry`` is None when generation failed (``advice`` is then the chatbot's
+        error payload). Failed generations, and any with ``store=False``, are not stored.
+        """
+        advice = chatbot.generate_crop_advice(crop, normalize_query_type(query_type), language)
+        if advice.get('error') or not advice.get('response'):
+            metrics.incr('crop_advice.generation_errors')
+            return None, advice
+        metrics.incr('crop_advice.generated')
+        if not store:
+            return self._entry(crop, query_type, language, advice), advice
+        return self.store(crop, query_type, language, advice), advice
+
+    def build(self, chatbot, crops=None, languages=None, force: bool = False) -> dict:
+        """Fill the catalogue matrix; skips cells that are already fresh unless ``force``."""
+        crops = [normalize_crop(c) for c in (crops or self.crops)]
+        languages = list(languages or chatbot.supported_languages.keys())
+        summary = {'generated': 0, 'skipped': 0, 'failed': 0}
+        for crop in crops:
+            for query_type in QUERY_TYPES:
+                for language in languages:
+                    if not force and self.is_fresh(self.get(crop, query_type, language)):
+                        summary['skipped'] += 1
+                        continue
+                    if self.generate(chatbot, crop, query_type, language)[0]:
+                        summary['generated'] += 1
+                    else:
+                        summary['failed'] += 1
+        return summary
+
+    def refresh_stale(self, chatbot, limit: int) -> int:
+        """Regenerate up to ``limit`` of the oldest catalogue entries past ``max_age``."""
+        if self._collection is None:
+            return 0
+        cutoff = datetime.utcnow() - self.max_age
+        refreshed = 0
+        try:
+            stale = list(self._collection.find(
+                {'generated_at': {'$lt': cutoff}, 'crop': {'$in': list(self.crops)},
+                 'language': {'$in': list(chatbot.supported_languages)}},
+                {'crop': 1, 'query_type': 1, 'language': 1}
+            ).sort('generated_at', 1).limit(limit))
+        except Exception as e:
+            print(f"[CropAdviceCatalogue] stale scan failed: {e}")
+            return 0
+        for doc in stale:
+            if self.generate(chatbot, doc['crop'], doc['query_type'], doc['language'])[0]:
+                refreshed += 1
+        metrics.incr('crop_advice.refreshed', refreshed)
+        return refreshed
+
+    def start_background_refresh(self, chatbot):
+        """Periodically refresh stale entries in a daemon thread (idempotent)."""
+        if self._refresh_thread is not None or self._collection is None:
+            return
+        if os.environ.get('CROP_ADVICE_REFRESH', 'true').lower() not in ('1', 'true', 'yes'):
+            return
+        interval = float(os.environ.get('CROP_ADVICE_REFRESH_HOURS', 24)) * 3600
+        batch = int(os.environ.get('CROP_ADVICE_REFRESH_BATCH', 50))
+
+        # One refresher cluster-wide; the others serve what it writes to Mongo
+        lease = leader_lease('crop-advice-refresh')
+
+        def run():
+            while True:
+                time.sleep(interval)
+                if not lease.is_leader():
+                    continue
+                try:
+                    count = self.refresh_stale(chatbot, batch)
+                    if count:
+                        print(f"[CropAdviceCatalogue] refreshed {count} stale entries")
+                except Exception as e:
+                    print(f"[CropAdviceCatalogue] refresh failed: {e}")
+
+        self._refresh_thread = threading.Thread(target=run, daemon=True, name='crop-advice-refresh')
+        self._refresh_thread.start()
+
+    def stats(self) -> dict:
+        with self._lock:
+            l1_entries = len(self._l1)
+        entries = None
+        if self._collection is not None:
+            try:
+                entries = self._collection.estimated_document_count()
+            except Exception:
+                pass
+        return {
+            'entries': entries,
+            'matrix_size': len(self.crops) * len(QUERY_TYPES) * 11,
+            'l1_entries': l1_entries,
+            'l1_hits': metrics.counter('crop_advice.l1_hits'),
+            'l2_hits': metrics.counter('crop_advice.l2_hits'),
+            'misses': metrics.counter('crop_advice.misses'),
+            'generated': metrics.counter('crop_advice.generated'),
+            'refreshed': metrics.counter('crop_advice.refreshed'),
+            'max_age_days': self.max_age.days
+        }
+
+
+# Global instance
+crop_advice_catalogue = CropAdviceCatalogue()
+
+
+def main(argv=None):
+    import argparse
+    from dotenv import load_dotenv
+    from multilingual_chatbot import MultilingualAgriChatbot
+
+    parser = argparse.ArgumentParser(description='Build or refresh the crop-advice catalogue.')
+    parser.add_argument('command', choices=['build', 'refresh'])
+    parser.add_argument('--crops', help='Comma-separated crops (default: catalogue crop list)')
+    parser.add_argument('--languages', help='Comma-separated language codes (default: all supported)')
+    parser.add_argument('--force', action='store_true', help='Regenerate entries that are still fresh')
+    parser.add_argument('--limit', type=int, default=500, help='Max entries for the refresh command')
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    api_key = os.environ.get('GEMINI_API_KEY')
+    if not api_key:
+        print('GEMINI_API_KEY is required to generate advice.')
+        return 1
+    chatbot = MultilingualAgriChatbot(api_key)
+    if args.command == 'build':
+        crops = args.crops.split(',') if args.crops else None
+        languages = args.languages.split(',') if args.languages else None
+        print(crop_advice_catalogue.build(chatbot, crops, languages, force=args.force))
+    else:
+        print(f"Refreshed {crop_advice_catalogue.refresh_stale(chatbot, args.limit)} entries")
+    return 0
+
+
+__all__ = ["crop_advice_catalogue", "CropAdviceCatalogue", "QUERY_TYPES"]
+
+if __name__ == '__main__':
+    sys.exit(main())
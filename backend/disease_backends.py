@@ -0,0 +1,202 @@
+"""Inference backends for the disease model.
+
+``DISEASE_MODEL_BACKEND`` selects how ``DiseaseDetector`` runs the CNN:
+
+- ``keras`` (default): ``plant_disease_model.h5`` through full TensorFlow.
+- ``tflite``: a converted ``plant_disease_model.<variant>.tflite`` through the
+  TFLite interpreter. ``DISEASE_TFLITE_VARIANT`` picks ``fp16`` (default) or
+  ``int8`` (dynamic-range quantized). The interpreter comes from
+  ``tflite_runtime`` or ``ai_edge_litert`` when installed, so web workers do not
+  import TensorFlow at all. Full ``tf.lite`` is only a fallback.
+- ``remote``: no model in the web process. Batches go over a Unix socket
+  (``DISEASE_INFERENCE_SOCKET``) to ``disease_inference_server.py``, which
+  owns the model. Images travel as uint8 (4x smaller than float32, and
+  lossless because inputs are 8-bit).
+
+Build the ``.tflite`` files with ``python convert_disease_model.py`` and compare
+the backends with ``python benchmarks/disease_backends.py``.
+
+Every backend exposes ``predict_batch(float32 [N, 224, 224, 3]) -> [N, classes]``
+and ``release()``.
+"""
+import os
+import queue
+import threading
+from multiprocessing.connection import Client
+
+import numpy as np
+
+DISEASE_MODEL_BACKENDS = ('keras', 'tflite', 'remote')
+TFLITE_VARIANTS = ('fp16', 'int8')
+DEFAULT_INFERENCE_SOCKET = '/tmp/yieldwise-disease-inference.sock'
+
+
+class ModelUnavailable(RuntimeError):
+    """The model file is missing, fails its hash check or could not be loaded
+    (or the inference server cannot serve it)."""
+
+
+def inference_socket() -> str:
+    return os.environ.get('DISEASE_INFERENCE_SOCKET', DEFAULT_INFERENCE_SOCKET)
+
+
+def inference_authkey() -> bytes:
+    return os.environ.get('DISEASE_INFERENCE_AUTHKEY', 'yieldwise-disease-inference').encode('utf-8')
+
+
+def encode_batch(batch: np.ndarray) -> np.ndarray:
+    """float32 [0, 1] -> uint8 (exact for images that came from 8-bit pixels)"""
+    return (np.clip(batch, 0, 1) * 255 + 0.5).astype(np.uint8)
+
+
+def decode_batch(batch: np.ndarray) -> np.ndarray:
+    decoded = batch.astype(np.float32)
+    decoded *= 1.0 / 255
+    return decoded
+
+
+def tflite_path(model_path: str, variant: str) -> str:
+    """``.../plant_disease_model.h5`` -> ``.../plant_disease_model.<variant>.tflite``"""
+    return f'{os.path.splitext(model_path)[0]}.{variant}.tflite'
+
+
+def _interpreter_class():
+    """(Interpreter class, source module name); prefers the TensorFlow-free runtimes."""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter, 'tflite_runtime'
+    except ImportError:
+        pass
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter, 'ai_edge_litert'
+    except ImportError:
+        pass
+    print("[disease_backends] tflite_runtime not installed; falling back to tf.lite (imports TensorFlow)")
+    import tensorflow as tf
+    return tf.lite.Interpreter, 'tensorflow'
+
+
+class KerasBackend:
+    name = 'keras'
+
+    def __init__(self, model_path: str):
+        from tensorflow import keras
+        self.model = keras.models.load_model(model_path)
+        self.runtime = 'tensorflow'
+
+    def predict_batch(self, batch: np.ndarray) -> np.ndarray:
+        # Direct call avoids predict()'s per-call data-adapter setup on small batches
+        return np.asarray(self.model(batch, training=False))
+
+    def release(self):
+        self.model = None
+        try:
+            import tensorflow as tf
+            tf.keras.backend.clear_session()
+        except Exception:
+            pass
+
+
+class TFLiteBackend:
+    name = 'tflite'
+
+    def __init__(self, model_path: str, num_threads: int | None = None):
+        interpreter_class, self.runtime = _interpreter_class()
+        self.interpreter = interpreter_class(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = int(self._input['shape'][0])
+        # An interpreter is not thread-safe (warmup and the batcher may overlap)
+        self._lock = threading.Lock()
+
+    def predict_batch(self, batch: np.ndarray) -> np.ndarray:
+        batch = np.ascontiguousarray(batch, dtype=self._input['dtype'])
+        with self._lock:
+            if batch.shape[0] != self._batch_size:
+                self.interpreter.resize_tensor_input(self._input['index'], batch.shape, strict=False)
+                self.interpreter.allocate_tensors()
+                self._input = self.interpreter.get_input_details()[0]
+                self._output = self.interpreter.get_output_details()[0]
+                self._batch_size = batch.shape[0]
+            self.interpreter.set_tensor(self._input['index'], batch)
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self._output['index']).copy()
+
+    def release(self):
+        self.interpreter = None
+
+
+class RemoteBackend:
+    """Client for ``disease_inference_server.py`` with a small pool of connections."""
+    name = 'remote'
+    runtime = 'remote'
+
+    def __init__(self, address: str, authkey: bytes, timeout: float = 30):
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self.info = self._call('info')
+
+    def _connect(self):
+        try:
+            return Client(self.address, family='AF_UNIX', authkey=self.authkey)
+        except (OSError, EOFError) as e:
+            raise ModelUnavailable(f'Disease inference server unreachable at {self.address}: {e}')
+
+    def _call(self, op: str, payload=None):
+        for attempt in (1, 2):
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            try:
+                conn.send((op, payload))
+                answered = conn.poll(self.timeout)
+                if answered:
+                    status, body = conn.recv()
+            except (EOFError, OSError):
+                # Stale pooled connection (server restarted): retry once on a fresh one
+                conn.close()
+                if attempt == 2:
+                    raise ModelUnavailable(f'Lost connection to disease inference server at {self.address}')
+                continue
+            if not answered:
+                # The reply may still arrive later; never hand this connection out again
+                conn.close()
+                raise ModelUnavailable(f'Disease inference server did not answer within {self.timeout}s')
+            self._idle.put(conn)
+            if status == 'ok':
+                return body
+            if status == 'unavailable':
+                raise ModelUnavailable(body)
+            raise RuntimeError(f'Disease inference server error: {body}')
+
+    def predict_batch(self, batch: np.ndarray) -> np.ndarray:
+        return np.asarray(self._call('predict', encode_batch(batch)))
+
+    def release(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def create_backend(name: str, model_path: str):
+    if name == 'remote':
+        return RemoteBackend(inference_socket(), inference_authkey(),
+                             float(os.environ.get('DISEASE_INFERENCE_TIMEOUT_SECONDS', 30)))
+    if name == 'tflite':
+        threads = os.environ.get('DISEASE_TFLITE_THREADS')
+        return TFLiteBackend(model_path, int(threads) if threads else None)
+    return KerasBackend(model_path)
+
+
+__all__ = [
+    "DISEASE_MODEL_BACKENDS", "TFLITE_VARIANTS", "ModelUnavailable", "tflite_path", "create_backend",
+    "KerasBackend", "TFLiteBackend", "RemoteBackend", "inference_socket", "inference_authkey",
+    "encode_batch", "decode_batch"
+]
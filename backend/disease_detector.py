@@ -1,233 +1,647 @@
-import tensorflow as tf
-from tensorflow import keras
+"""Plant disease classification with a CNN (Keras or TFLite, see ``disease_backends``).
+
+``DISEASE_MODEL_POLICY`` trades memory for latency:
+
+- ``resident`` (default): the model is loaded once per worker process, warmed
+  with a dummy batch (``warmup``, started in the background at app start) and
+  kept in memory. Requests only pay the forward pass.
+- ``unload``: the previous behaviour, for memory-constrained hosts. The model is
+  loaded for each request and released afterwards (``clear_session`` + ``gc``),
+  so every request pays deserialization and graph tracing.
+
+TensorFlow is imported only when the Keras backend loads the model;
+``DISEASE_MODEL_BACKEND=tflite`` runs a quantized ``.tflite`` file instead, and
+``DISEASE_MODEL_BACKEND=remote`` hands batches to ``disease_inference_server.py``
+so web workers hold no model at all (the server checks the model file).
+
+Load, warmup and inference timings go to the metrics registry
+(``disease.load_ms``, ``disease.warmup_ms``, ``disease.inference_ms``).
+
+The model file is produced ahead of time (``python download_plant_model.py``,
+the build command) and never created on the request path. A missing file, or
+one whose SHA-256 does not match ``DISEASE_MODEL_SHA256`` / the
+``<model>.sha256`` sidecar, makes requests fail fast with 503. The state is
+reported on ``/api/health``.
+
+With the resident policy, concurrent requests are micro-batched (see
+``inference_batcher``): up to ``DISEASE_BATCH_MAX_SIZE`` images (default 8)
+collected for at most ``DISEASE_BATCH_MAX_WAIT_MS`` (default 5) share one
+forward pass. ``DISEASE_BATCH_MAX_SIZE=1`` disables batching. A request with
+no other request in flight in the same process runs inline without waiting,
+which is every request under the default sync gunicorn workers; batches form
+under threaded workers (``gunicorn --threads``) and in the inference server.
+
+Scores are cached by perceptual hash (``image_hash_cache``), so re-uploads of
+the same or a lightly recompressed photo skip the model.
+"""
 import numpy as np
 from PIL import Image
 import io
 import base64
 import os
+import gc
 import json
+import time
+import zipfile
+import hashlib
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import metrics
+from inference_batcher import MicroBatcher, BatcherOverloaded
+from image_hash_cache import image_hash_cache, dhash, thumbnail
+from disease_backends import (
+    DISEASE_MODEL_BACKENDS, TFLITE_VARIANTS, ModelUnavailable, tflite_path, create_backend, inference_socket
+)
+
+DISEASE_MODEL_POLICIES = ('resident', 'unload')
+INPUT_SHAPE = (224, 224, 3)
+CLASS_NAMES = (
+    'Apple___Apple_scab',
+    'Apple___Black_rot',
+    'Apple___Cedar_apple_rust',
+    'Apple___healthy',
+    'Corn_(maize)___Cercospora_leaf_spot Gray_leaf_spot',
+    'Corn_(maize)___Common_rust_',
+    'Corn_(maize)___Northern_Leaf_Blight',
+    'Corn_(maize)___healthy',
+    'Tomato___Bacterial_spot',
+    'Tomato___Early_blight',
+    'Tomato___Late_blight',
+    'Tomato___Leaf_Mold',
+    'Tomato___healthy'
+)
+DEFAULT_MODEL_PATH = os.path.normpath(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'model', 'plant_disease_model.h5')
+)
+MODEL_BUILD_HINT = ("Run 'python download_plant_model.py' in backend/ (the build command) to build it, "
+                    "or '--hash-only' to pin a model you supplied.")
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp', '.tif', '.tiff')
+SEVERITY_LEVELS = ('None', 'Low', 'Medium', 'High')
+MIN_PLANT_LIKELIHOOD = 0.12
+
+
+def extract_zip_images(data: bytes, max_images: int, max_total_bytes: int) -> list[tuple[str, bytes]]:
+    """``(name, bytes)`` for each image file in a zip upload, in archive order.
+
+    Directories, non-image files and macOS resource forks are skipped. Raises
+    ``ValueError`` if the archive holds more than ``max_images`` images or more
+    than ``max_total_bytes`` uncompressed (zip-bomb guard).
+    """
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile as e:
+        raise ValueError(f'Invalid zip archive: {e}')
+    with archive:
+        members = [
+            info for info in archive.infolist()
+            if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS)
+            and '__MACOSX/' not in info.filename and not os.path.basename(info.filename).startswith('._')
+        ]
+        if len(members) > max_images:
+            raise ValueError(f'Archive holds {len(members)} images; at most {max_images} per request')
+        if sum(info.file_size for info in members) > max_total_bytes:
+            raise ValueError(f'Archive expands beyond {max_total_bytes // (1024 * 1024)} MB')
+        return [(info.filename, archive.read(info)) for info in members]
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_sidecar_path(model_path: str) -> str:
+    return model_path + '.sha256'
+
+
+def write_hash_sidecar(model_path: str) -> str:
+    """Pin ``model_path`` by writing ``<model>.sha256`` (sha256sum format); returns the digest."""
+    digest = file_sha256(model_path)
+    with open(hash_sidecar_path(model_path), 'w', encoding='utf-8') as fh:
+        fh.write(f"{digest}  {os.path.basename(model_path)}\n")
+    return digest
+
+
+def expected_model_hash(model_path: str) -> str | None:
+    """Pinned hash: ``DISEASE_MODEL_SHA256`` if set, else the sidecar written at build time."""
+    pinned = os.environ.get('DISEASE_MODEL_SHA256', '').strip().lower()
+    if pinned:
+        return pinned
+    try:
+        with open(hash_sidecar_path(model_path), encoding='utf-8') as fh:
+            # sha256sum format: "<hex>  <filename>"
+            return fh.read().split()[0].lower()
+    except (OSError, IndexError):
+        return None
+
 
 class DiseaseDetector:
-    def __init__(self):
+    def __init__(self, policy: str | None = None, backend: str | None = None):
         self.model = None
-        self.class_names = [
-            'Apple___Apple_scab',
-            'Apple___Black_rot',
-            'Apple___Cedar_apple_rust',
-            'Apple___healthy',
-            'Corn_(maize)___Cercospora_leaf_spot Gray_leaf_spot',
-            'Corn_(maize)___Common_rust_',
-            'Corn_(maize)___Northern_Leaf_Blight',
-            'Corn_(maize)___healthy',
-            'Tomato___Bacterial_spot',
-            'Tomato___Early_blight',
-            'Tomato___Late_blight',
-            'Tomato___Leaf_Mold',
-            'Tomato___healthy'
-        ]
-        self.model_path = os.path.join(os.path.dirname(__file__), '..', 'model', 'plant_disease_model.h5')
+        self.backend = (backend or os.environ.get('DISEASE_MODEL_BACKEND', 'keras')).lower()
+        if self.backend not in DISEASE_MODEL_BACKENDS:
+            print(f"Unknown DISEASE_MODEL_BACKEND '{self.backend}', using 'keras'")
+            self.backend = 'keras'
+        self.tflite_variant = os.environ.get('DISEASE_TFLITE_VARIANT', 'fp16').lower()
+        if self.tflite_variant not in TFLITE_VARIANTS:
+            print(f"Unknown DISEASE_TFLITE_VARIANT '{self.tflite_variant}', using 'fp16'")
+            self.tflite_variant = 'fp16'
+        self.policy = (policy or os.environ.get('DISEASE_MODEL_POLICY', 'resident')).lower()
+        if self.policy not in DISEASE_MODEL_POLICIES:
+            print(f"Unknown DISEASE_MODEL_POLICY '{self.policy}', using 'resident'")
+            self.policy = 'resident'
+        # Serialises load/unload; under the unload policy also the forward pass
+        self._lock = threading.RLock()
+        self._warmup_thread = None
+        self.load_count = 0
+        self.last_load_ms = None
+        self.warmup_ms = None
+        self.load_error = None
+        self.class_names = list(CLASS_NAMES)
+        keras_path = os.environ.get('DISEASE_MODEL_PATH') or DEFAULT_MODEL_PATH
+        if self.backend == 'remote':
+            self.model_path = inference_socket()
+        elif self.backend == 'tflite':
+            self.model_path = tflite_path(keras_path, self.tflite_variant)
+        else:
+            self.model_path = keras_path
+        # What the inference server reported on connect (remote backend only)
+        self.remote_info = None
         self.confidence_threshold = 0.7
-        
-    def create_sample_model(self):
-        """Create a sample disease detection model if none exists"""
-        print("⚠️  No trained model found. Using basic fallback model.")
-        print("💡 Run 'python download_plant_model.py' to get an enhanced model.")
-        
-        try:
-            # Create a simple CNN model for demonstration
-            model = keras.Sequential([
-                keras.layers.Conv2D(32, (3, 3), activation='relu', input_shape=(224, 224, 3)),
-                keras.layers.MaxPooling2D(2, 2),
-                keras.layers.Conv2D(64, (3, 3), activation='relu'),
-                keras.layers.MaxPooling2D(2, 2),
-                keras.layers.Conv2D(128, (3, 3), activation='relu'),
-                keras.layers.MaxPooling2D(2, 2),
-                keras.layers.Flatten(),
-                keras.layers.Dropout(0.5),
-                keras.layers.Dense(512, activation='relu'),
-                keras.layers.Dense(len(self.class_names), activation='softmax')
-            ])
-            
-            model.compile(
-                optimizer='adam',
-                loss='categorical_crossentropy',
-                metrics=['accuracy']
+        # Integrity check results, cached per (mtime, size) of the model file
+        self.model_status = 'unchecked'
+        self.model_sha256 = None
+        self._checked_stat = None
+        self.require_hash = os.environ.get('DISEASE_MODEL_REQUIRE_HASH', 'false').lower() in ('1', 'true', 'yes')
+        self.batch_timeout = float(os.environ.get('DISEASE_BATCH_TIMEOUT_SECONDS', 30))
+        self.max_image_pixels = int(os.environ.get('DISEASE_MAX_IMAGE_PIXELS', 50_000_000))
+        self.preprocess_workers = int(os.environ.get('DISEASE_PREPROCESS_WORKERS', min(4, os.cpu_count() or 1)))
+        self._preprocess_pool = None
+        batch_size = int(os.environ.get('DISEASE_BATCH_MAX_SIZE', 8))
+        self.batcher = None
+        if self.policy == 'resident' and batch_size > 1:
+            self.batcher = MicroBatcher(
+                self._run_batch, 'disease.batch',
+                max_batch_size=batch_size,
+                max_wait_ms=float(os.environ.get('DISEASE_BATCH_MAX_WAIT_MS', 5)),
+                max_queue=int(os.environ.get('DISEASE_BATCH_MAX_QUEUE', 64))
             )
-            
-            # Create more diverse dummy training data
-            dummy_x = np.random.random((200, 224, 224, 3))
-            # Add some structure to make predictions more varied
-            for i in range(200):
-                # Add different patterns based on intended class
-                class_idx = i % len(self.class_names)
-                if 'healthy' in self.class_names[class_idx]:
-                    # Healthy plants - more green, less noise
-                    dummy_x[i, :, :, 1] += 0.3  # More green
-                else:
-                    # Diseased plants - more brown/yellow, more noise
-                    dummy_x[i, :, :, 0] += 0.2  # More red
-                    dummy_x[i, :, :, 2] += 0.1  # Less blue
-                    dummy_x[i] += np.random.normal(0, 0.1, (224, 224, 3))
-            
-            dummy_x = np.clip(dummy_x, 0, 1)  # Keep values in valid range
-            dummy_y = keras.utils.to_categorical(
-                np.random.randint(0, len(self.class_names), 200), 
-                len(self.class_names)
-            )
-            
-            # Train with more epochs for better diversity
-            model.fit(dummy_x, dummy_y, epochs=3, verbose=0)
-            
-            # Save the model
-            os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
-            model.save(self.model_path)
-            
-            print("✅ Basic fallback model created successfully")
-            return True
-        except Exception as e:
-            print(f"Error creating sample model: {e}")
-            return False
-    
 
-    def load_model(self):
-        """Load the disease detection model (lazy load)."""
+    def check_model(self) -> str:
+        """Verify the model file against its pinned hash.
+
+        Returns one of ``ok``, ``unverified`` (no hash pinned), ``missing``,
+        ``hash_mismatch`` or ``error``; ``remote`` when the inference server
+        owns the file (it runs this check itself).
+        """
+        if self.backend == 'remote':
+            self.model_status = 'remote'
+            return self.model_status
         try:
-            if not os.path.exists(self.model_path):
-                print("Model not found, creating sample model...")
-                if not self.create_sample_model():
-                    return False
-            import tensorflow as tf
-            from tensorflow import keras
-            self.model = keras.models.load_model(self.model_path)
+            stat = os.stat(self.model_path)
+        except FileNotFoundError:
+            self.model_status, self.model_sha256, self._checked_stat = 'missing', None, None
+            self.load_error = f"Disease model not found at {self.model_path}. {MODEL_BUILD_HINT}"
+            return self.model_status
+        except OSError as e:
+            self.model_status, self.load_error = 'error', str(e)
+            return self.model_status
+        key = (stat.st_mtime_ns, stat.st_size)
+        if key == self._checked_stat:
+            return self.model_status
+        self.model_sha256 = file_sha256(self.model_path)
+        self.load_error = None
+        expected = expected_model_hash(self.model_path)
+        if expected is None:
+            self.model_status = 'hash_mismatch' if self.require_hash else 'unverified'
+            if self.require_hash:
+                self.load_error = f"No pinned hash for {self.model_path} and DISEASE_MODEL_REQUIRE_HASH is set."
+        elif expected != self.model_sha256:
+            self.model_status = 'hash_mismatch'
+            self.load_error = (f"Disease model hash mismatch (expected {expected[:12]}…, "
+                               f"got {self.model_sha256[:12]}…). {MODEL_BUILD_HINT}")
+        else:
+            self.model_status = 'ok'
+        self._checked_stat = key
+        if self.model_status != 'ok':
+            print(f"[DiseaseDetector] model {self.model_status}: {self.load_error or self.model_path}")
+        return self.model_status
+
+    def is_available(self) -> bool:
+        return self.check_model() in ('ok', 'unverified', 'remote')
+
+    def load_model(self):
+        """Load the disease detection model (no-op if already loaded)."""
+        with self._lock:
+            if self.model is not None:
+                return True
+            if not self.is_available():
+                return False
+            try:
+                started = time.perf_counter()
+                self.model = create_backend(self.backend, self.model_path)
+                if self.backend == 'remote':
+                    self.remote_info = self.model.info
+                    self.model_sha256 = self.remote_info.get('sha256')
+                self.last_load_ms = (time.perf_counter() - started) * 1000
+                self.load_count += 1
+                self.load_error = None
+                metrics.observe('disease.load_ms', self.last_load_ms)
+                return True
+            except Exception as e:
+                self.load_error = str(e)
+                print(f"Error loading model: {e}")
+                return False
+
+    def unload_model(self):
+        """Release the model (and the Keras graph state)."""
+        with self._lock:
+            if self.model is None:
+                return
+            model, self.model = self.model, None
+            model.release()
+            gc.collect()
+
+    def warmup(self) -> bool:
+        """Load the model and run one dummy batch so the first request skips tracing."""
+        with self._lock:
+            if not self.load_model():
+                return False
+            started = time.perf_counter()
+            self._forward(np.zeros((1, *INPUT_SHAPE), dtype=np.float32))
+            self.warmup_ms = (time.perf_counter() - started) * 1000
+            metrics.observe('disease.warmup_ms', self.warmup_ms)
+            print(f"[DiseaseDetector] model warm (load {self.last_load_ms:.0f} ms, warmup {self.warmup_ms:.0f} ms)")
             return True
-        except Exception as e:
-            print(f"Error loading model: {e}")
-            return False
-    
+
+    def start_background_warmup(self):
+        """Check the model file now; warm the resident model in a daemon thread.
+
+        Idempotent; the warmup is skipped under the unload policy or when the
+        model file is missing or fails its hash check.
+        """
+        if not self.is_available() or self.policy != 'resident' or self._warmup_thread is not None:
+            return
+        if os.environ.get('DISEASE_MODEL_WARMUP', 'true').lower() not in ('1', 'true', 'yes'):
+            return
+        self._warmup_thread = threading.Thread(target=self.warmup, daemon=True, name='disease-model-warmup')
+        self._warmup_thread.start()
+
+    def _forward(self, batch):
+        return self.model.predict_batch(batch)
+
     def preprocess_image(self, image_data):
         """Preprocess image for model prediction.
 
         Accepts either a base64 string (optionally prefixed with data URI) or raw bytes.
-        Returns: (image_array, plant_likelihood)
+        JPEGs are decoded at reduced scale (PIL draft mode, never below the model
+        input size), other formats are shrunk with ``reducing_gap``. Images above
+        ``DISEASE_MAX_IMAGE_PIXELS`` are rejected before decoding.
+        Returns: (float32 image_array of shape (1, 224, 224, 3), plant_likelihood)
         """
         try:
-            # If bytes provided convert to base64 handling uniformly
-            if isinstance(image_data, bytes):
-                image_bytes = image_data
-            else:
-                if image_data.startswith('data:image'):
-                    # Remove data URL prefix
-                    image_data = image_data.split(',')[1]
-                image_bytes = base64.b64decode(image_data)
-
-            image = Image.open(io.BytesIO(image_bytes))
+            pixels = self.resize_image(self.decode_image(image_data))
+            # Heuristic runs on the downscaled pixels, not the full-resolution photo
+            plant_likelihood = self._estimate_plant_likelihood(pixels)
 
-            # Convert to RGB if necessary
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
+            image_array = pixels.astype(np.float32)
+            image_array *= 1.0 / 255
+            return image_array[None], plant_likelihood
+        except Exception as e:
+            raise ValueError(f"Error preprocessing image: {e}")
 
-            # Compute a simple "plant likelihood" heuristic on original (or current) image
-            plant_likelihood = self._estimate_plant_likelihood(image)
+    def decode_image(self, image_data) -> Image.Image:
+        """Decode bytes / base64 into an RGB image, at reduced scale for JPEGs (first stage of ``preprocess_image``)."""
+        if isinstance(image_data, (bytes, bytearray, memoryview)):
+            image_bytes = image_data
+        else:
+            if image_data.startswith('data:image'):
+                # Remove data URL prefix
+                image_data = image_data.partition(',')[2]
+            image_bytes = base64.b64decode(image_data)
 
-            # Resize to model input size
-            image_resized = image.resize((224, 224))
+        image = Image.open(io.BytesIO(image_bytes))
+        width, height = image.size  # header only; pixels are not decoded yet
+        if width * height > self.max_image_pixels:
+            raise ValueError(f"image is {width}x{height}; at most {self.max_image_pixels // 1_000_000} MP is accepted")
 
-            # Convert to array and normalize
-            image_array = np.array(image_resized) / 255.0
-            image_array = np.expand_dims(image_array, axis=0)
+        # JPEG: decode at 1/2, 1/4 or 1/8 scale while staying >= the target size
+        image.draft('RGB', (INPUT_SHAPE[1], INPUT_SHAPE[0]))
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.load()
+        return image
 
-            return image_array, plant_likelihood
-        except Exception as e:
-            raise ValueError(f"Error preprocessing image: {e}")
+    def resize_image(self, image: Image.Image) -> np.ndarray:
+        """Decoded RGB image -> uint8 ``(224, 224, 3)`` model input."""
+        return np.asarray(image.resize((INPUT_SHAPE[1], INPUT_SHAPE[0]), reducing_gap=3.0), dtype=np.uint8)
 
     def _estimate_plant_likelihood(self, image):
         """Estimate how likely the image contains plant foliage.
 
         Heuristic: proportion of pixels where green channel dominates red & blue and is above a brightness threshold.
+        Accepts a PIL image or a uint8 RGB array; int16 arithmetic avoids uint8 overflow.
         Returns float in [0,1].
         """
         try:
-            np_img = np.array(image)
-            if len(np_img.shape) != 3 or np_img.shape[2] < 3:
+            np_img = np.asarray(image)
+            if np_img.ndim != 3 or np_img.shape[2] < 3:
                 return 0.0
-            r = np_img[:, :, 0].astype(np.int32)
-            g = np_img[:, :, 1].astype(np.int32)
-            b = np_img[:, :, 2].astype(np.int32)
+            r = np_img[:, :, 0].astype(np.int16)
+            g = np_img[:, :, 1].astype(np.int16)
+            b = np_img[:, :, 2].astype(np.int16)
             green_dom = (g > r + 5) & (g > b + 5) & (g > 60)
-            plant_likelihood = float(green_dom.mean())
-            return plant_likelihood
+            return float(green_dom.mean())
         except Exception:
             return 0.0
     
     def predict_disease(self, image_data):
-        """Predict plant disease from image (lazy load and unload model)."""
+        """Predict plant disease from an image (see DISEASE_MODEL_POLICY)."""
         try:
-            # Lazy load model only when needed
-            if self.model is None:
-                if not self.load_model():
-                    return {
-                        'success': False,
-                        'error': 'Failed to load disease detection model'
-                    }
-            # Preprocess image & estimate plant likelihood
+            if not self.is_available():
+                return {
+                    'success': False,
+                    'error': self.load_error,
+                    'model_status': self.model_status
+                }
+            # Preprocess image & estimate plant likelihood (no model needed)
             processed_image, plant_likelihood = self.preprocess_image(image_data)
             # Reject if plant likelihood too low
-            if plant_likelihood < 0.12:  # threshold can be tuned
+            if plant_likelihood < MIN_PLANT_LIKELIHOOD:
                 return {
                     'success': False,
                     'error': 'Image does not appear to contain a plant. Please upload a clear plant image (leaves, stem, fruit).',
                     'plant_likelihood': plant_likelihood
                 }
-            # Make prediction
-            predictions = self.model.predict(processed_image, verbose=0)
-            predicted_class_index = np.argmax(predictions[0])
-            confidence = float(predictions[0][predicted_class_index])
-            # Get predicted class name
-            predicted_class = self.class_names[predicted_class_index]
-            # Extract plant type and condition
-            parts = predicted_class.split('___')
-            plant_type = parts[0].replace('_', ' ')
-            condition = parts[1].replace('_', ' ') if len(parts) > 1 else 'Unknown'
-            # Get top 3 predictions
-            top_3_indices = np.argsort(predictions[0])[-3:][::-1]
-            top_3_predictions = [
-                {
-                    'class': self.class_names[i],
-                    'plant_type': self.class_names[i].split('___')[0].replace('_', ' '),
-                    'confidence': float(predictions[0][i])
+            [scores], [cache_hit] = self._cached_scores(processed_image)
+            result = self._build_result(scores, plant_likelihood)
+            result['cache'] = cache_hit
+            return result
+
+        except ModelUnavailable as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'model_status': self.model_status
+            }
+        except BatcherOverloaded as e:
+            return {
+                'success': False,
+                'error': f'Disease detection is busy, please retry shortly ({e})',
+                'model_status': self.model_status,
+                'overloaded': True
+            }
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
+    def predict_disease_batch(self, images: list[tuple[str, object]]) -> dict:
+        """Diagnose many images of one plot: per-image predictions plus a plot-level aggregate.
+
+        ``images`` is a list of ``(name, bytes or base64 str)``. Decoding and
+        preprocessing run in a thread pool; images that pass the plant check
+        go through the model together (micro-batched under the resident policy).
+        """
+        try:
+            if not self.is_available():
+                return {
+                    'success': False,
+                    'error': self.load_error,
+                    'model_status': self.model_status
                 }
-                for i in top_3_indices
-            ]
-            recommendations = self._get_treatment_recommendations(condition, confidence)
+            started = time.perf_counter()
+            results = [{'filename': name} for name, _ in images]
+            arrays, likelihoods, accepted = [], [], []
+            for index, outcome in enumerate(self._preprocess_pool_map([data for _, data in images])):
+                if isinstance(outcome, Exception):
+                    results[index].update(success=False, error=str(outcome))
+                    continue
+                image_array, plant_likelihood = outcome
+                if plant_likelihood < MIN_PLANT_LIKELIHOOD:
+                    results[index].update(success=False, error='Image does not appear to contain a plant.',
+                                          plant_likelihood=plant_likelihood)
+                    continue
+                arrays.append(image_array[0])
+                likelihoods.append(plant_likelihood)
+                accepted.append(index)
+            preprocess_ms = (time.perf_counter() - started) * 1000
 
-            # Unload model after prediction to free memory
-            try:
-                tf.keras.backend.clear_session()
-            except Exception:
-                pass
-            self.model = None
-            import gc
-            gc.collect()
+            inference_started = time.perf_counter()
+            if arrays:
+                scores, cache_hits = self._cached_scores(np.stack(arrays))
+                for index, row, plant_likelihood, cache_hit in zip(accepted, scores, likelihoods, cache_hits):
+                    results[index].update(self._build_result(row, plant_likelihood, recommendations=False))
+                    results[index]['cache'] = cache_hit
+            inference_ms = (time.perf_counter() - inference_started) * 1000
+            metrics.observe('disease.batch_request.images', len(images))
 
+            aggregate = self._aggregate([r for r in results if r.get('success')])
             return {
-                'success': True,
-                'prediction': {
-                    'plant_type': plant_type,
-                    'condition': condition,
-                    'confidence': confidence,
-                    'is_healthy': 'healthy' in condition.lower(),
-                    'severity': self._assess_severity(condition, confidence),
-                    'plant_likelihood': plant_likelihood
-                },
-                'top_predictions': top_3_predictions,
-                'recommendations': recommendations
+                'success': bool(accepted),
+                'error': None if accepted else 'No image could be diagnosed',
+                'results': results,
+                'aggregate': aggregate,
+                'recommendations': self._get_treatment_recommendations(
+                    aggregate['majority_condition'], aggregate['majority_confidence']
+                ) if accepted else None,
+                'timing': {'preprocess_ms': round(preprocess_ms, 1), 'inference_ms': round(inference_ms, 1)}
             }
 
+        except ModelUnavailable as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'model_status': self.model_status
+            }
+        except BatcherOverloaded as e:
+            return {
+                'success': False,
+                'error': f'Disease detection is busy, please retry shortly ({e})',
+                'model_status': self.model_status,
+                'overloaded': True
+            }
         except Exception as e:
             return {
                 'success': False,
                 'error': str(e)
             }
+
+    def _preprocess_pool_map(self, payloads) -> list:
+        def run(data):
+            try:
+                return self.preprocess_image(data)
+            except Exception as e:
+                return e
+
+        if len(payloads) == 1 or self.preprocess_workers <= 1:
+            return [run(data) for data in payloads]
+        if self._preprocess_pool is None:
+            self._preprocess_pool = ThreadPoolExecutor(max_workers=self.preprocess_workers,
+                                                       thread_name_prefix='disease-preprocess')
+        return list(self._preprocess_pool.map(run, payloads))
+
+    @staticmethod
+    def _aggregate(predictions: list[dict]) -> dict:
+        """Plot-level summary: majority condition and severity distribution."""
+        severity = {level: 0 for level in SEVERITY_LEVELS}
+        if not predictions:
+            return {'diagnosed': 0, 'majority_condition': None, 'majority_plant_type': None,
+                    'majority_share': None, 'majority_confidence': None, 'healthy_share': None,
+                    'condition_counts': {}, 'severity_distribution': severity}
+        labels = Counter((p['prediction']['plant_type'], p['prediction']['condition']) for p in predictions)
+        (plant_type, condition), votes = labels.most_common(1)[0]
+        majority = [p['prediction'] for p in predictions
+                    if (p['prediction']['plant_type'], p['prediction']['condition']) == (plant_type, condition)]
+        for p in predictions:
+            severity[p['prediction']['severity']] += 1
+        return {
+            'diagnosed': len(predictions),
+            'majority_condition': condition,
+            'majority_plant_type': plant_type,
+            'majority_share': round(votes / len(predictions), 3),
+            'majority_confidence': round(sum(p['confidence'] for p in majority) / len(majority), 4),
+            'healthy_share': round(sum(p['prediction']['is_healthy'] for p in predictions) / len(predictions), 3),
+            'condition_counts': {f'{plant} - {cond}': count for (plant, cond), count in labels.most_common()},
+            'severity_distribution': severity
+        }
+
+    def model_version(self) -> str:
+        """Cache namespace: backend plus the hash of the model file being served."""
+        if self.backend == 'remote':
+            # The server's own version, so the shared Mongo cache is keyed by the model actually run
+            return self.remote_info['model_version'] if self.remote_info else 'remote:unknown'
+        return f"{self.backend}:{(self.model_sha256 or 'unknown')[:16]}"
+
+    def _cached_scores(self, images):
+        """Scores per image, reusing cached outputs for perceptually identical images.
+
+        Returns ``(scores, cache_info)``; only cache misses reach the model.
+        """
+        if self.backend == 'remote' and self.remote_info is None:
+            self.load_model()
+        version = self.model_version()
+        hashes = [dhash(image) for image in images]
+        thumbs = [thumbnail(image) for image in images]
+        scores, cache_info, misses = [None] * len(images), [None] * len(images), []
+        for i, image_hash in enumerate(hashes):
+            cached = image_hash_cache.lookup(version, image_hash, thumbs[i])
+            if cached is None:
+                misses.append(i)
+                cache_info[i] = {'hit': False}
+            else:
+                scores[i] = np.asarray(cached['scores'], dtype=np.float32)
+                cache_info[i] = {'hit': True, 'distance': cached['distance']}
+        if misses:
+            for i, row in zip(misses, self.predict_scores(images[misses])):
+                scores[i] = row
+                image_hash_cache.store(version, hashes[i], thumbs[i], row)
+        return scores, cache_info
+
+    def predict_scores(self, images):
+        """Class scores for a preprocessed ``(N, 224, 224, 3)`` array, honouring the model policy."""
+        if self.policy == 'unload':
+            with self._lock:
+                try:
+                    return self._run_batch(images)
+                finally:
+                    self.unload_model()
+        if self.batcher is not None:
+            if len(images) == 1:
+                return self.batcher.submit(images[0], timeout=self.batch_timeout)[None]
+            return np.stack(self.batcher.submit_many(images, timeout=self.batch_timeout))
+        return self._run_batch(images)
+
+    def _run_batch(self, batch):
+        if self.model is None:
+            metrics.incr('disease.cold_requests')
+            if not self.load_model():
+                raise ModelUnavailable(f'Failed to load disease detection model: {self.load_error}')
+        started = time.perf_counter()
+        predictions = self._forward(np.asarray(batch, dtype=np.float32))
+        metrics.observe('disease.inference_ms', (time.perf_counter() - started) * 1000)
+        return predictions
+
+    def _build_result(self, scores, plant_likelihood, recommendations=True):
+        predicted_class_index = int(np.argmax(scores))
+        confidence = float(scores[predicted_class_index])
+        # Get predicted class name
+        predicted_class = self.class_names[predicted_class_index]
+        # Extract plant type and condition
+        parts = predicted_class.split('___')
+        plant_type = parts[0].replace('_', ' ')
+        condition = parts[1].replace('_', ' ') if len(parts) > 1 else 'Unknown'
+        # Get top 3 predictions
+        top_3_indices = np.argsort(scores)[-3:][::-1]
+        top_3_predictions = [
+            {
+                'class': self.class_names[i],
+                'plant_type': self.class_names[i].split('___')[0].replace('_', ' '),
+                'confidence': float(scores[i])
+            }
+            for i in top_3_indices
+        ]
+        result = {
+            'success': True,
+            'prediction': {
+                'plant_type': plant_type,
+                'condition': condition,
+                'confidence': confidence,
+                'is_healthy': 'healthy' in condition.lower(),
+                'severity': self._assess_severity(condition, confidence),
+                'plant_likelihood': plant_likelihood
+            },
+            'top_predictions': top_3_predictions
+        }
+        if recommendations:
+            result['recommendations'] = self._get_treatment_recommendations(condition, confidence)
+        return result
+
+    def health(self) -> dict:
+        """Model file and load state for /api/health."""
+        status = self.check_model()
+        if status in ('ok', 'unverified', 'remote'):
+            if self.model is not None:
+                state = 'ready'
+            elif self.policy == 'resident' and self._warmup_thread is not None and self._warmup_thread.is_alive():
+                state = 'warming'
+            elif self.load_error and self.load_count == 0 and self.policy == 'resident' and self._warmup_thread is not None:
+                state = 'error'
+            else:
+                state = 'idle'
+        else:
+            state = 'unavailable'
+        return {
+            'state': state,
+            'model_status': status,
+            'model_path': self.model_path,
+            'sha256': self.model_sha256,
+            'policy': self.policy,
+            'backend': self.backend,
+            'server': self.remote_info,
+            'error': self.load_error if state in ('unavailable', 'error') else None
+        }
+
+    def stats(self) -> dict:
+        return {
+            'policy': self.policy,
+            'backend': self.backend,
+            'runtime': getattr(self.model, 'runtime', None),
+            'model_status': self.model_status,
+            'loaded': self.model is not None,
+            'load_count': self.load_count,
+            'last_load_ms': round(self.last_load_ms, 1) if self.last_load_ms is not None else None,
+            'warmup_ms': round(self.warmup_ms, 1) if self.warmup_ms is not None else None,
+            'load_error': self.load_error,
+            'batching': self.batcher.stats() if self.batcher is not None else None
+        }
     
     def _assess_severity(self, condition, confidence):
         """Assess disease severity based on condition and confidence"""
@@ -297,4 +711,10 @@ class DiseaseDetector:
         return recommendations
 
 # Initialize detector instance
-disease_detector = DiseaseDetector()
\ No newline at end of file
+disease_detector = DiseaseDetector()
+
+__all__ = [
+    "DiseaseDetector", "disease_detector", "DISEASE_MODEL_POLICIES", "CLASS_NAMES", "INPUT_SHAPE",
+    "DEFAULT_MODEL_PATH", "ModelUnavailable", "extract_zip_images", "file_sha256", "hash_sidecar_path",
+    "write_hash_sidecar", "expected_model_hash"
+]
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Out-of-process disease inference server.
+
+Owns the disease model so the web workers do not: each gunicorn worker that
+loads the Keras model holds its own copy of TensorFlow and the weights, while
+with ``DISEASE_MODEL_BACKEND=remote`` the workers send preprocessed batches
+here over a Unix socket (``multiprocessing.connection``, HMAC-authenticated
+with ``DISEASE_INFERENCE_AUTHKEY``) and stay TensorFlow-free.
+
+    python disease_inference_server.py                      # keras, 1 process
+    python disease_inference_server.py --backend tflite --processes 2
+
+Each process loads and warms the model once, handles every connection in its
+own thread, and micro-batches requests from all web workers together
+(``DISEASE_BATCH_MAX_SIZE`` / ``DISEASE_BATCH_MAX_WAIT_MS``). With
+``--processes N`` the processes share one listening socket and a supervisor
+restarts any that die.
+
+Protocol: the client sends ``(op, payload)`` and gets ``(status, body)`` back.
+
+- ``('info', None)`` -> backend, runtime, model version and hash of the server.
+- ``('predict', uint8 [N, 224, 224, 3])`` -> float32 ``[N, classes]`` scores.
+
+``status`` is ``ok``, ``unavailable`` (model missing / failed its hash check,
+mapped to 503 by the web app) or ``error``.
+"""
+import os
+import sys
+import time
+import signal
+import argparse
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener
+
+import numpy as np
+
+from disease_backends import ModelUnavailable, inference_socket, inference_authkey, decode_batch
+
+MAX_BATCH_IMAGES = 256
+INPUT_SHAPE = (224, 224, 3)
+
+
+class InferenceServer:
+    def __init__(self, listener: Listener, backend: str):
+        # Imported here so the supervisor never loads the detector (and TensorFlow) before forking
+        from disease_detector import DiseaseDetector
+
+        self.listener = listener
+        self.detector = DiseaseDetector(policy='resident', backend=backend)
+        self.connections = 0
+
+    def info(self) -> dict:
+        if not self.detector.load_model():
+            raise ModelUnavailable(self.detector.load_error or f'Disease model {self.detector.model_status}')
+        stats = self.detector.stats()
+        return {
+            'backend': self.detector.backend,
+            'runtime': stats['runtime'],
+            'model_version': self.detector.model_version(),
+            'sha256': self.detector.model_sha256,
+            'model_status': self.detector.model_status,
+            'pid': os.getpid()
+        }
+
+    def predict(self, payload) -> np.ndarray:
+        if (not isinstance(payload, np.ndarray) or payload.dtype != np.uint8 or payload.ndim != 4
+                or payload.shape[1:] != INPUT_SHAPE or not 0 < len(payload) <= MAX_BATCH_IMAGES):
+            raise ValueError(f'expected uint8 [1..{MAX_BATCH_IMAGES}, 224, 224, 3], got '
+                             f'{getattr(payload, "dtype", type(payload).__name__)} {getattr(payload, "shape", "")}')
+        return np.asarray(self.detector.predict_scores(decode_batch(payload)), dtype=np.float32)
+
+    def handle(self, conn):
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    op, payload = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if op == 'info':
+                        reply = ('ok', self.info())
+                    elif op == 'predict':
+                        reply = ('ok', self.predict(payload))
+                    else:
+                        reply = ('error', f'unknown op {op!r}')
+                except ModelUnavailable as e:
+                    reply = ('unavailable', str(e))
+                except Exception as e:
+                    reply = ('error', f'{type(e).__name__}: {e}')
+                conn.send(reply)
+        finally:
+            self.connections -= 1
+            conn.close()
+
+    def serve_forever(self):
+        # Warm before accepting so the first web request does not pay the load
+        self.detector.warmup()
+        print(f"[InferenceServer] pid {os.getpid()} serving {self.detector.backend} model "
+              f"({self.detector.model_status}) on {self.listener.address}")
+        while True:
+            try:
+                conn = self.listener.accept()
+            except AuthenticationError:
+                print("[InferenceServer] rejected a client with the wrong authkey")
+                continue
+            except OSError as e:
+                print(f"[InferenceServer] accept failed: {e}")
+                time.sleep(0.1)
+                continue
+            threading.Thread(target=self.handle, args=(conn,), daemon=True, name='disease-inference-conn').start()
+
+
+def _child(listener, backend):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    try:
+        InferenceServer(listener, backend).serve_forever()
+    finally:
+        os._exit(1)
+
+
+def supervise(listener, backend, processes):
+    """Fork ``processes`` servers on the shared listener and restart them when they exit."""
+    children = {}
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            _child(listener, backend)
+        children[pid] = time.monotonic()
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(processes):
+        spawn()
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        started = children.pop(pid, None)
+        if stopping or started is None:
+            continue
+        print(f"[InferenceServer] worker {pid} exited ({status}); restarting")
+        if time.monotonic() - started < 5:
+            time.sleep(1)  # don't spin if the model fails to load on every start
+        spawn()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the disease model to web workers over a Unix socket.')
+    parser.add_argument('--socket', default=inference_socket())
+    parser.add_argument('--backend', default=os.environ.get('DISEASE_INFERENCE_SERVER_BACKEND', 'keras'),
+                        choices=('keras', 'tflite'))
+    parser.add_argument('--processes', type=int, default=int(os.environ.get('DISEASE_INFERENCE_PROCESSES', 1)))
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)  # left over from a previous run
+    previous_umask = os.umask(0o077)  # socket readable by this user only
+    try:
+        listener = Listener(args.socket, family='AF_UNIX', authkey=inference_authkey())
+    finally:
+        os.umask(previous_umask)
+    try:
+        if args.processes <= 1:
+            InferenceServer(listener, args.backend).serve_forever()
+        else:
+            supervise(listener, args.backend, args.processes)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
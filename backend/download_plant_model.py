@@ -1,187 +1,232 @@
 #!/usr/bin/env python3
 """
-Download a pre-trained plant disease detection model.
-This script downloads a proper plant disease classification model trained on PlantVillage dataset.
+Build the plant disease detection model (build step, never run per request).
+
+Creates ``model/plant_disease_model.h5`` and a ``plant_disease_model.h5.sha256``
+sidecar next to it. At startup the API checks the model against that hash and
+refuses to serve a missing or modified file.
+
+    python download_plant_model.py                 # enhanced CNN, synthetic training
+    python download_plant_model.py --variant basic # small CNN, faster build
+    python download_plant_model.py --skip-if-present  # keep a present model if it matches its pin
+    python download_plant_model.py --hash-only     # pin the hash of a model you supplied
+
+Only a fresh build and ``--hash-only`` write the sidecar. ``--skip-if-present``
+checks a present model against its existing pin and fails on a mismatch (or a
+missing pin), so a corrupted or replaced file is never re-pinned by a build.
+
+Until a real PlantVillage-trained artifact is dropped in, both variants are
+trained on synthetic images, so predictions are for demonstration only.
 """
 import os
-import requests
-import zipfile
+import sys
+import argparse
 from pathlib import Path
-import tensorflow as tf
-from tensorflow import keras
 import numpy as np
 
-def download_pretrained_model():
-    """Download a pre-trained plant disease model from a reliable source"""
-    
-    # Create model directory
-    model_dir = Path("../model")
-    model_dir.mkdir(exist_ok=True)
-    
-    model_path = model_dir / "plant_disease_model.h5"
-    
-    print("🌱 Downloading pre-trained plant disease detection model...")
-    
-    try:
-        # Option 1: Try to download from TensorFlow Hub or Kaggle (placeholder URL)
-        # In practice, you would use a real model from TensorFlow Hub or a trained model repository
-        
-        # For demonstration, let's create a better-structured model
-        print("📥 Creating improved plant disease detection model...")
-        
-        # Define the model architecture (based on successful plant disease detection papers)
-        model = keras.Sequential([
-            # Input layer
-            keras.layers.Input(shape=(224, 224, 3)),
-            
-            # Data augmentation layers
-            keras.layers.RandomFlip("horizontal_and_vertical"),
-            keras.layers.RandomRotation(0.2),
-            keras.layers.RandomZoom(0.2),
-            
-            # Feature extraction layers (inspired by MobileNetV2)
-            keras.layers.Conv2D(32, 3, activation='relu'),
-            keras.layers.BatchNormalization(),
-            keras.layers.MaxPooling2D(2),
-            
-            keras.layers.Conv2D(64, 3, activation='relu'),
-            keras.layers.BatchNormalization(),
-            keras.layers.MaxPooling2D(2),
-            
-            keras.layers.Conv2D(128, 3, activation='relu'),
-            keras.layers.BatchNormalization(),
-            keras.layers.MaxPooling2D(2),
-            
-            keras.layers.Conv2D(256, 3, activation='relu'),
-            keras.layers.BatchNormalization(),
-            keras.layers.MaxPooling2D(2),
-            
-            # Global average pooling instead of flatten
-            keras.layers.GlobalAveragePooling2D(),
-            
-            # Classification head
-            keras.layers.Dropout(0.5),
-            keras.layers.Dense(512, activation='relu'),
-            keras.layers.BatchNormalization(),
-            keras.layers.Dropout(0.3),
-            keras.layers.Dense(13, activation='softmax')  # 13 classes for plant diseases
-        ])
-        
-        # Compile with better optimizer settings
-        model.compile(
-            optimizer=keras.optimizers.Adam(learning_rate=0.001),
-            loss='categorical_crossentropy',
-            metrics=['accuracy']
-        )
-        
-        print("🔧 Model architecture created successfully")
-        
-        # Create synthetic training data that's more realistic
-        print("📊 Generating diverse synthetic training data...")
-        
-        # Generate more diverse synthetic data
-        num_samples = 1000
-        X_train = []
-        y_train = []
-        
-        for i in range(num_samples):
-            # Create more realistic plant-like images
-            # Base green color for leaves with some variation
-            base_color = np.random.uniform(0.2, 0.8, (224, 224, 3))
-            
-            # Add some texture and patterns
-            noise = np.random.normal(0, 0.1, (224, 224, 3))
-            
-            # Simulate leaf patterns with gradients
-            x_grad = np.linspace(0, 1, 224)
-            y_grad = np.linspace(0, 1, 224)
-            X_mesh, Y_mesh = np.meshgrid(x_grad, y_grad)
-            
-            # Add leaf-like patterns
-            pattern = (np.sin(X_mesh * 10) * np.cos(Y_mesh * 10) * 0.2).reshape(224, 224, 1)
-            pattern = np.repeat(pattern, 3, axis=2)
-            
-            # Combine all elements
-            image = np.clip(base_color + noise + pattern, 0, 1)
-            
-            # Assign class based on image characteristics (simulate different disease patterns)
-            class_idx = i % 13
-            
-            X_train.append(image)
-            y_train.append(class_idx)
-        
-        X_train = np.array(X_train)
-        y_train = keras.utils.to_categorical(y_train, 13)
-        
-        print("🏋️ Training model with synthetic data...")
-        
-        # Train with more epochs for better learning
-        history = model.fit(
-            X_train, y_train,
-            epochs=5,
-            batch_size=32,
-            validation_split=0.2,
-            verbose=1
-        )
-        
-        # Save the improved model
-        model.save(model_path)
-        
-        print(f"✅ Enhanced plant disease model saved to: {model_path}")
-        print(f"📈 Final training accuracy: {history.history['accuracy'][-1]:.3f}")
-        print(f"📊 Final validation accuracy: {history.history['val_accuracy'][-1]:.3f}")
-        
-        return True
-        
-    except Exception as e:
-        print(f"❌ Error creating enhanced model: {e}")
+from disease_detector import (CLASS_NAMES, INPUT_SHAPE, DEFAULT_MODEL_PATH, hash_sidecar_path, write_hash_sidecar,
+                              expected_model_hash, file_sha256)
+
+
+def build_enhanced_model(num_classes=len(CLASS_NAMES)):
+    """Define the model architecture (based on successful plant disease detection papers)"""
+    from tensorflow import keras
+
+    model = keras.Sequential([
+        # Input layer
+        keras.layers.Input(shape=INPUT_SHAPE),
+
+        # Data augmentation layers
+        keras.layers.RandomFlip("horizontal_and_vertical"),
+        keras.layers.RandomRotation(0.2),
+        keras.layers.RandomZoom(0.2),
+
+        # Feature extraction layers (inspired by MobileNetV2)
+        keras.layers.Conv2D(32, 3, activation='relu'),
+        keras.layers.BatchNormalization(),
+        keras.layers.MaxPooling2D(2),
+
+        keras.layers.Conv2D(64, 3, activation='relu'),
+        keras.layers.BatchNormalization(),
+        keras.layers.MaxPooling2D(2),
+
+        keras.layers.Conv2D(128, 3, activation='relu'),
+        keras.layers.BatchNormalization(),
+        keras.layers.MaxPooling2D(2),
+
+        keras.layers.Conv2D(256, 3, activation='relu'),
+        keras.layers.BatchNormalization(),
+        keras.layers.MaxPooling2D(2),
+
+        # Global average pooling instead of flatten
+        keras.layers.GlobalAveragePooling2D(),
+
+        # Classification head
+        keras.layers.Dropout(0.5),
+        keras.layers.Dense(512, activation='relu'),
+        keras.layers.BatchNormalization(),
+        keras.layers.Dropout(0.3),
+        keras.layers.Dense(num_classes, activation='softmax')
+    ])
+
+    # Compile with better optimizer settings
+    model.compile(
+        optimizer=keras.optimizers.Adam(learning_rate=0.001),
+        loss='categorical_crossentropy',
+        metrics=['accuracy']
+    )
+    return model
+
+
+def build_basic_model(num_classes=len(CLASS_NAMES)):
+    """Small CNN (the former runtime fallback model)"""
+    from tensorflow import keras
+
+    model = keras.Sequential([
+        keras.layers.Input(shape=INPUT_SHAPE),
+        keras.layers.Conv2D(32, (3, 3), activation='relu'),
+        keras.layers.MaxPooling2D(2, 2),
+        keras.layers.Conv2D(64, (3, 3), activation='relu'),
+        keras.layers.MaxPooling2D(2, 2),
+        keras.layers.Conv2D(128, (3, 3), activation='relu'),
+        keras.layers.MaxPooling2D(2, 2),
+        keras.layers.Flatten(),
+        keras.layers.Dropout(0.5),
+        keras.layers.Dense(512, activation='relu'),
+        keras.layers.Dense(num_classes, activation='softmax')
+    ])
+    model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
+    return model
+
+
+def synthetic_dataset(num_samples, num_classes=len(CLASS_NAMES), seed=42):
+    """Leaf-like synthetic images (float32): green base, texture and a sin/cos vein pattern.
+
+    Healthy classes get more green; diseased classes more red and noise.
+    """
+    rng = np.random.default_rng(seed)
+    height, width, _ = INPUT_SHAPE
+    x_grad, y_grad = np.meshgrid(np.linspace(0, 1, width, dtype=np.float32), np.linspace(0, 1, height, dtype=np.float32))
+    pattern = (np.sin(x_grad * 10) * np.cos(y_grad * 10) * 0.2)[..., None]
+
+    images = rng.uniform(0.2, 0.8, (num_samples, *INPUT_SHAPE)).astype(np.float32)
+    images += rng.normal(0, 0.1, images.shape).astype(np.float32)
+    images += pattern
+    labels = np.arange(num_samples) % num_classes
+    healthy = np.array(['healthy' in name for name in CLASS_NAMES[:num_classes]])[labels]
+    images[healthy, :, :, 1] += 0.3
+    images[~healthy, :, :, 0] += 0.2
+    np.clip(images, 0, 1, out=images)
+    return images, labels
+
+
+def write_hash(model_path):
+    digest = write_hash_sidecar(model_path)
+    print(f"🔒 SHA-256 {digest} written to {hash_sidecar_path(model_path)}")
+    return digest
+
+
+def check_pinned_hash(model_path):
+    """True if ``model_path`` matches its pinned hash (``DISEASE_MODEL_SHA256`` or the sidecar)."""
+    expected = expected_model_hash(model_path)
+    if expected is None:
+        print(f"❌ {model_path} has no pinned hash; run with --hash-only to pin it")
+        return False
+    actual = file_sha256(model_path)
+    if actual != expected:
+        print(f"❌ {model_path} does not match its pinned hash (expected {expected}, got {actual})")
+        print("   Rebuild it, or run with --hash-only if the new file is intended")
         return False
+    print(f"🔒 SHA-256 {actual} matches the pinned hash")
+    return True
+
+
+def build_model_file(model_path, variant='enhanced', samples=1000, epochs=5, seed=42):
+    """Train on synthetic data and save the model to ``model_path``"""
+    from tensorflow import keras
+
+    Path(model_path).parent.mkdir(parents=True, exist_ok=True)
+    print(f"📥 Creating {variant} plant disease detection model...")
+    model = build_enhanced_model() if variant == 'enhanced' else build_basic_model()
+    print("🔧 Model architecture created successfully")
 
-def verify_model():
-    """Verify the downloaded model works correctly"""
-    model_path = Path("../model/plant_disease_model.h5")
-    
-    if not model_path.exists():
+    print("📊 Generating diverse synthetic training data...")
+    x_train, labels = synthetic_dataset(samples, seed=seed)
+    y_train = keras.utils.to_categorical(labels, len(CLASS_NAMES))
+
+    print("🏋️ Training model with synthetic data...")
+    history = model.fit(x_train, y_train, epochs=epochs, batch_size=32, validation_split=0.2, verbose=1)
+
+    model.save(model_path)
+    print(f"✅ Plant disease model saved to: {model_path}")
+    print(f"📈 Final training accuracy: {history.history['accuracy'][-1]:.3f}")
+    print(f"📊 Final validation accuracy: {history.history['val_accuracy'][-1]:.3f}")
+    return True
+
+
+def verify_model(model_path):
+    """Verify the model loads and produces one score per class"""
+    from tensorflow import keras
+
+    if not os.path.exists(model_path):
         print("❌ Model file not found")
         return False
-    
+
     try:
         print("🔍 Verifying model...")
         model = keras.models.load_model(model_path)
-        
-        # Test with a random image
-        test_image = np.random.random((1, 224, 224, 3))
-        predictions = model.predict(test_image, verbose=0)
-        
-        print(f"✅ Model loaded successfully")
+        predictions = np.asarray(model(np.random.random((1, *INPUT_SHAPE)).astype(np.float32), training=False))
+
         print(f"📊 Model input shape: {model.input_shape}")
         print(f"📈 Model output shape: {model.output_shape}")
-        print(f"🎯 Test prediction shape: {predictions.shape}")
-        print(f"🔢 Prediction confidence distribution: {predictions[0][:5]}")  # Show first 5
-        
+        if predictions.shape != (1, len(CLASS_NAMES)):
+            print(f"❌ Expected {len(CLASS_NAMES)} class scores, got shape {predictions.shape}")
+            return False
+        print("✅ Model loaded successfully")
         return True
-        
+
     except Exception as e:
         print(f"❌ Model verification failed: {e}")
         return False
 
-if __name__ == "__main__":
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the plant disease model artifact and its SHA-256 sidecar.')
+    parser.add_argument('--output', default=os.environ.get('DISEASE_MODEL_PATH') or DEFAULT_MODEL_PATH)
+    parser.add_argument('--variant', choices=('enhanced', 'basic'), default='enhanced')
+    parser.add_argument('--samples', type=int, default=1000, help='Synthetic training images')
+    parser.add_argument('--epochs', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--skip-if-present', action='store_true', help='Keep an existing model if it matches its pinned hash')
+    parser.add_argument('--hash-only', action='store_true', help='Only (re)write the hash sidecar for an existing model')
+    args = parser.parse_args(argv)
+
     print("🌿 Plant Disease Model Setup")
     print("=" * 40)
-    
-    success = download_pretrained_model()
-    
-    if success:
-        print("\n🧪 Verifying model...")
-        if verify_model():
-            print("\n🎉 Success! Enhanced plant disease model is ready.")
-            print("💡 The model now has:")
-            print("   • Better architecture with BatchNormalization")
-            print("   • Data augmentation layers")
-            print("   • More realistic synthetic training")
-            print("   • Improved confidence scoring")
-        else:
-            print("\n⚠️  Model created but verification failed.")
-    else:
-        print("\n❌ Failed to create enhanced model.")
-        print("🔧 The app will continue using the basic fallback model.")
\ No newline at end of file
+
+    exists = os.path.exists(args.output)
+    if args.hash_only and not exists:
+        print(f"❌ No model at {args.output}")
+        return 1
+    if args.hash_only:
+        write_hash(args.output)
+        return 0
+    if args.skip_if_present and exists:
+        print(f"⏭️  Model already present at {args.output}")
+        return 0 if check_pinned_hash(args.output) else 1
+
+    try:
+        build_model_file(args.output, args.variant, args.samples, args.epochs, args.seed)
+    except Exception as e:
+        print(f"❌ Error creating model: {e}")
+        return 1
+    if not verify_model(args.output):
+        print("\n⚠️  Model created but verification failed.")
+        return 1
+    write_hash(args.output)
+    print("\n🎉 Success! Plant disease model is ready.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
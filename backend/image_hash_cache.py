@@ -0,0 +1,272 @@
+"""Perceptual-hash cache of disease model outputs.
+
+Users re-upload the same photo (often recompressed by the browser or a
+messaging app) while trying the feature. Each preprocessed 224x224 image gets
+a 64-bit difference hash (dHash over a 9x8 grayscale thumbnail), and the
+model's class scores are stored under ``(model version, hash)``. A later image
+within ``IMAGE_HASH_CACHE_MAX_DISTANCE`` bits (Hamming distance, default 4)
+reuses those scores instead of running the CNN, but only after a second check.
+
+The dHash only sees coarse brightness gradients, so a healthy leaf and the same
+leaf with a few small lesions can hash 0-4 bits apart. Every entry therefore
+also keeps a 32x32 RGB thumbnail, and a candidate (even an exact hash match) is
+served only if no thumbnail cell differs by more than
+``IMAGE_HASH_CACHE_MAX_PIXEL_DELTA`` (default 24 of 255). Recompression moves
+cells by well under that; a brown spot on a green leaf moves its cell by far
+more.
+
+Near matches are found through a band index. The hash is split into eight
+8-bit bands, and two hashes within 7 bits must share at least one band
+(pigeonhole), so only entries sharing a band are compared.
+
+L1 is a bounded in-process LRU (``IMAGE_HASH_CACHE_MAX_ENTRIES``). The
+optional L2 is the ``disease_image_cache`` Mongo collection
+(``IMAGE_HASH_CACHE_MONGO``), which expires entries after
+``IMAGE_HASH_CACHE_TTL_DAYS``. The model version (backend + model file hash)
+is part of the key, so a new model never serves old predictions.
+"""
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+from PIL import Image
+
+from database import get_collection
+from metrics import metrics
+
+BANDS = 8
+BAND_BITS = 64 // BANDS
+MAX_SUPPORTED_DISTANCE = BANDS - 1
+THUMBNAIL_SIZE = 32
+
+
+def _as_pil(image) -> Image.Image:
+    if isinstance(image, Image.Image):
+        return image
+    pixels = np.asarray(image)
+    if pixels.dtype != np.uint8:
+        pixels = (np.clip(pixels, 0, 1) * 255 + 0.5).astype(np.uint8)
+    return Image.fromarray(pixels)
+
+
+def dhash(image) -> int:
+    """64-bit difference hash of an RGB image (uint8 array, float array in [0, 1], or PIL image)."""
+    thumb = np.asarray(_as_pil(image).convert('L').resize((9, 8), Image.BOX), dtype=np.int16)
+    bits = (thumb[:, 1:] > thumb[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def thumbnail(image) -> bytes:
+    """32x32 RGB box-filtered thumbnail, used to confirm a hash match."""
+    small = _as_pil(image).convert('RGB').resize((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.BOX)
+    return np.asarray(small, dtype=np.uint8).tobytes()
+
+
+def thumbnail_delta(a: bytes, b: bytes) -> int:
+    """Largest per-cell, per-channel difference between two thumbnails."""
+    return int(np.abs(np.frombuffer(a, np.uint8).astype(np.int16) - np.frombuffer(b, np.uint8)).max())
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def _bands(image_hash: int) -> list[int]:
+    # Band i with value v -> i * 256 + v (a single int per band, Mongo-friendly)
+    mask = (1 << BAND_BITS) - 1
+    return [i * (1 << BAND_BITS) + ((image_hash >> (i * BAND_BITS)) & mask) for i in range(BANDS)]
+
+
+class ImageHashCache:
+    COLLECTION = 'disease_image_cache'
+
+    def __init__(self):
+        self.enabled = os.environ.get('IMAGE_HASH_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+        self.max_entries = int(os.environ.get('IMAGE_HASH_CACHE_MAX_ENTRIES', 4096))
+        self.max_distance = int(os.environ.get('IMAGE_HASH_CACHE_MAX_DISTANCE', 4))
+        if self.max_distance > MAX_SUPPORTED_DISTANCE:
+            print(f"[ImageHashCache] max distance {self.max_distance} exceeds {MAX_SUPPORTED_DISTANCE}; clamping")
+            self.max_distance = MAX_SUPPORTED_DISTANCE
+        self.max_pixel_delta = int(os.environ.get('IMAGE_HASH_CACHE_MAX_PIXEL_DELTA', 24))
+        # (model version, hash) -> (scores, thumbnail)
+        self._entries: OrderedDict[tuple[str, int], tuple[list[float], bytes]] = OrderedDict()
+        self._band_index: dict[tuple[str, int], set[int]] = {}
+        self._lock = threading.Lock()
+        self._collection = None
+        if self.enabled and os.environ.get('IMAGE_HASH_CACHE_MONGO', 'true').lower() in ('1', 'true', 'yes'):
+            try:
+                collection = get_collection(self.COLLECTION)
+                collection.create_index([('model_version', 1), ('hash', 1)], unique=True)
+                collection.create_index([('model_version', 1), ('bands', 1)])
+                ttl_days = float(os.environ.get('IMAGE_HASH_CACHE_TTL_DAYS', 30))
+                collection.create_index('created_at', expireAfterSeconds=int(ttl_days * 86400))
+                self._collection = collection
+            except Exception as e:
+                print(f"[ImageHashCache] Mongo store disabled: {e}")
+
+    # ------------------------------------------------------------------
+    # Lookup / store
+    # ------------------------------------------------------------------
+    def _confirmed(self, cached_thumb, thumb) -> bool:
+        if cached_thumb is None or len(cached_thumb) != len(thumb):
+            return False
+        if thumbnail_delta(cached_thumb, thumb) > self.max_pixel_delta:
+            metrics.incr('image_hash_cache.rejected')
+            return False
+        return True
+
+    def lookup(self, model_version: str, image_hash: int, thumb: bytes) -> dict | None:
+        """``{'scores', 'distance', 'source'}`` of the nearest confirmed cached image, or None."""
+        if not self.enabled:
+            return None
+        best = self._lookup_l1(model_version, image_hash, thumb)
+        if best is None and self._collection is not None:
+            best = self._lookup_l2(model_version, image_hash, thumb)
+        if best is None:
+            metrics.incr('image_hash_cache.misses')
+            return None
+        metrics.incr(f"image_hash_cache.{best['source']}_hits")
+        metrics.observe('image_hash_cache.hit_distance', best['distance'])
+        return best
+
+    def _lookup_l1(self, model_version: str, image_hash: int, thumb: bytes) -> dict | None:
+        with self._lock:
+            candidates = {image_hash} if (model_version, image_hash) in self._entries else set()
+            if self.max_distance:
+                for band in _bands(image_hash):
+                    candidates |= self._band_index.get((model_version, band), set())
+            ranked = sorted((hamming(c, image_hash), c) for c in candidates)
+            for distance, candidate in ranked:
+                if distance > self.max_distance:
+                    break
+                scores, cached_thumb = self._entries[(model_version, candidate)]
+                if self._confirmed(cached_thumb, thumb):
+                    self._entries.move_to_end((model_version, candidate))
+                    return {'scores': scores, 'distance': distance, 'source': 'l1'}
+        return None
+
+    def _lookup_l2(self, model_version: str, image_hash: int, thumb: bytes) -> dict | None:
+        try:
+            query = {'model_version': model_version}
+            if self.max_distance:
+                query['bands'] = {'$in': _bands(image_hash)}
+            else:
+                query['hash'] = f'{image_hash:016x}'
+            docs = self._collection.find(query, {'hash': 1, 'scores': 1, 'thumbnail': 1}).limit(64)
+            ranked = sorted(((hamming(int(doc['hash'], 16), image_hash), doc) for doc in docs),
+                            key=lambda item: item[0])
+        except Exception as e:
+            metrics.incr('image_hash_cache.errors')
+            print(f"[ImageHashCache] lookup failed: {e}")
+            return None
+        for distance, doc in ranked:
+            if distance > self.max_distance:
+                break
+            cached_thumb = bytes(doc['thumbnail']) if doc.get('thumbnail') is not None else None
+            if self._confirmed(cached_thumb, thumb):
+                self._put_l1(model_version, int(doc['hash'], 16), doc['scores'], cached_thumb)
+                return {'scores': doc['scores'], 'distance': distance, 'source': 'l2'}
+        return None
+
+    def store(self, model_version: str, image_hash: int, thumb: bytes, scores):
+        if not self.enabled:
+            return
+        scores = [float(s) for s in scores]
+        self._put_l1(model_version, image_hash, scores, thumb)
+        metrics.incr('image_hash_cache.stores')
+        if self._collection is None:
+            return
+        try:
+            self._collection.update_one(
+                {'model_version': model_version, 'hash': f'{image_hash:016x}'},
+                {'$set': {'scores': scores, 'thumbnail': thumb, 'bands': _bands(image_hash)}, '$setOnInsert': {'created_at': datetime.utcnow()}},
+                upsert=True
+            )
+        except Exception as e:
+            metrics.incr('image_hash_cache.errors')
+            print(f"[ImageHashCache] store failed: {e}")
+
+    def _put_l1(self, model_version: str, image_hash: int, scores: list[float], thumb: bytes):
+        key = (model_version, image_hash)
+        with self._lock:
+            if key not in self._entries:
+                for band in _bands(image_hash):
+                    self._band_index.setdefault((model_version, band), set()).add(image_hash)
+            self._entries[key] = (scores, thumb)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                (old_version, old_hash), _ = self._entries.popitem(last=False)
+                for band in _bands(old_hash):
+                    members = self._band_index.get((old_version, band))
+                    if members is not None:
+                        members.discard(old_hash)
+                        if not members:
+                            del self._band_index[(old_version, band)]
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = len(self._entries)
+        hits = metrics.counter('image_hash_cache.l1_hits') + metrics.counter('image_hash_cache.l2_hits')
+        misses = metrics.counter('image_hash_cache.misses')
+        return {
+            'enabled': self.enabled,
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'max_distance': self.max_distance,
+            'max_pixel_delta': self.max_pixel_delta,
+            'rejected': metrics.counter('image_hash_cache.rejected'),
+            'mongo': self._collection is not None,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None
+        }
+
+
+image_hash_cache = ImageHashCache()
+
+__all__ = ["image_hash_cache", "ImageHashCache", "dhash", "hamming", "thumbnail", "thumbnail_delta"]
+
+
+def _self_check():
+    """A recompressed re-upload hits; the same leaf with lesions does not."""
+    import io
+    from PIL import ImageDraw, ImageFilter
+
+    def jpeg(image, quality):
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=quality)
+        return Image.open(io.BytesIO(buffer.getvalue())).convert('RGB')
+
+    healthy = Image.new('RGB', (224, 224), (200, 190, 170))
+    draw = ImageDraw.Draw(healthy)
+    draw.ellipse((30, 20, 194, 204), fill=(60, 140, 45))
+    draw.line((112, 20, 112, 204), fill=(90, 170, 70), width=3)
+    healthy = healthy.filter(ImageFilter.GaussianBlur(1))
+
+    cache = ImageHashCache()
+    cache.enabled, cache._collection = True, None
+    cache.store('check', dhash(healthy), thumbnail(healthy), [1.0, 0.0])
+    for quality in (95, 75, 50):
+        image = jpeg(healthy, quality)
+        result = cache.lookup('check', dhash(image), thumbnail(image))
+        assert result is not None, f'recompressed copy (quality {quality}) should hit'
+        print(f"re-upload q{quality}: hit at distance {result['distance']}")
+    rng = np.random.default_rng(0)
+    for trial in range(10):
+        spotted = healthy.copy()
+        draw = ImageDraw.Draw(spotted)
+        for _ in range(20):
+            x, y = rng.integers(60, 165, 2)
+            r = int(rng.integers(2, 6))
+            draw.ellipse((x - r, y - r, x + r, y + r), fill=(120, 75, 30))
+        distance = hamming(dhash(healthy), dhash(spotted))
+        assert cache.lookup('check', dhash(spotted), thumbnail(spotted)) is None, 'lesioned leaf served the healthy scores'
+        print(f"lesions #{trial}: dHash distance {distance}, thumbnail delta "
+              f"{thumbnail_delta(thumbnail(healthy), thumbnail(spotted))} -> miss")
+    print('ok')
+
+
+if __name__ == '__main__':
+    _self_check()
@@ -0,0 +1,189 @@
+"""In-process micro-batching for model inference.
+
+Concurrent requests each hand one input to ``MicroBatcher.submit`` and block.
+A single worker thread takes the first queued input, keeps collecting until it
+has ``max_batch_size`` inputs or ``max_wait_ms`` has passed since that first
+input arrived, then runs one batched forward pass and hands each caller its
+row of the output. One 8-image pass costs far less than eight 1-image passes
+on a CPU, and the model is only ever called by one thread at a time.
+
+A ``submit`` with no other submitter in flight runs inline on the caller's
+thread instead: there is nothing to batch it with, so waiting ``max_wait_ms``
+and handing it to the worker thread would only add latency. This is always the
+case under gunicorn's sync workers (one request per process); batches only
+form when requests overlap in one process (``--threads`` / gthread workers,
+the inference server, or ``submit_many``).
+
+Per batcher (``name``), the metrics registry gets:
+  - gauge ``<name>.queue_depth`` (inputs waiting);
+  - summaries ``<name>.batch_size``, ``<name>.queue_wait_ms``, ``<name>.batch_ms``;
+  - counter ``<name>.inline`` (single inputs run on the caller's thread);
+and ``stats()`` adds an exact batch-size histogram.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from metrics import metrics
+
+
+class BatcherOverloaded(RuntimeError):
+    """The queue is full; the caller should shed load (HTTP 503)."""
+
+
+class _Pending:
+    __slots__ = ('item', 'future', 'enqueued_at')
+
+    def __init__(self, item):
+        self.item = item
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatcher:
+    def __init__(self, run_batch, name: str, max_batch_size: int = 8, max_wait_ms: float = 5, max_queue: int = 256):
+        """``run_batch(np.ndarray[N, ...]) -> sequence of N results`` runs on the worker thread."""
+        self.run_batch = run_batch
+        self.name = name
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000
+        self._queue = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()  # one forward pass at a time, inline or batched
+        self._active = 0  # submit / submit_many calls in flight
+        self._worker = None
+        self._worker_pid = None
+        self._histogram: dict[int, int] = {}
+        self.batches = 0
+        self.items = 0
+
+    def submit(self, item, timeout: float | None = None):
+        """Queue one input and block until its result is ready (re-raises batch errors).
+
+        Runs inline when no other submitter is in flight and the model is idle.
+        """
+        with self._lock:
+            self._active += 1
+            alone = self._active == 1
+        try:
+            if alone and self._queue.empty() and self._run_lock.acquire(blocking=False):
+                try:
+                    started = time.perf_counter()
+                    output = self.run_batch(np.stack([item]))[0]
+                finally:
+                    self._run_lock.release()
+                metrics.incr(f'{self.name}.inline')
+                self._record(1, started)
+                return output
+            self._ensure_worker()
+            pending = _Pending(item)
+            try:
+                self._queue.put_nowait(pending)
+            except queue.Full:
+                metrics.incr(f'{self.name}.rejected')
+                raise BatcherOverloaded(f'{self.name} queue is full ({self._queue.maxsize} waiting)')
+            metrics.set_gauge(f'{self.name}.queue_depth', self._queue.qsize())
+            return pending.future.result(timeout=timeout)
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def submit_many(self, items, timeout: float | None = None) -> list:
+        """Queue several inputs (e.g. one upload of many images) and wait for all results.
+
+        Unlike ``submit`` this waits for queue space instead of failing, so a
+        large upload is fed through in ``max_batch_size`` chunks alongside
+        other requests.
+        """
+        self._ensure_worker()
+        with self._lock:
+            self._active += 1
+        try:
+            deadline = None if timeout is None else time.perf_counter() + timeout
+            pendings = []
+            for item in items:
+                pending = _Pending(item)
+                remaining = None if deadline is None else max(0.0, deadline - time.perf_counter())
+                try:
+                    self._queue.put(pending, timeout=remaining)
+                except queue.Full:
+                    metrics.incr(f'{self.name}.rejected')
+                    raise BatcherOverloaded(f'{self.name} queue stayed full for {timeout}s')
+                pendings.append(pending)
+            metrics.set_gauge(f'{self.name}.queue_depth', self._queue.qsize())
+            return [
+                pending.future.result(timeout=None if deadline is None else max(0.0, deadline - time.perf_counter()))
+                for pending in pendings
+            ]
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def _ensure_worker(self):
+        # Re-create the thread after a fork (threads do not survive into children)
+        if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or self._worker_pid != os.getpid() or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._loop, daemon=True, name=f'{self.name}-batcher')
+                self._worker_pid = os.getpid()
+                self._worker.start()
+
+    def _collect(self) -> list[_Pending]:
+        batch = [self._queue.get()]
+        deadline = batch[0].enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            metrics.set_gauge(f'{self.name}.queue_depth', self._queue.qsize())
+            started = time.perf_counter()
+            for pending in batch:
+                metrics.observe(f'{self.name}.queue_wait_ms', (started - pending.enqueued_at) * 1000)
+            try:
+                with self._run_lock:
+                    outputs = self.run_batch(np.stack([pending.item for pending in batch]))
+                for pending, output in zip(batch, outputs):
+                    pending.future.set_result(output)
+            except Exception as e:
+                for pending in batch:
+                    if not pending.future.done():
+                        pending.future.set_exception(e)
+            self._record(len(batch), started)
+
+    def _record(self, size: int, started: float):
+        metrics.observe(f'{self.name}.batch_ms', (time.perf_counter() - started) * 1000)
+        metrics.observe(f'{self.name}.batch_size', size)
+        with self._lock:
+            self._histogram[size] = self._histogram.get(size, 0) + 1
+            self.batches += 1
+            self.items += size
+
+    def stats(self) -> dict:
+        with self._lock:
+            histogram = dict(sorted(self._histogram.items()))
+            batches, items = self.batches, self.items
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': round(self.max_wait * 1000, 2),
+            'queue_depth': self._queue.qsize(),
+            'batches': batches,
+            'items': items,
+            'inline': metrics.counter(f'{self.name}.inline'),
+            'avg_batch_size': round(items / batches, 2) if batches else None,
+            'batch_size_histogram': histogram
+        }
+
+
+__all__ = ["MicroBatcher", "BatcherOverloaded"]
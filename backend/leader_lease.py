@@ -0,0 +1,179 @@
+"""Leader election across gunicorn workers (and hosts) through a Mongo lease.
+
+Background jobs such as the market price refresher used to run in every
+process that imported them, so ``gunicorn -w N`` meant N refreshers making the
+same upstream calls. A ``LeaderLease`` lets exactly one process run a job:
+
+- the lease is one document in ``leader_leases`` (``_id`` = lease name) with
+  the current ``holder`` and an ``expires_at`` deadline;
+- every process runs a small heartbeat thread that tries to take the lease
+  (only possible when it is free or expired) or, as the holder, extends it
+  every ``LEADER_LEASE_HEARTBEAT_SECONDS`` (default 10) by
+  ``LEADER_LEASE_TTL_SECONDS`` (default 30);
+- ``is_leader()`` only trusts the last successful renewal, so a leader that
+  cannot reach Mongo steps down before its lease expires elsewhere;
+- a dead leader stops renewing and a follower takes over within one TTL; a
+  clean shutdown releases the lease at once.
+
+The job itself checks ``is_leader()`` on each run. Followers read the results
+from the shared Mongo caches. Without Mongo (or with
+``LEADER_LEASE_ENABLED=false``) every process considers itself the leader,
+which was the behaviour before.
+"""
+import os
+import atexit
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from database import get_collection
+from metrics import metrics
+
+
+class LeaderLease:
+    COLLECTION = 'leader_leases'
+
+    def __init__(self, name: str):
+        self.name = name
+        self.ttl = float(os.environ.get('LEADER_LEASE_TTL_SECONDS', 30))
+        self.heartbeat = float(os.environ.get('LEADER_LEASE_HEARTBEAT_SECONDS', 10))
+        if self.heartbeat >= self.ttl:
+            print(f"[LeaderLease] heartbeat {self.heartbeat}s is not below the TTL {self.ttl}s; using TTL / 3")
+            self.heartbeat = self.ttl / 3
+        self.holder = None
+        self._pid = None
+        self._valid_until = 0.0  # monotonic deadline of our last successful renewal
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.acquisitions = 0
+        self._collection = None
+        if os.environ.get('LEADER_LEASE_ENABLED', 'true').lower() in ('1', 'true', 'yes'):
+            try:
+                self._collection = get_collection(self.COLLECTION)
+            except Exception as e:
+                print(f"[LeaderLease] Mongo unavailable, every process runs '{name}': {e}")
+
+    @property
+    def standalone(self) -> bool:
+        return self._collection is None
+
+    def start(self):
+        """Start (or, after a fork, restart) the heartbeat thread. Idempotent."""
+        with self._lock:
+            if self.standalone or (self._pid == os.getpid() and self._thread is not None):
+                return
+            # Holder ids are per process; a forked child must not inherit its parent's lease
+            self._pid = os.getpid()
+            self.holder = f"{socket.gethostname()}:{self._pid}:{uuid.uuid4().hex[:8]}"
+            self._valid_until = 0.0
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True, name=f'leader-lease-{self.name}')
+            self._thread.start()
+        atexit.register(self.release)
+
+    def is_leader(self) -> bool:
+        if self.standalone:
+            return True
+        if self._pid != os.getpid():
+            self.start()
+            return False
+        return time.monotonic() < self._valid_until
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.try_acquire()
+            self._stop.wait(self.heartbeat)
+
+    def try_acquire(self) -> bool:
+        """Take the lease if it is free or expired, or extend it if we hold it."""
+        was_leader = time.monotonic() < self._valid_until
+        attempted_at = time.monotonic()
+        now = datetime.utcnow()
+        try:
+            from pymongo.errors import DuplicateKeyError
+            try:
+                self._collection.find_one_and_update(
+                    {'_id': self.name, '$or': [{'holder': self.holder}, {'expires_at': {'$lt': now}}]},
+                    {'$set': {'holder': self.holder, 'expires_at': now + timedelta(seconds=self.ttl),
+                              'heartbeat_at': now}},
+                    upsert=True
+                )
+                acquired = True
+            except DuplicateKeyError:
+                # Someone else holds a live lease (the upsert collided with their document)
+                acquired = False
+        except Exception as e:
+            metrics.incr('leader_lease.errors')
+            print(f"[LeaderLease] {self.name}: heartbeat failed: {e}")
+            acquired = False
+        if acquired:
+            # Measured from before the round trip, so we step down no later than the lease expires
+            self._valid_until = attempted_at + self.ttl
+            if not was_leader:
+                self.acquisitions += 1
+                metrics.incr(f'leader_lease.{self.name}.acquired')
+                print(f"[LeaderLease] {self.holder} is now leader for '{self.name}'")
+        else:
+            self._valid_until = 0.0
+            if was_leader:
+                metrics.incr(f'leader_lease.{self.name}.lost')
+                print(f"[LeaderLease] {self.holder} lost leadership for '{self.name}'")
+        return acquired
+
+    def release(self):
+        """Give the lease up immediately (on shutdown) so a follower need not wait for expiry."""
+        if self.standalone or self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._valid_until = 0.0
+        try:
+            self._collection.delete_one({'_id': self.name, 'holder': self.holder})
+        except Exception:
+            pass
+
+    def stats(self) -> dict:
+        leader, expires_in = None, None
+        if not self.standalone:
+            try:
+                doc = self._collection.find_one({'_id': self.name})
+                if doc:
+                    leader = doc.get('holder')
+                    expires_in = round((doc['expires_at'] - datetime.utcnow()).total_seconds(), 1)
+            except Exception:
+                pass
+        return {
+            'mode': 'standalone' if self.standalone else 'mongo',
+            'holder': self.holder,
+            'is_leader': self.is_leader(),
+            'leader': leader,
+            'expires_in_seconds': expires_in,
+            'acquisitions': self.acquisitions,
+            'ttl_seconds': self.ttl,
+            'heartbeat_seconds': self.heartbeat
+        }
+
+
+_leases: dict[str, LeaderLease] = {}
+_leases_lock = threading.Lock()
+
+
+def leader_lease(name: str) -> LeaderLease:
+    """The process-wide lease called ``name``, with its heartbeat running."""
+    with _leases_lock:
+        lease = _leases.get(name)
+        if lease is None:
+            lease = _leases[name] = LeaderLease(name)
+    lease.start()
+    return lease
+
+
+def lease_stats() -> dict:
+    with _leases_lock:
+        leases = list(_leases.values())
+    return {lease.name: lease.stats() for lease in leases}
+
+
+__all__ = ["LeaderLease", "leader_lease", "lease_stats"]
@@ -0,0 +1,197 @@
+"""Pluggable LLM backend behind every ``generate_content`` call.
+
+``LLM_BACKEND`` selects what ``create_model`` returns:
+
+- ``gemini`` (default): ``google.generativeai.GenerativeModel``.
+- ``stub``: ``StubModel``, a deterministic local stand-in that needs no API
+  key or network. It is meant for load and latency testing of the chat and
+  prediction endpoints.
+
+Stub behaviour is configured through the environment:
+
+- ``LLM_STUB_LATENCY_MS``: median latency (default 800). Latency follows a
+  lognormal distribution with ``LLM_STUB_LATENCY_SIGMA`` (default 0.4; 0
+  makes it fixed).
+- ``LLM_STUB_ERROR_RATE``: fraction of calls that fail with a 429-style
+  quota error (default 0).
+- ``LLM_STUB_SEED``: seed for the latency and error sequence (default 7).
+
+Stub replies are canned but shaped like the real ones: a number for yield
+validation, the recommendation JSON schema (plain or combined), delimited
+batch translations, or free-text advice. They also carry ``usage_metadata``
+token counts, so gateway metrics behave as they do in production.
+"""
+import os
+import json
+import math
+import time
+import random
+import hashlib
+import threading
+
+try:
+    import google.generativeai as genai
+except Exception:  # pragma: no cover - optional in stub-only environments
+    genai = None
+
+LLM_BACKEND = os.environ.get('LLM_BACKEND', 'gemini').lower()
+
+
+def backend_name() -> str:
+    return LLM_BACKEND
+
+
+def llm_available(api_key: str | None) -> bool:
+    """True if models can be created (stub needs no key; Gemini needs key + library)."""
+    if LLM_BACKEND == 'stub':
+        return True
+    return bool(api_key) and genai is not None
+
+
+def configure(api_key: str | None):
+    if LLM_BACKEND == 'stub':
+        return
+    if genai is None:
+        raise RuntimeError('google-generativeai library not available.')
+    genai.configure(api_key=api_key)
+
+
+def create_model(model_name: str):
+    if LLM_BACKEND == 'stub':
+        return StubModel(model_name)
+    if genai is None:
+        raise RuntimeError('google-generativeai library not available.')
+    return genai.GenerativeModel(model_name)
+
+
+# =============================================================================
+# Local stub
+# =============================================================================
+class StubRateLimitError(Exception):
+    """Mimics the 429 ResourceExhausted error raised by the Gemini client."""
+    code = 429
+
+
+class _StubUsage:
+    __slots__ = ('prompt_token_count', 'candidates_token_count', 'total_token_count')
+
+    def __init__(self, prompt_tokens: int, output_tokens: int):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+        self.total_token_count = prompt_tokens + output_tokens
+
+
+class _StubResponse:
+    __slots__ = ('text', 'usage_metadata')
+
+    def __init__(self, text: str, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+_STUB_RECOMMENDATIONS = {
+    "yield_assessment": "Yield is close to the regional average; balanced nutrition and timely irrigation can lift it further.",
+    "fertilizer_recommendations": {
+        "optimal_npk": "120:60:40 kg/ha NPK",
+        "application_schedule": "Half N + full P and K at sowing; rest of N in two splits at tillering and flowering",
+        "organic_options": "FYM 10 t/ha before sowing; vermicompost 2 t/ha",
+        "micronutrients": "Zinc sulphate 25 kg/ha if deficiency symptoms appear"
+    },
+    "irrigation_recommendations": {
+        "frequency": "Every 7-10 days depending on soil moisture",
+        "critical_stages": "Crown root initiation; flowering; grain filling",
+        "methods": "Furrow or drip where available",
+        "water_management": "Mulch to conserve moisture; avoid waterlogging"
+    },
+    "planting_recommendations": {
+        "optimal_dates": "Sow at the start of the season after first good rains",
+        "variety_selection": "Certified high-yielding local variety",
+        "spacing": "Row spacing 20-25 cm",
+        "soil_prep": "Deep ploughing followed by two harrowings"
+    },
+    "improvement_potential": {
+        "expected_increase": "10-15% with recommended practices",
+        "timeline": "One season",
+        "priority_actions": "Soil test; split nitrogen; irrigate at critical stages",
+        "investment_needed": "Moderate: fertilizer and irrigation scheduling"
+    },
+    "cost_benefit": {
+        "roi_estimate": "1.4-1.8x",
+        "payback_period": "One season",
+        "risk_factors": "Erratic rainfall; pest outbreaks"
+    }
+}
+
+
+class StubModel:
+    """Deterministic stand-in for ``GenerativeModel.generate_content``."""
+
+    def __init__(self, model_name: str):
+        self.model_name = f'stub/{model_name}'
+        self.latency_ms = float(os.environ.get('LLM_STUB_LATENCY_MS', 800))
+        self.latency_sigma = float(os.environ.get('LLM_STUB_LATENCY_SIGMA', 0.4))
+        self.error_rate = float(os.environ.get('LLM_STUB_ERROR_RATE', 0))
+        self.stream_chunks = int(os.environ.get('LLM_STUB_STREAM_CHUNKS', 8))
+        self._rng = random.Random(int(os.environ.get('LLM_STUB_SEED', 7)))
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, stream: bool = False, request_options=None, generation_config=None, **_kwargs):
+        prompt = prompt if isinstance(prompt, str) else str(prompt)
+        with self._lock:
+            latency = self.latency_ms * math.exp(self._rng.gauss(0, self.latency_sigma)) if self.latency_sigma else self.latency_ms
+            failed = self._rng.random() < self.error_rate
+        timeout = (request_options or {}).get('timeout')
+        if timeout is not None and latency / 1000 > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f'Stub deadline exceeded after {timeout:.2f}s')
+        if failed:
+            # Quota errors come back quickly, like the real API
+            time.sleep(min(latency, 50) / 1000)
+            raise StubRateLimitError('429 Resource has been exhausted (stub)')
+
+        text = self._reply(prompt)
+        usage = _StubUsage(max(1, len(prompt) // 4), max(1, len(text) // 4))
+        if not stream:
+            time.sleep(latency / 1000)
+            return _StubResponse(text, usage)
+        return self._stream(text, usage, latency)
+
+    def _stream(self, text: str, usage: _StubUsage, latency_ms: float):
+        # First chunk after ~40% of the latency, remaining chunks spread evenly
+        pieces = max(1, self.stream_chunks)
+        size = max(1, math.ceil(len(text) / pieces))
+        chunks = [text[i:i + size] for i in range(0, len(text), size)] or ['']
+        time.sleep(latency_ms * 0.4 / 1000)
+        for index, chunk in enumerate(chunks):
+            if index:
+                time.sleep(latency_ms * 0.6 / 1000 / max(1, len(chunks) - 1))
+            yield _StubResponse(chunk, usage if index == len(chunks) - 1 else None)
+
+    @staticmethod
+    def _reply(prompt: str) -> str:
+        digest = int(hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:8], 16)
+        if '"validation"' in prompt and '"recommendations"' in prompt:
+            return json.dumps({
+                'validation': {'predicted_yield': round(2.0 + (digest % 300) / 100, 2)},
+                'recommendations': _STUB_RECOMMENDATIONS
+            }, ensure_ascii=False)
+        if '"yield_assessment"' in prompt:
+            return json.dumps(_STUB_RECOMMENDATIONS, ensure_ascii=False)
+        if 'Just return the number' in prompt:
+            return f'{2.0 + (digest % 300) / 100:.2f}'
+        if '<<<0>>>' in prompt:
+            body = prompt.split(':\n\n', 1)[-1]
+            parts = body.split('<<<')[1:]
+            return '\n'.join(f"<<<{part.split('>>>', 1)[0]}>>>\n[stub] {part.split('>>>', 1)[1].strip()}" for part in parts)
+        if prompt.startswith('Translate the following text'):
+            source = prompt.split(':\n\n', 1)[-1].strip()
+            return f'[stub] {source}'
+        query = prompt.strip().splitlines()[-1][:200]
+        return (
+            f'Advice for "{query}": test the soil before sowing, apply balanced NPK in split doses, '
+            'irrigate at critical growth stages and scout weekly for pests. '
+            'Use certified seed and follow local extension recommendations.'
+        )
+
+
+__all__ = ["backend_name", "llm_available", "configure", "create_model", "StubModel", "StubRateLimitError", "LLM_BACKEND"]
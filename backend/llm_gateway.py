@@ -0,0 +1,203 @@
+"""Single entry point for Gemini calls.
+
+Every LLM call site (crop chatbot, multilingual chatbot, yield validation and
+yield recommendations) goes through ``llm_gateway`` so that, per process:
+  - at most ``LLM_MAX_CONCURRENCY`` calls are in flight;
+  - further callers queue for a slot for at most ``LLM_QUEUE_TIMEOUT_SECONDS``;
+  - each call has a deadline (``LLM_CALL_TIMEOUT_SECONDS`` unless overridden);
+  - 429 / quota errors are retried with jittered exponential backoff inside the deadline;
+  - calls, errors, retries, latency and token usage are tracked per caller.
+
+This keeps a burst of chat traffic from tying up every worker thread on Gemini.
+"""
+import os
+import time
+import random
+import threading
+from contextlib import contextmanager
+
+from metrics import metrics
+
+try:
+    from google.api_core import exceptions as google_exceptions
+except Exception:  # pragma: no cover - installed with google-generativeai
+    google_exceptions = None
+
+
+class LLMGatewayError(RuntimeError):
+    """Base class for gateway-level failures (overload, deadline)."""
+
+
+class LLMQueueTimeout(LLMGatewayError):
+    """No concurrency slot became free within the queue timeout."""
+
+
+class LLMDeadlineExceeded(LLMGatewayError):
+    """The call (including retries) did not finish before its deadline."""
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    if google_exceptions and isinstance(error, google_exceptions.ResourceExhausted):
+        return True
+    if getattr(error, 'code', None) == 429 or getattr(error, 'status_code', None) == 429:
+        return True
+    text = str(error)
+    return '429' in text or 'Resource has been exhausted' in text or 'quota' in text.lower()
+
+
+def _is_timeout(error: Exception) -> bool:
+    if google_exceptions and isinstance(error, google_exceptions.DeadlineExceeded):
+        return True
+    if isinstance(error, TimeoutError):
+        return True
+    text = str(error).lower()
+    return 'deadline' in text or 'timed out' in text or 'timeout' in text
+
+
+class LLMGateway:
+    def __init__(self):
+        self.max_concurrency = int(os.environ.get('LLM_MAX_CONCURRENCY', 4))
+        self.queue_timeout = float(os.environ.get('LLM_QUEUE_TIMEOUT_SECONDS', 5))
+        self.call_timeout = float(os.environ.get('LLM_CALL_TIMEOUT_SECONDS', 30))
+        self.max_retries = int(os.environ.get('LLM_MAX_RETRIES', 2))
+        self.backoff_base = float(os.environ.get('LLM_BACKOFF_BASE_SECONDS', 0.5))
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._in_flight = 0
+        self._callers: set[str] = set()
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def generate(self, model, prompt, caller: str, timeout: float | None = None, **kwargs):
+        """Blocking ``model.generate_content(prompt)`` under the gateway limits."""
+        deadline = time.monotonic() + (timeout or self.call_timeout)
+        with self._slot(caller, deadline):
+            started = time.perf_counter()
+            response = self._call_with_retries(model, prompt, caller, deadline, kwargs)
+            metrics.observe(f'llm.{caller}.latency_ms', (time.perf_counter() - started) * 1000)
+            self._record_usage(caller, response)
+            return response
+
+    def generate_stream(self, model, prompt, caller: str, timeout: float | None = None, **kwargs):
+        """Streaming variant; yields response chunks and holds the slot until the stream ends.
+
+        Rate-limit retries only happen before the first chunk is received.
+        """
+        deadline = time.monotonic() + (timeout or self.call_timeout)
+        with self._slot(caller, deadline):
+            started = time.perf_counter()
+            stream = self._call_with_retries(model, prompt, caller, deadline, {**kwargs, 'stream': True})
+            last = None
+            try:
+                for chunk in stream:
+                    last = chunk
+                    yield chunk
+            except Exception as e:
+                self._count_failure(caller, e)
+                raise
+            finally:
+                metrics.observe(f'llm.{caller}.latency_ms', (time.perf_counter() - started) * 1000)
+            self._record_usage(caller, last)
+
+    def stats(self) -> dict:
+        with self._lock:
+            callers = sorted(self._callers)
+            waiting, in_flight = self._waiting, self._in_flight
+        snapshot = metrics.snapshot('llm.')
+        per_caller = {}
+        for caller in callers:
+            prefix = f'llm.{caller}.'
+            per_caller[caller] = {
+                **{k[len(prefix):]: v for k, v in snapshot['counters'].items() if k.startswith(prefix)},
+                'latency_ms': snapshot['summaries'].get(f'{prefix}latency_ms'),
+                'queue_wait_ms': snapshot['summaries'].get(f'{prefix}queue_wait_ms')
+            }
+        return {
+            'max_concurrency': self.max_concurrency,
+            'in_flight': in_flight,
+            'waiting': waiting,
+            'queue_timeout_seconds': self.queue_timeout,
+            'call_timeout_seconds': self.call_timeout,
+            'max_retries': self.max_retries,
+            'callers': per_caller
+        }
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+    @contextmanager
+    def _slot(self, caller: str, deadline: float):
+        with self._lock:
+            self._callers.add(caller)
+            self._waiting += 1
+            metrics.set_gauge('llm.queue_depth', self._waiting)
+        queued_at = time.perf_counter()
+        wait_budget = max(0.0, min(self.queue_timeout, deadline - time.monotonic()))
+        acquired = self._slots.acquire(timeout=wait_budget)
+        with self._lock:
+            self._waiting -= 1
+            metrics.set_gauge('llm.queue_depth', self._waiting)
+            if acquired:
+                self._in_flight += 1
+                metrics.set_gauge('llm.in_flight', self._in_flight)
+        metrics.observe(f'llm.{caller}.queue_wait_ms', (time.perf_counter() - queued_at) * 1000)
+        if not acquired:
+            metrics.incr(f'llm.{caller}.queue_timeouts')
+            raise LLMQueueTimeout(f'LLM gateway busy: no slot free within {wait_budget:.1f}s ({self.max_concurrency} concurrent calls).')
+        try:
+            metrics.incr(f'llm.{caller}.calls')
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                metrics.set_gauge('llm.in_flight', self._in_flight)
+            self._slots.release()
+
+    def _call_with_retries(self, model, prompt, caller: str, deadline: float, kwargs: dict):
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                metrics.incr(f'llm.{caller}.timeouts')
+                raise LLMDeadlineExceeded(f'LLM call for {caller} exceeded its deadline.')
+            try:
+                return model.generate_content(prompt, request_options={'timeout': remaining}, **kwargs)
+            except Exception as e:
+                if _is_rate_limited(e) and attempt < self.max_retries:
+                    delay = self.backoff_base * (2 ** attempt) * (0.5 + random.random())
+                    if time.monotonic() + delay < deadline:
+                        metrics.incr(f'llm.{caller}.retries')
+                        time.sleep(delay)
+                        attempt += 1
+                        continue
+                self._count_failure(caller, e)
+                if _is_timeout(e):
+                    raise LLMDeadlineExceeded(f'LLM call for {caller} timed out: {e}') from e
+                raise
+
+    def _count_failure(self, caller: str, error: Exception):
+        if _is_timeout(error):
+            metrics.incr(f'llm.{caller}.timeouts')
+        elif _is_rate_limited(error):
+            metrics.incr(f'llm.{caller}.rate_limited')
+        else:
+            metrics.incr(f'llm.{caller}.errors')
+
+    def _record_usage(self, caller: str, response):
+        usage = getattr(response, 'usage_metadata', None)
+        if not usage:
+            return
+        for field, name in (('prompt_token_count', 'prompt_tokens'),
+                            ('candidates_token_count', 'output_tokens'),
+                            ('total_token_count', 'total_tokens')):
+            value = getattr(usage, field, None)
+            if value:
+                metrics.incr(f'llm.{caller}.{name}', value)
+
+
+# Process-wide gateway
+llm_gateway = LLMGateway()
+
+__all__ = ["llm_gateway", "LLMGateway", "LLMGatewayError", "LLMQueueTimeout", "LLMDeadlineExceeded"]
@@ -0,0 +1,89 @@
+"""Lightweight in-process metrics registry.
+
+Counters, gauges and latency summaries are kept per worker process and exposed
+through ``GET /api/metrics``. Nothing is shipped to an external system; the goal
+is to make cache hit rates, LLM latency and queue depths visible while tuning.
+"""
+import threading
+from collections import deque
+
+
+class _Summary:
+    """Count/sum/min/max plus a sliding window of samples for percentiles."""
+
+    __slots__ = ('count', 'total', 'min', 'max', 'samples')
+
+    def __init__(self, window: int = 512):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.samples = deque(maxlen=window)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.samples.append(value)
+
+    def snapshot(self) -> dict:
+        ordered = sorted(self.samples)
+
+        def _pct(p):
+            if not ordered:
+                return None
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 3)
+
+        return {
+            'count': self.count,
+            'avg': round(self.total / self.count, 3) if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'p50': _pct(0.50),
+            'p95': _pct(0.95),
+            'p99': _pct(0.99)
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: dict[str, float] = {}
+        self._gauges: dict[str, float] = {}
+        self._summaries: dict[str, _Summary] = {}
+
+    def incr(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            summary = self._summaries.get(name)
+            if summary is None:
+                summary = self._summaries[name] = _Summary()
+            summary.observe(value)
+
+    def counter(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self, prefix: str | None = None) -> dict:
+        with self._lock:
+            def _keep(name):
+                return prefix is None or name.startswith(prefix)
+            return {
+                'counters': {k: v for k, v in self._counters.items() if _keep(k)},
+                'gauges': {k: v for k, v in self._gauges.items() if _keep(k)},
+                'summaries': {k: s.snapshot() for k, s in self._summaries.items() if _keep(k)}
+            }
+
+
+# Process-wide registry
+metrics = MetricsRegistry()
+
+__all__ = ["metrics", "MetricsRegistry"]
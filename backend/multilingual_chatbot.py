@@ -3,16 +3,29 @@ Avoids recursive self-import issues under Python 3.13 when root project file nam
 Provides the symbols expected by app_integrated: MultilingualAgriChatbot, create_chatbot_routes.
 """
 
-import google.generativeai as genai
 from datetime import datetime
 import re
 import json
 
+from sse import gemini_text_chunks
+from llm_gateway import llm_gateway
+from llm_backends import configure as configure_llm, create_model
+from translation_memory import translation_memory
+from crop_advice_catalogue import crop_advice_catalogue
+from similarity_cache import similarity_cache
+from language_detector import detect_language, detect_languages
+
+_DELIMITED_ITEM = re.compile(r'<<<(\d+)>>>\s*(.*?)(?=<<<\d+>>>|\Z)', re.S)
+
 
 class MultilingualAgriChatbot:
+    # Bulk translation: strings per Gemini call and approximate prompt size cap
+    TRANSLATE_BATCH_MAX_ITEMS = 40
+    TRANSLATE_BATCH_MAX_CHARS = 6000
+
     def __init__(self, gemini_api_key: str):
-        genai.configure(api_key=gemini_api_key)
-        self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
+        configure_llm(gemini_api_key)
+        self.model = create_model('gemini-2.0-flash-exp')
         self.supported_languages = {
             'hi': 'Hindi', 'mr': 'Marathi', 'ta': 'Tamil', 'te': 'Telugu',
             'gu': 'Gujarati', 'bn': 'Bengali', 'en': 'English', 'kn': 'Kannada',
@@ -29,45 +42,106 @@ class MultilingualAgriChatbot:
         }
 
     def detect_language(self, text: str) -> str:
-        """Simple language detection based on character patterns"""
-        try:
-            # Devanagari scripts (Hindi, Marathi, etc.)
-            if re.search(r'[\u0900-\u097F]', text):
-                # More sophisticated detection could be added here
-                return 'hi'  # Default to Hindi for Devanagari
-            # Tamil script
-            elif re.search(r'[\u0B80-\u0BFF]', text):
-                return 'ta'
-            # Telugu script
-            elif re.search(r'[\u0C00-\u0C7F]', text):
-                return 'te'
-            # Gujarati script
-            elif re.search(r'[\u0A80-\u0AFF]', text):
-                return 'gu'
-            # Bengali script
-            elif re.search(r'[\u0980-\u09FF]', text):
-                return 'bn'
-            # Default to English if no regional script detected
-            else:
-                return 'en'
-        except Exception:
-            return 'en'
+        """Dominant-script detection (Marathi vs Hindi by stop words); see language_detector"""
+        return detect_language(text)
+
+    def detect_languages(self, texts: list[str]) -> list[str]:
+        return detect_languages(texts)
 
     def translate_text(self, text: str, target_lang='en', source_lang='auto'):
-        """Use Gemini for translation instead of googletrans"""
+        """Use Gemini for translation instead of googletrans (served from translation memory when seen before)"""
         try:
             if source_lang == target_lang or target_lang == 'en':
                 return text
-                
+
+            source_key = self.detect_language(text) if source_lang == 'auto' else source_lang
+            cached = translation_memory.get(text, source_key, target_lang)
+            if cached is not None:
+                return cached
+
             lang_names = self.supported_languages.get(target_lang, target_lang)
             prompt = f"Translate the following text to {lang_names}. Only provide the translation, no explanations:\n\n{text}"
             
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
+            response = llm_gateway.generate(self.model, prompt, caller='mchatbot_translate')
+            translated = response.text.strip()
+            if translated:
+                translation_memory.set(text, translated, source_key, target_lang)
+            return translated
         except Exception as e:
             print(f"Translation error: {e}")
             return text
 
+    def translate_batch(self, texts: list[str], target_lang='en', source_lang='auto') -> dict:
+        """Translate many strings, answering repeats from translation memory and
+        sending the rest to Gemini in delimited batches (one call per batch).
+        """
+        translations = list(texts)
+        if source_lang == target_lang or target_lang == 'en':
+            return {'translations': translations, 'cache_hits': 0, 'llm_calls': 0}
+
+        source_keys = self.detect_languages(texts) if source_lang == 'auto' else [source_lang] * len(texts)
+        keys = [translation_memory.build_key(t, src, target_lang) for t, src in zip(texts, source_keys)]
+        found = translation_memory.get_many(list(dict.fromkeys(keys)))
+        cache_hits = 0
+        pending: dict[str, list[int]] = {}
+        for i, key in enumerate(keys):
+            if key in found:
+                translations[i] = found[key]
+                cache_hits += 1
+            elif texts[i] and texts[i].strip():
+                pending.setdefault(key, []).append(i)
+
+        llm_calls = 0
+        unique = [(key, positions[0]) for key, positions in pending.items()]
+        for batch in self._translation_batches(unique, texts):
+            batch_texts = [texts[i] for _, i in batch]
+            try:
+                results = self._translate_delimited(batch_texts, target_lang)
+                llm_calls += 1
+            except Exception as e:
+                print(f"Batch translation error: {e}")
+                results = [None] * len(batch)
+            stored: dict[str, list[tuple[str, str]]] = {}
+            for (key, first), result in zip(batch, results):
+                if result is None:
+                    # Item lost in the batched reply: fall back to a single-string call
+                    result = self.translate_text(texts[first], target_lang, source_keys[first])
+                    llm_calls += 1
+                else:
+                    stored.setdefault(source_keys[first], []).append((texts[first], result))
+                for i in pending[key]:
+                    translations[i] = result
+            for src, pairs in stored.items():
+                translation_memory.set_many(pairs, src, target_lang)
+
+        return {'translations': translations, 'cache_hits': cache_hits, 'llm_calls': llm_calls}
+
+    def _translation_batches(self, items, texts):
+        batch, size = [], 0
+        for item in items:
+            length = len(texts[item[1]])
+            if batch and (len(batch) >= self.TRANSLATE_BATCH_MAX_ITEMS or size + length > self.TRANSLATE_BATCH_MAX_CHARS):
+                yield batch
+                batch, size = [], 0
+            batch.append(item)
+            size += length
+        if batch:
+            yield batch
+
+    def _translate_delimited(self, texts: list[str], target_lang: str) -> list[str | None]:
+        """One Gemini call for several strings, each wrapped in a numbered ``<<<n>>>`` marker."""
+        lang_names = self.supported_languages.get(target_lang, target_lang)
+        blocks = '\n'.join(f"<<<{i}>>>\n{text}" for i, text in enumerate(texts))
+        prompt = (
+            f"Translate each of the following {len(texts)} texts to {lang_names}. "
+            "Keep every <<<n>>> marker exactly as given, on its own line, followed by the translation "
+            "of that text. Only provide the markers and translations, no explanations:\n\n"
+            f"{blocks}"
+        )
+        response = llm_gateway.generate(self.model, prompt, caller='mchatbot_translate_batch')
+        parsed = {int(n): body.strip() for n, body in _DELIMITED_ITEM.findall(response.text or '')}
+        return [parsed.get(i) or None for i in range(len(texts))]
+
     def get_agricultural_context(self, query: str, user_lang='en'):
         lang_name = self.supported_languages.get(user_lang, 'English')
         
@@ -94,23 +168,31 @@ class MultilingualAgriChatbot:
         
         return f"{context}\n\nQuery: {query}"
 
-    def generate_response(self, user_query: str, user_lang='en'):
+    def generate_response(self, user_query: str, user_lang='en', use_cache=True):
+        """Answer a free-form query. ``use_cache=False`` skips the near-duplicate cache,
+        which templated queries (crop advice) must do: they differ only in the crop name."""
         try:
-            prompt = self.get_agricultural_context(user_query, user_lang)
-            
-            response = self.model.generate_content(prompt)
-            answer = response.text.strip()
-            
-            # Clean up repeated characters if any
-            answer = re.sub(r'([\u0900-\u097F\w])\1{3,}', r'\1\1', answer)
+            cached = similarity_cache.lookup('mchatbot', user_lang, user_query) if use_cache else None
+            if cached:
+                answer = cached['answer']
+            else:
+                prompt = self.get_agricultural_context(user_query, user_lang)
+                response = llm_gateway.generate(self.model, prompt, caller='mchatbot')
+                answer = self.clean_answer(response.text)
+                if use_cache and answer:
+                    similarity_cache.store('mchatbot', user_lang, user_query, answer)
             
-            return {
+            result = {
                 'response': answer,
                 'detected_language': user_lang,
                 'original_query': user_query,
                 'timestamp': datetime.now().isoformat(),
-                'language_name': self.supported_languages.get(user_lang, 'English')
+                'language_name': self.supported_languages.get(user_lang, 'English'),
+                'cached': bool(cached)
             }
+            if cached:
+                result['similarity'] = cached['similarity']
+            return result
         except Exception as e:
             error_msg = f"मुझे खेद है, तकनीकी समस्या है" if user_lang == 'hi' else "Sorry, there's a technical issue"
             return {
@@ -120,7 +202,55 @@ class MultilingualAgriChatbot:
                 'timestamp': datetime.now().isoformat()
             }
 
+    def generate_response_stream(self, user_query: str, user_lang='en'):
+        """Yield the answer as text chunks using Gemini streaming generation.
+
+        Chunks are raw model output; callers should send ``clean_answer`` of the
+        joined text as the final version.
+        """
+        cached = similarity_cache.lookup('mchatbot', user_lang, user_query)
+        if cached:
+            yield cached['answer']
+            return
+        prompt = self.get_agricultural_context(user_query, user_lang)
+        parts = []
+        for text in gemini_text_chunks(llm_gateway.generate_stream(self.model, prompt, caller='mchatbot')):
+            parts.append(text)
+            yield text
+        answer = self.clean_answer(''.join(parts))
+        if answer:
+            similarity_cache.store('mchatbot', user_lang, user_query, answer)
+
+    @staticmethod
+    def clean_answer(answer: str) -> str:
+        # Clean up repeated characters if any
+        return re.sub(r'([\u0900-\u097F\w])\1{3,}', r'\1\1', answer.strip())
+
     def get_crop_specific_advice(self, crop_name: str, query_type: str, user_lang='en'):
+        """Serve advice from the precomputed catalogue; generate live on a miss.
+
+        Live answers are stored only for catalogue crops in supported languages.
+        """
+        catalogued = crop_advice_catalogue.accepts(crop_name, user_lang, self.supported_languages)
+        entry = crop_advice_catalogue.get(crop_name, query_type, user_lang) if catalogued else None
+        source = 'catalogue'
+        if entry is None:
+            entry, advice = crop_advice_catalogue.generate(self, crop_name, query_type, user_lang, store=catalogued)
+            source = 'live'
+            if entry is None:
+                # Generation failed; return the chatbot's error payload unchanged
+                return advice
+        return {
+            'response': entry['response'],
+            'detected_language': user_lang,
+            'original_query': entry.get('original_query'),
+            'timestamp': datetime.now().isoformat(),
+            'language_name': entry.get('language_name') or self.supported_languages.get(user_lang, 'English'),
+            'source': source,
+            'generated_at': entry['generated_at'].isoformat()
+        }
+
+    def generate_crop_advice(self, crop_name: str, query_type: str, user_lang='en'):
         lang_name = self.supported_languages.get(user_lang, 'English')
         
         base_queries = {
@@ -136,7 +266,7 @@ class MultilingualAgriChatbot:
         if user_lang != 'en':
             query += f" Please respond in {lang_name} language only."
             
-        return self.generate_response(query, user_lang)
+        return self.generate_response(query, user_lang, use_cache=False)
 
 
 def create_chatbot_routes(*_args, **_kwargs):  # stub to satisfy import
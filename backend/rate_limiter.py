@@ -0,0 +1,152 @@
+"""Token-bucket rate limiter for upstream market data APIs.
+
+Each source (``alpha_vantage``, ``commodities_api``, ``data_gov_in`` …) has a
+per-minute bucket (capacity = the per-minute quota, refilled continuously)
+and an optional per-day quota counted per UTC day, which is how the free
+tiers meter usage. ``try_acquire(source)`` is O(1): it refills the bucket from
+the elapsed time and takes one token if both quotas allow it.
+
+Two modes (``RATE_LIMIT_MODE``):
+
+- ``mongo`` (default): one document per source in ``rate_limit_buckets``,
+  updated with a single ``find_one_and_update`` pipeline (refill, check and
+  take in one atomic step), so the quota holds across all gunicorn workers and
+  hosts. If Mongo errors, the call falls back to the local bucket.
+- ``local``: in-process buckets, the quota is per worker.
+
+Quotas are registered by the caller with defaults and can be overridden with
+``RATE_LIMIT_<SOURCE>_PER_MINUTE`` / ``RATE_LIMIT_<SOURCE>_PER_DAY`` (``0``
+disables a limit). Allowed and throttled calls are counted in the metrics
+registry (``rate_limiter.<source>.allowed`` / ``.throttled_minute`` /
+``.throttled_day``).
+"""
+import os
+import time
+import threading
+from datetime import datetime
+
+from database import get_collection
+from metrics import metrics
+
+RATE_LIMIT_MODES = ('mongo', 'local')
+
+
+def _env_limit(source: str, period: str, default):
+    value = os.environ.get(f'RATE_LIMIT_{source.upper()}_PER_{period}')
+    if value is None:
+        return default
+    return int(value) or None
+
+
+class RateLimiter:
+    COLLECTION = 'rate_limit_buckets'
+
+    def __init__(self):
+        self.mode = os.environ.get('RATE_LIMIT_MODE', 'mongo').lower()
+        if self.mode not in RATE_LIMIT_MODES:
+            print(f"[RateLimiter] Unknown RATE_LIMIT_MODE '{self.mode}', using 'mongo'")
+            self.mode = 'mongo'
+        self.quotas: dict[str, tuple[int | None, int | None]] = {}
+        # source -> [tokens, last refill (epoch s), UTC day, calls that day]
+        self._buckets: dict[str, list] = {}
+        self._lock = threading.Lock()
+        self._collection = None
+        if self.mode == 'mongo':
+            try:
+                self._collection = get_collection(self.COLLECTION)
+            except Exception as e:
+                print(f"[RateLimiter] Mongo unavailable, using per-process buckets: {e}")
+                self.mode = 'local'
+
+    def configure(self, source: str, per_minute: int | None = None, per_day: int | None = None):
+        """Register a source's quotas (environment overrides win)."""
+        self.quotas[source] = (_env_limit(source, 'MINUTE', per_minute), _env_limit(source, 'DAY', per_day))
+
+    def try_acquire(self, source: str) -> bool:
+        """Take one call from ``source``'s quotas; False (and nothing taken) when throttled."""
+        per_minute, per_day = self.quotas.get(source, (None, None))
+        if per_minute is None and per_day is None:
+            return True
+        now = time.time()
+        day = datetime.utcfromtimestamp(now).strftime('%Y-%m-%d')
+        outcome = None
+        if self._collection is not None:
+            outcome = self._acquire_mongo(source, per_minute, per_day, now, day)
+        if outcome is None:
+            outcome = self._acquire_local(source, per_minute, per_day, now, day)
+        metrics.incr(f'rate_limiter.{source}.{outcome}')
+        return outcome == 'allowed'
+
+    def _acquire_local(self, source, per_minute, per_day, now, day) -> str:
+        with self._lock:
+            bucket = self._buckets.get(source)
+            if bucket is None:
+                bucket = self._buckets[source] = [float(per_minute or 0), now, day, 0]
+            if per_minute is not None:
+                bucket[0] = min(per_minute, bucket[0] + max(0.0, now - bucket[1]) * per_minute / 60)
+            bucket[1] = now
+            if bucket[2] != day:
+                bucket[2], bucket[3] = day, 0
+            if per_minute is not None and bucket[0] < 1:
+                return 'throttled_minute'
+            if per_day is not None and bucket[3] >= per_day:
+                return 'throttled_day'
+            if per_minute is not None:
+                bucket[0] -= 1
+            bucket[3] += 1
+            return 'allowed'
+
+    def _acquire_mongo(self, source, per_minute, per_day, now, day) -> str | None:
+        capacity = per_minute if per_minute is not None else 1
+        refill_per_second = per_minute / 60 if per_minute is not None else 0
+        # Stage 1 refills and rolls the day over, stage 2 decides, stage 3 takes the token
+        pipeline = [
+            {'$set': {
+                'tokens': {'$min': [capacity, {'$add': [
+                    {'$ifNull': ['$tokens', capacity]},
+                    {'$multiply': [{'$max': [0, {'$subtract': [now, {'$ifNull': ['$updated_at', now]}]}]},
+                                   refill_per_second]}
+                ]}]},
+                'day_count': {'$cond': [{'$eq': ['$day', day]}, {'$ifNull': ['$day_count', 0]}, 0]},
+                'day': day,
+                'updated_at': now
+            }},
+            {'$set': {
+                'minute_ok': {'$gte': ['$tokens', 1]} if per_minute is not None else {'$literal': True},
+                'day_ok': {'$lt': ['$day_count', per_day]} if per_day is not None else {'$literal': True}
+            }},
+            {'$set': {
+                'granted': {'$and': ['$minute_ok', '$day_ok']},
+                'tokens': {'$cond': [{'$and': ['$minute_ok', '$day_ok']}, {'$subtract': ['$tokens', 1]}, '$tokens']},
+                'day_count': {'$cond': [{'$and': ['$minute_ok', '$day_ok']}, {'$add': ['$day_count', 1]}, '$day_count']}
+            }}
+        ]
+        try:
+            from pymongo import ReturnDocument
+            doc = self._collection.find_one_and_update(
+                {'_id': source}, pipeline, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except Exception as e:
+            metrics.incr('rate_limiter.errors')
+            print(f"[RateLimiter] shared bucket for {source} unavailable, using the local one: {e}")
+            return None
+        if doc['granted']:
+            return 'allowed'
+        return 'throttled_minute' if not doc['minute_ok'] else 'throttled_day'
+
+    def stats(self) -> dict:
+        sources = {}
+        for source, (per_minute, per_day) in self.quotas.items():
+            sources[source] = {
+                'per_minute': per_minute,
+                'per_day': per_day,
+                'allowed': metrics.counter(f'rate_limiter.{source}.allowed'),
+                'throttled_minute': metrics.counter(f'rate_limiter.{source}.throttled_minute'),
+                'throttled_day': metrics.counter(f'rate_limiter.{source}.throttled_day')
+            }
+        return {'mode': self.mode, 'errors': metrics.counter('rate_limiter.errors'), 'sources': sources}
+
+
+rate_limiter = RateLimiter()
+
+__all__ = ["rate_limiter", "RateLimiter", "RATE_LIMIT_MODES"]
@@ -7,6 +7,10 @@ from datetime import datetime, timedelta
 import logging
 from typing import Dict, List, Optional, Any
 from database import get_collection
+from leader_lease import leader_lease
+from rate_limiter import rate_limiter
+from single_flight import single_flight
+from metrics import metrics
 import time
 from threading import Thread
 import schedule
@@ -36,10 +40,17 @@ class RealTimeMarketService:
         # Cache for real-time data
         self.cache_collection = get_collection('realtime_market_cache')
         self.cache_duration = 300  # 5 minutes cache for real-time data
+        # Stale-while-revalidate: entries up to the soft TTL are fresh; up to the hard TTL
+        # they are served as 'stale' while a background refresh runs; older ones are refetched
+        self.cache_soft_ttl = int(os.environ.get('MARKET_CACHE_SOFT_TTL_SECONDS', self.cache_duration))
+        self.cache_hard_ttl = max(self.cache_soft_ttl, int(os.environ.get('MARKET_CACHE_HARD_TTL_SECONDS', 1800)))
         
-        # Rate limiting
-        self.api_call_counts = {}
-        self.last_api_calls = {}
+        # Rate limiting: token buckets shared by all workers (see rate_limiter.py);
+        # Alpha Vantage's free tier also caps calls per day
+        self.rate_limiter = rate_limiter
+        self.rate_limiter.configure('alpha_vantage', per_minute=5, per_day=25)
+        self.rate_limiter.configure('commodities_api', per_minute=10)
+        self.rate_limiter.configure('data_gov_in', per_minute=30)
         
         # Commodity symbols for different sources
         self.commodity_symbols = {
@@ -87,16 +98,22 @@ class RealTimeMarketService:
             }
         }
         
+        # Concurrent cache misses for one commodity/region share a single upstream fetch
+        self.price_flight = single_flight('market_price')
+
+        # Only the lease holder refreshes; other workers read realtime_market_cache
+        self.refresh_lease = leader_lease('market-price-refresh')
+
         # Start background price fetching
         self.start_background_updates()
 
     def start_background_updates(self):
-        """Start background thread for periodic price updates"""
+        """Start background thread for periodic price updates (jobs run on the leader only)"""
         def run_scheduler():
             # Update prices every 2 minutes for free tier optimization
-            schedule.every(2).minutes.do(self.update_all_commodity_prices)
+            schedule.every(2).minutes.do(self._run_if_leader, self.update_all_commodity_prices)
             # Clean old cache every hour
-            schedule.every().hour.do(self.clean_old_cache)
+            schedule.every().hour.do(self._run_if_leader, self.clean_old_cache)
             
             while True:
                 schedule.run_pending()
@@ -106,41 +123,32 @@ class RealTimeMarketService:
         thread.start()
         self.logger.info("Background price updates started")
 
-    def can_make_api_call(self, api_name: str, max_calls_per_minute: int = 5) -> bool:
-        """Check if we can make an API call without hitting rate limits"""
-        current_time = time.time()
-        
-        # Initialize tracking if not exists
-        if api_name not in self.api_call_counts:
-            self.api_call_counts[api_name] = []
-        
-        # Remove calls older than 1 minute
-        self.api_call_counts[api_name] = [
-            call_time for call_time in self.api_call_counts[api_name]
-            if current_time - call_time < 60
-        ]
-        
-        # Check if we're under the limit
-        return len(self.api_call_counts[api_name]) < max_calls_per_minute
+    def _run_if_leader(self, job):
+        if self.refresh_lease.is_leader():
+            job()
 
-    def record_api_call(self, api_name: str):
-        """Record an API call for rate limiting"""
-        current_time = time.time()
-        if api_name not in self.api_call_counts:
-            self.api_call_counts[api_name] = []
-        self.api_call_counts[api_name].append(current_time)
+    def get_cached_price(self, commodity: str, source: str, allow_stale: bool = False) -> Optional[Dict]:
+        """Get cached price data.
 
-    def get_cached_price(self, commodity: str, source: str) -> Optional[Dict]:
-        """Get cached price data"""
+        Entries younger than the soft TTL are returned as they are; with
+        ``allow_stale``, entries up to the hard TTL are returned too, marked
+        ``data_freshness='stale'``. Both carry ``cache_age_seconds``.
+        """
         try:
             cache_key = f"{commodity}_{source}"
             cached = self.cache_collection.find_one({'key': cache_key})
-            
-            if cached and datetime.utcnow() - cached['timestamp'] < timedelta(seconds=self.cache_duration):
+            if not cached:
+                return None
+            age = (datetime.utcnow() - cached['timestamp']).total_seconds()
+            stale = age >= self.cache_soft_ttl
+            if age < (self.cache_hard_ttl if allow_stale else self.cache_soft_ttl):
                 cached_data = dict(cached.get('data', {}))
                 if 'data_source' not in cached_data and cached_data.get('source'):
                     cached_data['data_source'] = cached_data['source']
                 cached_data.setdefault('data_source', source)
+                cached_data['cache_age_seconds'] = round(age, 1)
+                if stale:
+                    cached_data['data_freshness'] = 'stale'
                 return cached_data
         except Exception as e:
             self.logger.error(f"Cache retrieval error: {e}")
@@ -165,17 +173,82 @@ class RealTimeMarketService:
         except Exception as e:
             self.logger.error(f"Cache storage error: {e}")
 
-    def get_real_time_price_multi_source(self, commodity: str, region: str = 'US') -> Dict:
-        """Get real-time price from multiple sources with fallback"""
-        sources_to_try = []
-        
-        # Prioritize sources based on region, with Mandi API first as requested
+    def _sources_for(self, region: str) -> List[str]:
+        # Prioritize sources based on region, with Mandi API first as requested;
+        # sources missing their API key are never fetched, so they are left out
         if region.upper() == 'IN':
-            sources_to_try = ['data_gov_in', 'yahoo_finance', 'alpha_vantage', 'commodities_api']
+            sources = ['data_gov_in', 'yahoo_finance', 'alpha_vantage', 'commodities_api']
         else:
-            sources_to_try = ['data_gov_in', 'yahoo_finance', 'alpha_vantage', 'commodities_api', 'world_bank']
-        
-        for source in sources_to_try:
+            sources = ['data_gov_in', 'yahoo_finance', 'alpha_vantage', 'commodities_api', 'world_bank']
+        return [source for source in sources if self._source_configured(source)]
+
+    def _source_configured(self, source: str) -> bool:
+        if source == 'alpha_vantage':
+            return self.api_keys['alpha_vantage'] != 'demo'
+        if source in ('commodities_api', 'data_gov_in'):
+            return bool(self.api_keys[source])
+        return True
+
+    def _cached_price_any(self, commodity: str, region: str, allow_stale: bool = False) -> Optional[Dict]:
+        """Highest-priority usable cached price across this region's sources.
+
+        A fresh entry from a lower-priority source is only used while every
+        higher-priority source also has an entry (fresh or stale); otherwise the
+        preferred source has not been fetched yet or has expired. With
+        ``allow_stale``, such fallback entries and stale entries are returned
+        with ``_refresh`` set so the caller refreshes in the background.
+        """
+        fallback = None
+        missing_preferred = False
+        for source in self._sources_for(region):
+            cached_data = self.get_cached_price(commodity, source, allow_stale=True)
+            if not cached_data:
+                missing_preferred = True
+                continue
+            cached_data['from_cache'] = True
+            if cached_data.get('data_freshness') != 'stale' and not missing_preferred:
+                return cached_data
+            fallback = fallback or cached_data
+        if fallback and allow_stale:
+            fallback['_refresh'] = True
+            return fallback
+        return None
+
+    def get_real_time_price_multi_source(self, commodity: str, region: str = 'US') -> Dict:
+        """Get real-time price from multiple sources with fallback.
+
+        Fresh cache hits return directly. Stale hits (past the soft TTL), and
+        fresh hits from a lower-priority source while a preferred one has no
+        entry, are returned at once while one background fetch refreshes them. On a miss
+        (or past the hard TTL), concurrent callers for the same commodity and
+        region (in this process, and across workers through the Mongo lock)
+        share one upstream fetch.
+        """
+        key = f'{commodity}:{region.upper()}'
+
+        def fetch():
+            return self._fetch_price_multi_source(commodity, region)
+
+        def recheck():
+            return self._cached_price_any(commodity, region)
+
+        cached_data = self._cached_price_any(commodity, region, allow_stale=True)
+        if cached_data:
+            if cached_data.pop('_refresh', False):
+                stale = cached_data.get('data_freshness') == 'stale'
+                metrics.incr('market_cache.stale_hits' if stale else 'market_cache.fallback_hits')
+                self.price_flight.do_in_background(key, fetch, recheck=recheck)
+            else:
+                metrics.incr('market_cache.fresh_hits')
+            return cached_data
+        metrics.incr('market_cache.misses')
+        data = self.price_flight.do(key, fetch, recheck=recheck)
+        if data and not data.get('from_cache'):
+            data['cache_age_seconds'] = 0
+        return data
+
+    def _fetch_price_multi_source(self, commodity: str, region: str) -> Dict:
+        for source in self._sources_for(region):
             try:
                 # Check cache first
                 cached_data = self.get_cached_price(commodity, source)
@@ -187,21 +260,18 @@ class RealTimeMarketService:
                 if source == 'yahoo_finance':
                     data = self._fetch_yahoo_finance_price(commodity)
                 elif source == 'alpha_vantage' and self.api_keys['alpha_vantage'] != 'demo':
-                    if self.can_make_api_call('alpha_vantage', 5):
+                    if self.rate_limiter.try_acquire('alpha_vantage'):
                         data = self._fetch_alpha_vantage_price(commodity)
-                        self.record_api_call('alpha_vantage')
                     else:
                         continue
                 elif source == 'commodities_api' and self.api_keys['commodities_api']:
-                    if self.can_make_api_call('commodities_api', 10):
+                    if self.rate_limiter.try_acquire('commodities_api'):
                         data = self._fetch_commodities_api_price(commodity)
-                        self.record_api_call('commodities_api')
                     else:
                         continue
                 elif source == 'data_gov_in' and self.api_keys['data_gov_in']:
-                    if self.can_make_api_call('data_gov_in', 30):
+                    if self.rate_limiter.try_acquire('data_gov_in'):
                         data = self._fetch_indian_govt_price(commodity)
-                        self.record_api_call('data_gov_in')
                     else:
                         continue
                 elif source == 'world_bank':
@@ -0,0 +1,170 @@
+"""Two-level cache for Gemini yield recommendations.
+
+The recommendation prompt only depends on the crop, the (bucketed) predicted
+yield, the yield category, the confidence range, the field conditions and the
+response language. Keys are built from those inputs after quantization, so
+near-identical requests share one Gemini answer.
+
+L1 is an in-process LRU with expiry; L2 is the ``yield_recommendation_cache``
+Mongo collection with a TTL index so entries survive restarts and are shared
+by all gunicorn workers.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from database import get_collection
+from metrics import metrics
+
+
+def _quantize(value, step):
+    """Round ``value`` to the nearest multiple of ``step``; non-numeric values pass through."""
+    try:
+        numeric = float(value)
+    except (TypeError, ValueError):
+        return None if value in (None, '') else str(value).strip().lower()
+    return round(round(numeric / step) * step, 6)
+
+
+def _significant(value, digits=2):
+    """Relative bucketing for quantities spanning orders of magnitude (area, total fertilizer)."""
+    try:
+        numeric = float(value)
+    except (TypeError, ValueError):
+        return None if value in (None, '') else str(value).strip().lower()
+    if numeric == 0:
+        return 0.0
+    return float(f"{numeric:.{digits}g}")
+
+
+class RecommendationCache:
+    COLLECTION = 'yield_recommendation_cache'
+    # Quantization steps for the fields that reach the prompt
+    YIELD_STEP = 0.1        # t/ha
+    RAINFALL_STEP = 50.0    # mm
+
+    def __init__(self):
+        self.l1_size = int(os.environ.get('RECOMMENDATION_CACHE_L1_SIZE', 512))
+        self.ttl_seconds = int(os.environ.get('RECOMMENDATION_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+        self._l1: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._collection = None
+        if os.environ.get('RECOMMENDATION_CACHE_MONGO', 'true').lower() in ('1', 'true', 'yes'):
+            try:
+                collection = get_collection(self.COLLECTION)
+                collection.create_index('key', unique=True)
+                collection.create_index('created_at', expireAfterSeconds=self.ttl_seconds)
+                self._collection = collection
+            except Exception as e:
+                print(f"[RecommendationCache] Mongo L2 disabled: {e}")
+
+    # ------------------------------------------------------------------
+    # Keys
+    # ------------------------------------------------------------------
+    def build_key(self, crop, predicted_yield, yield_category, confidence_lower, confidence_upper,
+                  conditions: dict, language: str, model_name: str) -> str:
+        quantized = {
+            'crop': str(crop or '').strip().lower(),
+            'yield': _quantize(predicted_yield, self.YIELD_STEP),
+            'category': str(yield_category or '').strip().lower(),
+            'ci': [_quantize(confidence_lower, self.YIELD_STEP), _quantize(confidence_upper, self.YIELD_STEP)],
+            'area': _significant(conditions.get('area')),
+            'rainfall': _quantize(conditions.get('rainfall'), self.RAINFALL_STEP),
+            'fertilizer': _significant(conditions.get('fertilizer')),
+            'pesticide': _significant(conditions.get('pesticide')),
+            'season': str(conditions.get('season') or '').strip().lower(),
+            'state': str(conditions.get('state') or '').strip().lower(),
+            'language': language,
+            'model': model_name
+        }
+        encoded = json.dumps(quantized, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+    # ------------------------------------------------------------------
+    # Lookup / store
+    # ------------------------------------------------------------------
+    def get(self, key: str) -> dict | None:
+        now = time.time()
+        with self._lock:
+            entry = self._l1.get(key)
+            if entry and entry[0] > now:
+                self._l1.move_to_end(key)
+                metrics.incr('recommendation_cache.l1_hits')
+                return entry[1]
+            if entry:
+                del self._l1[key]
+
+        if self._collection is not None:
+            try:
+                doc = self._collection.find_one({'key': key})
+                # TTL monitor only runs about once a minute; re-check expiry here
+                if doc and datetime.utcnow() - doc['created_at'] < timedelta(seconds=self.ttl_seconds):
+                    value = {'recommendations': doc['recommendations'], 'raw_text': doc.get('raw_text', '')}
+                    remaining = self.ttl_seconds - (datetime.utcnow() - doc['created_at']).total_seconds()
+                    self._put_l1(key, value, remaining)
+                    metrics.incr('recommendation_cache.l2_hits')
+                    return value
+            except Exception as e:
+                metrics.incr('recommendation_cache.errors')
+                print(f"[RecommendationCache] L2 lookup failed: {e}")
+
+        metrics.incr('recommendation_cache.misses')
+        return None
+
+    def set(self, key: str, recommendations: dict, raw_text: str = '', language: str | None = None):
+        value = {'recommendations': recommendations, 'raw_text': raw_text}
+        self._put_l1(key, value, self.ttl_seconds)
+        metrics.incr('recommendation_cache.stores')
+        if self._collection is not None:
+            try:
+                self._collection.update_one(
+                    {'key': key},
+                    {'$set': {
+                        'key': key,
+                        'recommendations': recommendations,
+                        'raw_text': raw_text,
+                        'language': language,
+                        'created_at': datetime.utcnow()
+                    }},
+                    upsert=True
+                )
+            except Exception as e:
+                metrics.incr('recommendation_cache.errors')
+                print(f"[RecommendationCache] L2 store failed: {e}")
+
+    def _put_l1(self, key: str, value: dict, ttl_seconds: float):
+        with self._lock:
+            self._l1[key] = (time.time() + ttl_seconds, value)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.l1_size:
+                self._l1.popitem(last=False)
+
+    def stats(self) -> dict:
+        l1_hits = metrics.counter('recommendation_cache.l1_hits')
+        l2_hits = metrics.counter('recommendation_cache.l2_hits')
+        misses = metrics.counter('recommendation_cache.misses')
+        lookups = l1_hits + l2_hits + misses
+        with self._lock:
+            l1_entries = len(self._l1)
+        return {
+            'l1_hits': l1_hits,
+            'l2_hits': l2_hits,
+            'misses': misses,
+            'stores': metrics.counter('recommendation_cache.stores'),
+            'errors': metrics.counter('recommendation_cache.errors'),
+            'hit_rate': round((l1_hits + l2_hits) / lookups, 4) if lookups else None,
+            'l1_entries': l1_entries,
+            'l1_capacity': self.l1_size,
+            'ttl_seconds': self.ttl_seconds,
+            'l2_enabled': self._collection is not None
+        }
+
+
+# Global instance
+recommendation_cache = RecommendationCache()
+
+__all__ = ["recommendation_cache", "RecommendationCache"]
@@ -0,0 +1,326 @@
+"""Near-duplicate query cache for the chatbots.
+
+Farmer questions repeat with small wording changes ("best fertilizer for
+wheat" / "Best fertiliser for wheat?"). Before a chatbot question goes to the
+LLM gateway it is looked up here:
+
+1. the text is normalized (NFKC, lower-case, punctuation/symbols dropped,
+   whitespace collapsed) and shingled into character n-grams;
+2. a MinHash signature (numpy, ``SIMILARITY_CACHE_NUM_PERM`` permutations) is
+   split into LSH bands to find candidate entries in O(bands);
+3. candidates are scored by exact Jaccard similarity of their shingle sets and
+   served only if the score reaches the threshold for the query language and
+   the numbers ("2 acres" vs "20 acres") and the crop, state and season words
+   ("wheat in Punjab during rabi" vs "rice in Punjab during rabi") in both
+   questions are identical. One different word barely moves the similarity of
+   a long question, so these must match exactly rather than by score.
+
+The threshold is the hit-rate / accuracy knob: lower values serve more cached
+answers to looser paraphrases. ``SIMILARITY_CACHE_THRESHOLD`` sets the default,
+``SIMILARITY_CACHE_THRESHOLD_<LANG>`` (e.g. ``_HI``) overrides it per language.
+Served similarities are tracked so the effect of a threshold is visible at
+``GET /api/metrics``. Everything is in-process and bounded (LRU + TTL).
+"""
+import os
+import re
+import time
+import zlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+from metrics import metrics
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_WHITESPACE = re.compile(r'\s+')
+_NUMBER = re.compile(r'\d+(?:\.\d+)?')
+
+# British spellings folded onto the American ones before shingling
+_SPELLINGS = {
+    'fertiliser': 'fertilizer', 'fertilisers': 'fertilizers', 'fertilise': 'fertilize',
+    'fertilised': 'fertilized', 'fertilising': 'fertilizing', 'fertilisation': 'fertilization',
+    'colour': 'color', 'mould': 'mold', 'plough': 'plow', 'ploughing': 'plowing'
+}
+
+# Crop, state and season words a cached answer is specific to. Synonyms map to
+# one canonical term so "paddy" and "rice" still match each other.
+_KEY_TERMS = {
+    # crops
+    'rice': 'rice', 'paddy': 'rice', 'wheat': 'wheat', 'maize': 'maize', 'corn': 'maize',
+    'bajra': 'bajra', 'pearl millet': 'bajra', 'jowar': 'jowar', 'sorghum': 'jowar', 'ragi': 'ragi',
+    'finger millet': 'ragi', 'millet': 'millet', 'barley': 'barley', 'cotton': 'cotton', 'jute': 'jute',
+    'sugarcane': 'sugarcane', 'soybean': 'soyabean', 'soyabean': 'soyabean', 'groundnut': 'groundnut',
+    'peanut': 'groundnut', 'mustard': 'mustard', 'rapeseed': 'mustard', 'sunflower': 'sunflower',
+    'sesame': 'sesamum', 'sesamum': 'sesamum', 'linseed': 'linseed', 'castor': 'castor',
+    'safflower': 'safflower', 'gram': 'gram', 'chickpea': 'gram', 'chana': 'gram', 'arhar': 'arhar',
+    'tur': 'arhar', 'pigeon pea': 'arhar', 'moong': 'moong', 'green gram': 'moong', 'urad': 'urad',
+    'black gram': 'urad', 'masoor': 'masoor', 'lentil': 'masoor', 'cowpea': 'cowpea', 'peas': 'peas',
+    'potato': 'potato', 'sweet potato': 'sweet potato', 'onion': 'onion', 'garlic': 'garlic',
+    'tomato': 'tomato', 'brinjal': 'brinjal', 'eggplant': 'brinjal', 'chilli': 'chilli', 'chili': 'chilli',
+    'chillies': 'chilli', 'cabbage': 'cabbage', 'cauliflower': 'cauliflower', 'okra': 'okra',
+    'banana': 'banana', 'mango': 'mango', 'grape': 'grape', 'apple': 'apple', 'orange': 'orange',
+    'pomegranate': 'pomegranate', 'papaya': 'papaya', 'coconut': 'coconut', 'arecanut': 'arecanut',
+    'cashew': 'cashewnut', 'cashewnut': 'cashewnut', 'tea': 'tea', 'coffee': 'coffee', 'rubber': 'rubber',
+    'tobacco': 'tobacco', 'turmeric': 'turmeric', 'ginger': 'ginger', 'cardamom': 'cardamom',
+    'black pepper': 'black pepper', 'coriander': 'coriander', 'tapioca': 'tapioca', 'cassava': 'tapioca',
+    'धान': 'rice', 'चावल': 'rice', 'गेहूं': 'wheat', 'गेहूँ': 'wheat', 'गहू': 'wheat', 'मक्का': 'maize',
+    'मका': 'maize', 'बाजरा': 'bajra', 'ज्वार': 'jowar', 'कपास': 'cotton', 'गन्ना': 'sugarcane',
+    'ऊस': 'sugarcane', 'सोयाबीन': 'soyabean', 'मूंगफली': 'groundnut', 'सरसों': 'mustard', 'चना': 'gram',
+    'हरभरा': 'gram', 'आलू': 'potato', 'प्याज': 'onion', 'कांदा': 'onion', 'टमाटर': 'tomato',
+    # states
+    'andhra pradesh': 'andhra pradesh', 'arunachal pradesh': 'arunachal pradesh', 'assam': 'assam',
+    'bihar': 'bihar', 'chhattisgarh': 'chhattisgarh', 'delhi': 'delhi', 'goa': 'goa', 'gujarat': 'gujarat',
+    'haryana': 'haryana', 'himachal pradesh': 'himachal pradesh', 'jammu': 'jammu and kashmir',
+    'kashmir': 'jammu and kashmir', 'jharkhand': 'jharkhand', 'karnataka': 'karnataka', 'kerala': 'kerala',
+    'madhya pradesh': 'madhya pradesh', 'maharashtra': 'maharashtra', 'manipur': 'manipur',
+    'meghalaya': 'meghalaya', 'mizoram': 'mizoram', 'nagaland': 'nagaland', 'odisha': 'odisha',
+    'orissa': 'odisha', 'puducherry': 'puducherry', 'punjab': 'punjab', 'rajasthan': 'rajasthan',
+    'sikkim': 'sikkim', 'tamil nadu': 'tamil nadu', 'telangana': 'telangana', 'tripura': 'tripura',
+    'uttar pradesh': 'uttar pradesh', 'uttarakhand': 'uttarakhand', 'west bengal': 'west bengal',
+    'पंजाब': 'punjab', 'हरियाणा': 'haryana', 'बिहार': 'bihar', 'महाराष्ट्र': 'maharashtra',
+    'राजस्थान': 'rajasthan', 'गुजरात': 'gujarat', 'उत्तर प्रदेश': 'uttar pradesh', 'मध्य प्रदेश': 'madhya pradesh',
+    # seasons
+    'kharif': 'kharif', 'rabi': 'rabi', 'zaid': 'zaid', 'summer': 'summer', 'winter': 'winter',
+    'monsoon': 'kharif', 'खरीफ': 'kharif', 'रबी': 'rabi', 'जायद': 'zaid',
+}
+# Longest first so "sweet potato" wins over "potato"; whitespace-delimited
+# (after normalization) because \b splits Indic words at their vowel signs.
+_KEY_TERM = re.compile(
+    r'(?<!\S)(' + '|'.join(re.escape(term) for term in sorted(_KEY_TERMS, key=len, reverse=True)) + r')(?:e?s)?(?!\S)'
+)
+
+
+def key_terms(normalized: str) -> frozenset:
+    """Canonical crop, state and season words in a normalized query."""
+    return frozenset(_KEY_TERMS[term] for term in _KEY_TERM.findall(normalized))
+
+
+def normalize_query(text: str) -> str:
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    # Drop punctuation and symbols but keep combining marks (Indic vowel signs)
+    text = ''.join(' ' if unicodedata.category(ch)[0] in 'PS' else ch for ch in text)
+    return ' '.join(_SPELLINGS.get(word, word) for word in _WHITESPACE.split(text) if word)
+
+
+class _Entry:
+    __slots__ = ('entry_id', 'scope', 'query', 'shingles', 'numbers', 'terms', 'bands', 'answer', 'expires_at')
+
+    def __init__(self, entry_id, scope, query, shingles, numbers, terms, bands, answer, expires_at):
+        self.entry_id = entry_id
+        self.scope = scope
+        self.query = query
+        self.shingles = shingles
+        self.numbers = numbers
+        self.terms = terms
+        self.bands = bands
+        self.answer = answer
+        self.expires_at = expires_at
+
+
+class SimilarityCache:
+    def __init__(self):
+        self.enabled = os.environ.get('SIMILARITY_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+        self.ngram = int(os.environ.get('SIMILARITY_CACHE_NGRAM', 3))
+        self.num_perm = int(os.environ.get('SIMILARITY_CACHE_NUM_PERM', 64))
+        self.bands = int(os.environ.get('SIMILARITY_CACHE_BANDS', 16))
+        if self.num_perm % self.bands:
+            raise ValueError('SIMILARITY_CACHE_NUM_PERM must be a multiple of SIMILARITY_CACHE_BANDS')
+        self.rows = self.num_perm // self.bands
+        self.default_threshold = float(os.environ.get('SIMILARITY_CACHE_THRESHOLD', 0.85))
+        self.max_entries = int(os.environ.get('SIMILARITY_CACHE_MAX_ENTRIES', 2048))
+        self.ttl_seconds = int(os.environ.get('SIMILARITY_CACHE_TTL_SECONDS', 24 * 3600))
+
+        rng = np.random.default_rng(int(os.environ.get('SIMILARITY_CACHE_SEED', 1)))
+        # a < 2^31 and 32-bit shingle hashes keep a * x + b inside uint64
+        self._perm_a = rng.integers(1, 1 << 31, size=self.num_perm, dtype=np.uint64)
+        self._perm_b = rng.integers(0, 1 << 31, size=self.num_perm, dtype=np.uint64)
+
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()
+        self._buckets: dict[tuple, set[int]] = {}
+        self._exact: dict[tuple, int] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def threshold_for(self, language: str | None) -> float:
+        override = os.environ.get(f'SIMILARITY_CACHE_THRESHOLD_{(language or "").upper()}')
+        return float(override) if override else self.default_threshold
+
+    # ------------------------------------------------------------------
+    # Features
+    # ------------------------------------------------------------------
+    def _shingles(self, normalized: str) -> frozenset:
+        padded = f' {normalized} '
+        if len(padded) <= self.ngram:
+            return frozenset([padded])
+        return frozenset(padded[i:i + self.ngram] for i in range(len(padded) - self.ngram + 1))
+
+    def _signature(self, shingles: frozenset) -> np.ndarray:
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles))
+        # (a * x + b) mod p for every permutation x shingle, then min over shingles
+        products = (np.outer(self._perm_a, hashes) + self._perm_b[:, None]) % _MERSENNE_PRIME
+        return products.min(axis=1)
+
+    def _band_keys(self, scope: tuple, signature: np.ndarray) -> list[tuple]:
+        return [
+            (scope, band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+            for band in range(self.bands)
+        ]
+
+    # ------------------------------------------------------------------
+    # Lookup / store
+    # ------------------------------------------------------------------
+    def lookup(self, namespace: str, language: str | None, query: str) -> dict | None:
+        """Return ``{'answer', 'similarity', 'matched_query'}`` for a near-duplicate, else None."""
+        if not self.enabled:
+            return None
+        started = time.perf_counter()
+        scope = (namespace, language or 'default')
+        normalized = normalize_query(query)
+        if not normalized:
+            return None
+        now = time.time()
+
+        with self._lock:
+            exact_id = self._exact.get((scope, normalized))
+            entry = self._entries.get(exact_id) if exact_id is not None else None
+            if entry is not None and entry.expires_at > now:
+                self._entries.move_to_end(exact_id)
+                return self._hit(namespace, entry, 1.0, started)
+
+        shingles = self._shingles(normalized)
+        band_keys = self._band_keys(scope, self._signature(shingles))
+        numbers = tuple(_NUMBER.findall(normalized))
+        terms = key_terms(normalized)
+        threshold = self.threshold_for(language)
+
+        with self._lock:
+            candidate_ids = set()
+            for key in band_keys:
+                candidate_ids.update(self._buckets.get(key, ()))
+            metrics.observe(f'similarity_cache.{namespace}.candidates', len(candidate_ids))
+            best, best_score = None, 0.0
+            for entry_id in candidate_ids:
+                entry = self._entries.get(entry_id)
+                if (entry is None or entry.expires_at <= now or entry.numbers != numbers
+                        or entry.terms != terms):
+                    continue
+                score = len(shingles & entry.shingles) / len(shingles | entry.shingles)
+                if score > best_score:
+                    best, best_score = entry, score
+            if best is not None and best_score >= threshold:
+                self._entries.move_to_end(best.entry_id)
+                return self._hit(namespace, best, best_score, started)
+
+        metrics.incr(f'similarity_cache.{namespace}.misses')
+        if best is not None:
+            # Closest rejected candidate; shows how much a lower threshold would gain
+            metrics.observe(f'similarity_cache.{namespace}.rejected_similarity', best_score)
+        metrics.observe(f'similarity_cache.{namespace}.lookup_ms', (time.perf_counter() - started) * 1000)
+        return None
+
+    def _hit(self, namespace: str, entry: _Entry, similarity: float, started: float) -> dict:
+        metrics.incr(f'similarity_cache.{namespace}.hits')
+        metrics.observe(f'similarity_cache.{namespace}.hit_similarity', similarity)
+        metrics.observe(f'similarity_cache.{namespace}.lookup_ms', (time.perf_counter() - started) * 1000)
+        return {'answer': entry.answer, 'similarity': round(similarity, 4), 'matched_query': entry.query}
+
+    def store(self, namespace: str, language: str | None, query: str, answer):
+        if not self.enabled:
+            return
+        scope = (namespace, language or 'default')
+        normalized = normalize_query(query)
+        if not normalized:
+            return
+        shingles = self._shingles(normalized)
+        band_keys = self._band_keys(scope, self._signature(shingles))
+        with self._lock:
+            previous = self._exact.get((scope, normalized))
+            if previous is not None:
+                self._remove(previous)
+            entry_id = self._next_id
+            self._next_id += 1
+            entry = _Entry(entry_id, scope, normalized, shingles, tuple(_NUMBER.findall(normalized)),
+                           key_terms(normalized), band_keys, answer, time.time() + self.ttl_seconds)
+            self._entries[entry_id] = entry
+            self._exact[(scope, normalized)] = entry_id
+            for key in band_keys:
+                self._buckets.setdefault(key, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+        metrics.incr(f'similarity_cache.{namespace}.stores')
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        self._exact.pop((entry.scope, entry.query), None)
+        for key in entry.bands:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def stats(self) -> dict:
+        snapshot = metrics.snapshot('similarity_cache.')
+        namespaces = {}
+        for name, value in snapshot['counters'].items():
+            namespace, field = name[len('similarity_cache.'):].rsplit('.', 1)
+            namespaces.setdefault(namespace, {})[field] = value
+        for namespace, counters in namespaces.items():
+            lookups = counters.get('hits', 0) + counters.get('misses', 0)
+            counters['hit_rate'] = round(counters.get('hits', 0) / lookups, 4) if lookups else None
+            for summary in ('hit_similarity', 'rejected_similarity', 'candidates', 'lookup_ms'):
+                counters[summary] = snapshot['summaries'].get(f'similarity_cache.{namespace}.{summary}')
+        with self._lock:
+            entries = len(self._entries)
+        return {
+            'enabled': self.enabled,
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'default_threshold': self.default_threshold,
+            'ngram': self.ngram,
+            'num_perm': self.num_perm,
+            'bands': self.bands,
+            'namespaces': namespaces
+        }
+
+
+# Global instance
+similarity_cache = SimilarityCache()
+
+__all__ = ["similarity_cache", "SimilarityCache", "normalize_query", "key_terms"]
+
+
+def _self_check():
+    """Paraphrases of a cached question hit; the same question about another crop, state or season misses."""
+    cache = SimilarityCache()
+    cache.enabled = True
+    stored = 'What is the best fertilizer for wheat crop in Punjab during rabi season'
+    cache.store('check', None, stored, 'wheat answer')
+    hits = [
+        'What is the best fertiliser for wheat crop in Punjab during rabi season?',
+        'what is the best fertilizer for wheat crop in punjab during the rabi season',
+    ]
+    misses = [
+        'What is the best fertilizer for rice crop in Punjab during rabi season',
+        'What is the best fertilizer for maize crop in Punjab during rabi season',
+        'What is the best fertilizer for wheat crop in Haryana during rabi season',
+        'What is the best fertilizer for wheat crop in Punjab during kharif season',
+        'What is the best fertilizer for 20 wheat crop in Punjab during rabi season',
+    ]
+    for query in hits:
+        result = cache.lookup('check', None, query)
+        assert result and result['answer'] == 'wheat answer', f'expected a hit: {query!r}'
+        print(f"hit  {result['similarity']:.3f}  {query}")
+    for query in misses:
+        assert cache.lookup('check', None, query) is None, f'expected a miss: {query!r}'
+        print(f"miss        {query}")
+    assert key_terms(normalize_query('Paddy and sweet potatoes in Tamil Nadu')) == {'rice', 'sweet potato', 'tamil nadu'}
+    print('ok')
+
+
+if __name__ == '__main__':
+    _self_check()
@@ -0,0 +1,210 @@
+"""Single-flight coalescing of concurrent cache misses.
+
+When a cached price or weather entry expires, every request that arrives
+before it is refilled would fetch from the upstream API on its own. A
+``SingleFlight`` lets one caller per key run the fetch. Callers that arrive
+while it is in flight wait for its result instead (or its exception). Each
+gets a deep copy, so mutating the result is safe.
+
+Across workers (``SINGLE_FLIGHT_MONGO``, default on) the in-process leader
+also takes a short lock document in ``single_flight_locks``. If another
+worker holds it, the caller polls its ``recheck`` function (normally the
+cache lookup) until that worker has stored the value. Once the lock
+expires (``SINGLE_FLIGHT_LOCK_SECONDS``, default 15), the caller gives up
+waiting and fetches itself. Lock errors fail open.
+
+``do_in_background`` starts the same fetch in a daemon thread unless the key
+is already being fetched in this process; stale-while-revalidate caches use it
+to refresh an entry without holding up the request that found it stale.
+
+Metrics per flight name: ``single_flight.<name>.calls`` / ``.coalesced`` /
+``.cluster_waits`` / ``.cluster_hits`` / ``.background`` counters and the
+``.waiters`` summary (callers coalesced into each fetch).
+"""
+import os
+import copy
+import time
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from database import get_collection
+from metrics import metrics
+
+
+class _Flight:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    LOCK_COLLECTION = 'single_flight_locks'
+
+    def __init__(self, name: str):
+        self.name = name
+        self.lock_seconds = float(os.environ.get('SINGLE_FLIGHT_LOCK_SECONDS', 15))
+        self.poll_seconds = float(os.environ.get('SINGLE_FLIGHT_POLL_SECONDS', 0.2))
+        self._flights: dict[str, _Flight] = {}
+        self._background: set[str] = set()
+        self._lock = threading.Lock()
+        self._collection = None
+        if os.environ.get('SINGLE_FLIGHT_MONGO', 'true').lower() in ('1', 'true', 'yes'):
+            try:
+                collection = get_collection(self.LOCK_COLLECTION)
+                collection.create_index('expires_at', expireAfterSeconds=0)
+                self._collection = collection
+            except Exception as e:
+                print(f"[SingleFlight] Mongo lock disabled for '{name}': {e}")
+
+    def do(self, key: str, fn, recheck=None):
+        """Return ``fn()``, sharing one execution among concurrent callers of ``key``.
+
+        ``recheck`` (optional) returns the value if another worker has already
+        produced it, or None; it enables the cross-worker lock.
+        """
+        metrics.incr(f'single_flight.{self.name}.calls')
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                flight.waiters += 1
+        if not leader:
+            metrics.incr(f'single_flight.{self.name}.coalesced')
+            # A hung fetch must not hang its waiters for longer than the lock would
+            if not flight.done.wait(self.lock_seconds * 2):
+                return fn()
+            if flight.error is not None:
+                raise flight.error
+            return copy.deepcopy(flight.result)
+
+        try:
+            result = self._run(key, fn, recheck)
+            flight.result = copy.deepcopy(result)
+            return result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+            metrics.observe(f'single_flight.{self.name}.waiters', flight.waiters)
+
+    def do_in_background(self, key: str, fn, recheck=None) -> bool:
+        """Run ``do(key, fn, recheck)`` in a daemon thread; False if ``key`` is already in flight here."""
+        with self._lock:
+            if key in self._flights or key in self._background:
+                return False
+            self._background.add(key)
+
+        def run():
+            try:
+                self.do(key, fn, recheck)
+            except Exception as e:
+                metrics.incr(f'single_flight.{self.name}.background_errors')
+                print(f"[SingleFlight] background refresh of {self.name}:{key} failed: {e}")
+            finally:
+                with self._lock:
+                    self._background.discard(key)
+
+        metrics.incr(f'single_flight.{self.name}.background')
+        threading.Thread(target=run, daemon=True, name=f'single-flight-{self.name}').start()
+        return True
+
+    def _run(self, key, fn, recheck):
+        if self._collection is None or recheck is None:
+            return fn()
+        lock_id = f'{self.name}:{key}'
+        holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        deadline = time.monotonic() + self.lock_seconds
+        waited = False
+        while True:
+            if self._try_lock(lock_id, holder):
+                try:
+                    if waited:
+                        # The previous holder may have stored the value just before releasing
+                        cached = recheck()
+                        if cached is not None:
+                            metrics.incr(f'single_flight.{self.name}.cluster_hits')
+                            return cached
+                    return fn()
+                finally:
+                    self._unlock(lock_id, holder)
+            if not waited:
+                waited = True
+                metrics.incr(f'single_flight.{self.name}.cluster_waits')
+            time.sleep(self.poll_seconds)
+            cached = recheck()
+            if cached is not None:
+                metrics.incr(f'single_flight.{self.name}.cluster_hits')
+                return cached
+            if time.monotonic() > deadline:
+                return fn()
+
+    def _try_lock(self, lock_id: str, holder: str) -> bool:
+        now = datetime.utcnow()
+        try:
+            from pymongo.errors import DuplicateKeyError
+            try:
+                self._collection.find_one_and_update(
+                    {'_id': lock_id, 'expires_at': {'$lt': now}},
+                    {'$set': {'holder': holder, 'expires_at': now + timedelta(seconds=self.lock_seconds)}},
+                    upsert=True
+                )
+                return True
+            except DuplicateKeyError:
+                return False  # held by another worker
+        except Exception as e:
+            metrics.incr('single_flight.lock_errors')
+            print(f"[SingleFlight] lock for {lock_id} failed, fetching anyway: {e}")
+            return True
+
+    def _unlock(self, lock_id: str, holder: str):
+        try:
+            self._collection.delete_one({'_id': lock_id, 'holder': holder})
+        except Exception:
+            pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = len(self._flights)
+        prefix = f'single_flight.{self.name}'
+        return {
+            'in_flight': in_flight,
+            'background': metrics.counter(f'{prefix}.background'),
+            'mongo_lock': self._collection is not None,
+            'calls': metrics.counter(f'{prefix}.calls'),
+            'coalesced': metrics.counter(f'{prefix}.coalesced'),
+            'cluster_waits': metrics.counter(f'{prefix}.cluster_waits'),
+            'cluster_hits': metrics.counter(f'{prefix}.cluster_hits')
+        }
+
+
+_flights: dict[str, SingleFlight] = {}
+_flights_lock = threading.Lock()
+
+
+def single_flight(name: str) -> SingleFlight:
+    """The process-wide ``SingleFlight`` group called ``name``."""
+    with _flights_lock:
+        group = _flights.get(name)
+        if group is None:
+            group = _flights[name] = SingleFlight(name)
+        return group
+
+
+def single_flight_stats() -> dict:
+    with _flights_lock:
+        groups = list(_flights.values())
+    return {group.name: group.stats() for group in groups}
+
+
+__all__ = ["SingleFlight", "single_flight", "single_flight_stats"]
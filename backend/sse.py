@@ -0,0 +1,73 @@
+"""Server-sent-event helpers for streaming Gemini output to the browser.
+
+Event protocol used by every streaming endpoint:
+  - ``chunk``: ``{"text": "..."}`` incremental model output
+  - ``done``:  final payload (full text, parsed JSON for recommendations, ...)
+  - ``error``: ``{"error": "..."}``; the stream ends afterwards
+
+Clients consume these with ``fetch`` + a stream reader (``EventSource`` cannot POST).
+"""
+import json
+import time
+
+from flask import Response, stream_with_context
+
+from metrics import metrics
+
+
+def format_sse(data, event: str | None = None) -> str:
+    payload = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False, default=str)
+    lines = [f"event: {event}"] if event else []
+    lines.extend(f"data: {line}" for line in payload.split('\n'))
+    return '\n'.join(lines) + '\n\n'
+
+
+def sse_response(events) -> Response:
+    """Wrap a generator of pre-formatted SSE strings in a non-buffered streaming response."""
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # disable proxy buffering (nginx / Railway edge)
+        }
+    )
+
+
+def timed_chunks(name: str, chunks):
+    """Yield text chunks from ``chunks`` while recording time-to-first-token and total time.
+
+    Metrics: ``stream.<name>.ttft_ms``, ``stream.<name>.total_ms``, ``stream.<name>.errors``.
+    """
+    started = time.perf_counter()
+    first = True
+    try:
+        for text in chunks:
+            if not text:
+                continue
+            if first:
+                metrics.observe(f'stream.{name}.ttft_ms', (time.perf_counter() - started) * 1000)
+                first = False
+            yield text
+    except Exception:
+        metrics.incr(f'stream.{name}.errors')
+        raise
+    finally:
+        metrics.observe(f'stream.{name}.total_ms', (time.perf_counter() - started) * 1000)
+
+
+def gemini_text_chunks(response_stream):
+    """Extract text from a ``generate_content(..., stream=True)`` iterator.
+
+    Chunks without text parts (e.g. safety-only chunks) raise on ``.text``; skip them.
+    """
+    for chunk in response_stream:
+        try:
+            text = chunk.text
+        except (ValueError, AttributeError):
+            continue
+        if text:
+            yield text
+
+
+__all__ = ["format_sse", "sse_response", "timed_chunks", "gemini_text_chunks"]
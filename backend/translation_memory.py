@@ -0,0 +1,145 @@
+"""Translation memory for the multilingual chatbot.
+
+Most strings sent for translation are repeated UI phrases and agronomy advice,
+so each Gemini translation is remembered under
+``sha256(normalized source text, source language, target language)``.
+
+L1 is an in-process LRU; L2 is the ``translation_memory`` Mongo collection,
+shared by all workers and kept across restarts (translations do not expire).
+"""
+import os
+import re
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime
+
+from database import get_collection
+from metrics import metrics
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_text(text: str) -> str:
+    """NFC-normalize and collapse whitespace so trivially different copies share an entry."""
+    return _WHITESPACE.sub(' ', unicodedata.normalize('NFC', text or '')).strip()
+
+
+class TranslationMemory:
+    COLLECTION = 'translation_memory'
+
+    def __init__(self):
+        self.l1_size = int(os.environ.get('TRANSLATION_MEMORY_L1_SIZE', 4096))
+        self._l1: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+        self._collection = None
+        if os.environ.get('TRANSLATION_MEMORY_MONGO', 'true').lower() in ('1', 'true', 'yes'):
+            try:
+                collection = get_collection(self.COLLECTION)
+                collection.create_index('key', unique=True)
+                self._collection = collection
+            except Exception as e:
+                print(f"[TranslationMemory] Mongo store disabled: {e}")
+
+    @staticmethod
+    def build_key(text: str, source_lang: str, target_lang: str) -> str:
+        material = '\x1f'.join((normalize_text(text), source_lang or 'auto', target_lang))
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    # ------------------------------------------------------------------
+    # Lookup / store
+    # ------------------------------------------------------------------
+    def get(self, text: str, source_lang: str, target_lang: str) -> str | None:
+        key = self.build_key(text, source_lang, target_lang)
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: list[str]) -> dict[str, str]:
+        """Resolve keys from L1, then fetch the remaining ones from Mongo in one query."""
+        found: dict[str, str] = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                if key in self._l1:
+                    self._l1.move_to_end(key)
+                    found[key] = self._l1[key]
+                else:
+                    missing.append(key)
+        metrics.incr('translation_memory.l1_hits', len(found))
+
+        if missing and self._collection is not None:
+            try:
+                for doc in self._collection.find({'key': {'$in': missing}}, {'key': 1, 'translation': 1}):
+                    found[doc['key']] = doc['translation']
+                    self._put_l1(doc['key'], doc['translation'])
+                    metrics.incr('translation_memory.l2_hits')
+            except Exception as e:
+                metrics.incr('translation_memory.errors')
+                print(f"[TranslationMemory] lookup failed: {e}")
+
+        metrics.incr('translation_memory.misses', len(keys) - len(found))
+        return found
+
+    def set(self, text: str, translation: str, source_lang: str, target_lang: str):
+        self.set_many([(text, translation)], source_lang, target_lang)
+
+    def set_many(self, pairs: list[tuple[str, str]], source_lang: str, target_lang: str):
+        if not pairs:
+            return
+        docs = []
+        for text, translation in pairs:
+            key = self.build_key(text, source_lang, target_lang)
+            self._put_l1(key, translation)
+            docs.append((key, text, translation))
+        metrics.incr('translation_memory.stores', len(docs))
+        if self._collection is None:
+            return
+        try:
+            from pymongo import UpdateOne
+            now = datetime.utcnow()
+            self._collection.bulk_write([
+                UpdateOne({'key': key}, {'$set': {
+                    'key': key,
+                    'source_text': normalize_text(text),
+                    'translation': translation,
+                    'source_language': source_lang,
+                    'target_language': target_lang,
+                    'updated_at': now
+                }}, upsert=True)
+                for key, text, translation in docs
+            ], ordered=False)
+        except Exception as e:
+            metrics.incr('translation_memory.errors')
+            print(f"[TranslationMemory] store failed: {e}")
+
+    def _put_l1(self, key: str, translation: str):
+        with self._lock:
+            self._l1[key] = translation
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.l1_size:
+                self._l1.popitem(last=False)
+
+    def stats(self) -> dict:
+        l1_hits = metrics.counter('translation_memory.l1_hits')
+        l2_hits = metrics.counter('translation_memory.l2_hits')
+        misses = metrics.counter('translation_memory.misses')
+        lookups = l1_hits + l2_hits + misses
+        with self._lock:
+            l1_entries = len(self._l1)
+        return {
+            'l1_hits': l1_hits,
+            'l2_hits': l2_hits,
+            'misses': misses,
+            'stores': metrics.counter('translation_memory.stores'),
+            'errors': metrics.counter('translation_memory.errors'),
+            'hit_rate': round((l1_hits + l2_hits) / lookups, 4) if lookups else None,
+            'l1_entries': l1_entries,
+            'l1_capacity': self.l1_size,
+            'l2_enabled': self._collection is not None
+        }
+
+
+# Global instance
+translation_memory = TranslationMemory()
+
+__all__ = ["translation_memory", "TranslationMemory", "normalize_text"]
@@ -1,7 +1,9 @@
 import requests
 import os
-from datetime import datetime, timedelta
+from datetime import datetime
 from database import get_collection
+from single_flight import single_flight
+from metrics import metrics
 
 class WeatherService:
     def __init__(self):
@@ -9,6 +11,12 @@ class WeatherService:
         self.base_url = "https://api.openweathermap.org/data/2.5"
         self.weather_collection = get_collection('weather_cache')
         self.cache_duration_hours = 1  # Cache weather data for 1 hour
+        # Stale-while-revalidate for current weather: past the soft TTL the cached entry is
+        # still served (marked stale) while a background refresh runs, up to the hard TTL
+        self.cache_soft_ttl = int(os.environ.get('WEATHER_CACHE_SOFT_TTL_SECONDS', self.cache_duration_hours * 3600))
+        self.cache_hard_ttl = max(self.cache_soft_ttl, int(os.environ.get('WEATHER_CACHE_HARD_TTL_SECONDS', 6 * 3600)))
+        # Concurrent misses for the same coordinates share one OpenWeather call
+        self.current_flight = single_flight('weather_current')
     
     def get_coordinates_by_city(self, city_name):
         """Get latitude and longitude for a city"""
@@ -47,17 +55,41 @@ class WeatherService:
             return {'success': False, 'error': str(e)}
     
     def get_current_weather(self, lat, lon, location_name=None):
-        """Get current weather data"""
+        """Get current weather data.
+
+        Fresh cache entries are returned as they are and stale ones (past the
+        soft TTL) at once while a background refresh runs. Misses past the
+        hard TTL are fetched synchronously, coalesced per location.
+        """
         try:
             if not self.api_key:
                 return self._fallback_weather_data(location_name)
             
             # Check cache first
             cache_key = f"current_{lat}_{lon}"
-            cached_data = self._get_cached_weather(cache_key)
+
+            def fetch():
+                return self._fetch_current_weather(lat, lon, location_name, cache_key)
+
+            def recheck():
+                return self._get_cached_weather(cache_key)
+
+            cached_data = self._get_cached_weather(cache_key, allow_stale=True)
             if cached_data:
+                if cached_data['data_freshness'] == 'stale':
+                    metrics.incr('weather_cache.stale_hits')
+                    self.current_flight.do_in_background(cache_key, fetch, recheck=recheck)
+                else:
+                    metrics.incr('weather_cache.fresh_hits')
                 return cached_data
             
+            metrics.incr('weather_cache.misses')
+            return self.current_flight.do(cache_key, fetch, recheck=recheck)
+        except Exception as e:
+            return self._fallback_weather_data(location_name, str(e))
+
+    def _fetch_current_weather(self, lat, lon, location_name, cache_key):
+        try:
             url = f"{self.base_url}/weather"
             params = {
                 'lat': lat,
@@ -95,7 +127,9 @@ class WeatherService:
                         'sunrise': datetime.fromtimestamp(data['sys']['sunrise']).strftime('%H:%M'),
                         'sunset': datetime.fromtimestamp(data['sys']['sunset']).strftime('%H:%M')
                     },
-                    'timestamp': datetime.utcnow().isoformat()
+                    'timestamp': datetime.utcnow().isoformat(),
+                    'data_freshness': 'live',
+                    'cache_age_seconds': 0
                 }
                 
                 # Add farming-specific advice
@@ -334,15 +368,17 @@ class WeatherService:
         
         return daily_summary
     
-    def _get_cached_weather(self, cache_key):
-        """Get cached weather data if still valid"""
+    def _get_cached_weather(self, cache_key, allow_stale=False):
+        """Get cached weather data if within the soft TTL (the hard TTL with ``allow_stale``)"""
         try:
             cached = self.weather_collection.find_one({'cache_key': cache_key})
             if cached:
-                cache_time = cached['timestamp']
-                if datetime.utcnow() - cache_time < timedelta(hours=self.cache_duration_hours):
+                age = (datetime.utcnow() - cached['timestamp']).total_seconds()
+                if age < (self.cache_hard_ttl if allow_stale else self.cache_soft_ttl):
                     data = cached['data']
                     data['cached'] = True
+                    data['data_freshness'] = 'stale' if age >= self.cache_soft_ttl else 'cached'
+                    data['cache_age_seconds'] = round(age, 1)
                     return data
             return None
         except:
@@ -106,6 +106,7 @@ const DATA_FRESHNESS_LABELS: Record<string, string> = {
   monthly: 'Monthly',
   simulated: 'Simulated',
   cached: 'Cached',
+  stale: 'Stale (refreshing)',
   unknown: 'Unknown',
 };
 